@@ -0,0 +1,107 @@
+"""
+Achievement engine for Space Shooter Bot
+Декларативные правила достижений: проверяются только правила с изменившимися полями
+"""
+
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional
+
+from config import ACHIEVEMENTS
+
+# Поле ранга вычисляется отдельно (по индексу рейтинга), а не хранится в user_stats
+RANK_FIELD = 'rank'
+
+
+@dataclass(frozen=True)
+class AchievementRule:
+    """Правило достижения: field >= threshold (или <= при lower_is_better)"""
+    key: str
+    bit: int
+    field: str
+    threshold: int
+    lower_is_better: bool = False
+
+    @property
+    def mask(self) -> int:
+        return 1 << self.bit
+
+    def is_met(self, value) -> bool:
+        if value is None:
+            return False
+        return value <= self.threshold if self.lower_is_better else value >= self.threshold
+
+
+class AchievementEngine:
+    """Проверка достижений по изменившимся полям статистики
+
+    Правила сгруппированы по полю, от которого зависят. Для каждой игры
+    проверяются только группы, чьи поля изменились, а ранговые правила —
+    только если вырос best_score.
+    """
+
+    def __init__(self, definitions: Dict[str, Dict] = ACHIEVEMENTS):
+        self.definitions = definitions
+        self.rules = [
+            AchievementRule(
+                key=key,
+                bit=definition['bit'],
+                field=definition['field'],
+                threshold=definition['threshold'],
+                lower_is_better=definition.get('lower_is_better', False)
+            )
+            for key, definition in definitions.items()
+        ]
+
+        bits = [rule.bit for rule in self.rules]
+        if len(set(bits)) != len(bits) or not all(0 <= bit < 63 for bit in bits):
+            raise ValueError("Биты достижений должны быть уникальными и в диапазоне 0..62")
+
+        self._by_field: Dict[str, List[AchievementRule]] = {}
+        for rule in self.rules:
+            self._by_field.setdefault(rule.field, []).append(rule)
+        self._by_key = {rule.key: rule for rule in self.rules}
+        self._rank_mask = sum(rule.mask for rule in self._by_field.get(RANK_FIELD, []))
+
+    def mask_of(self, keys: Iterable[str]) -> int:
+        """Битовая маска для набора ключей достижений"""
+        return sum(self._by_key[key].mask for key in set(keys) if key in self._by_key)
+
+    def keys_of(self, mask: int) -> List[str]:
+        """Ключи достижений из битовой маски"""
+        return [rule.key for rule in self.rules if mask & rule.mask]
+
+    def evaluate(self, old_stats: Dict, new_stats: Dict, unlocked_mask: int,
+                 rank_getter: Optional[Callable[[], int]] = None) -> List[AchievementRule]:
+        """Вернуть новые достижения после изменения статистики old_stats -> new_stats"""
+        unlocked = []
+        for field, rules in self._by_field.items():
+            if field == RANK_FIELD or old_stats.get(field) == new_stats.get(field):
+                continue
+            value = new_stats.get(field)
+            for rule in rules:
+                if not unlocked_mask & rule.mask and rule.is_met(value):
+                    unlocked.append(rule)
+
+        # Ранг может улучшиться только вместе с best_score
+        rank_pending = self._rank_mask & ~unlocked_mask
+        if (rank_pending and rank_getter is not None
+                and new_stats.get('best_score', 0) > old_stats.get('best_score', 0)):
+            rank = rank_getter()
+            for rule in self._by_field[RANK_FIELD]:
+                if rank_pending & rule.mask and rule.is_met(rank):
+                    unlocked.append(rule)
+
+        return unlocked
+
+    def describe(self, rule: AchievementRule) -> Dict:
+        """Данные достижения для сообщения пользователю"""
+        definition = self.definitions[rule.key]
+        return {
+            'key': rule.key,
+            'name': definition['name'],
+            'emoji': definition['emoji'],
+            'description': definition['description']
+        }
+
+
+achievement_engine = AchievementEngine()
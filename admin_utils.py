@@ -8,8 +8,18 @@ import logging
 from datetime import datetime, timedelta
 from typing import Optional, Dict, List
 import json
-import shutil
 import os
+import tempfile
+import time
+
+from achievements import achievement_engine
+from analytics import AnalyticsUnavailable, GameAnalytics
+from backup import OnlineBackup, integrity_check, unpack
+from config import DATABASE_NAME, DB_BACKUP_COMPRESSION, DB_BACKUP_DIR, DIFFICULTY_NAMES
+from db_profile import connect
+from history_archive import RECENT_COLUMNS, GameArchive
+from level_stats import level_report
+from metrics import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -17,46 +27,54 @@ logger = logging.getLogger(__name__)
 class AdminUtils:
     """Административные утилиты для бота"""
     
-    def __init__(self, db_name: str = "space_shooter.db"):
+    def __init__(self, db_name: str = DATABASE_NAME):
         self.db_name = db_name
+        self.archive = GameArchive()
+        metrics.instrument_methods(self, 'admin')
     
-    def backup_database(self, backup_dir: str = "backups") -> Optional[str]:
-        """Создать резервную копию базы данных"""
-        try:
-            if not os.path.exists(backup_dir):
-                os.makedirs(backup_dir)
-            
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_name = f"{backup_dir}/space_shooter_backup_{timestamp}.db"
-            
-            shutil.copy2(self.db_name, backup_name)
-            logger.info(f"✅ Резервная копия создана: {backup_name}")
-            return backup_name
-        except Exception as e:
-            logger.error(f"❌ Ошибка создания резервной копии: {e}")
-            return None
+    def backup_database(self, backup_dir: str = DB_BACKUP_DIR, compression: str = DB_BACKUP_COMPRESSION) -> Optional[str]:
+        """Создать проверенную резервную копию базы данных (без остановки бота)"""
+        return OnlineBackup(self.db_name, backup_dir, compression=compression).run()
     
     def restore_database(self, backup_path: str) -> bool:
-        """Восстановить базу данных из резервной копии"""
+        """Восстановить базу данных из резервной копии (.db, .db.gz или .db.zst)
+        
+        Копия переносится через backup API в существующий файл, поэтому
+        журнал WAL не мешает. Запущенный бот держит рейтинг и счетчики в
+        памяти — после восстановления его нужно перезапустить.
+        """
+        if not os.path.exists(backup_path):
+            logger.error(f"❌ Файл резервной копии не найден: {backup_path}")
+            return False
+        
+        fd, unpacked = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
         try:
-            if not os.path.exists(backup_path):
-                logger.error(f"❌ Файл резервной копии не найден: {backup_path}")
-                return False
+            unpack(backup_path, unpacked)
+            integrity_check(unpacked)
             
             # Создаем резервную копию текущей БД перед восстановлением
             current_backup = self.backup_database()
             
-            shutil.copy2(backup_path, self.db_name)
+            source = sqlite3.connect(unpacked)
+            target = sqlite3.connect(self.db_name)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
             logger.info(f"✅ База данных восстановлена из: {backup_path}")
             logger.info(f"ℹ️ Предыдущая версия сохранена: {current_backup}")
             return True
         except Exception as e:
             logger.error(f"❌ Ошибка восстановления базы данных: {e}")
             return False
+        finally:
+            os.remove(unpacked)
     
     def get_database_stats(self) -> Dict:
         """Получить статистику базы данных"""
-        conn = sqlite3.connect(self.db_name)
+        conn = connect(self.db_name)
         cursor = conn.cursor()
         
         stats = {}
@@ -65,27 +83,35 @@ class AdminUtils:
             # Размер базы данных
             stats['db_size_mb'] = os.path.getsize(self.db_name) / (1024 * 1024)
             
-            # Количество записей в таблицах
+            # Количество записей в таблицах (одним запросом)
             tables = ['users', 'games', 'user_stats', 'achievements', 'daily_challenges']
-            for table in tables:
-                cursor.execute(f'SELECT COUNT(*) FROM {table}')
-                stats[f'{table}_count'] = cursor.fetchone()[0]
+            cursor.execute('SELECT ' + ', '.join(f'(SELECT COUNT(*) FROM {table})' for table in tables))
+            for table, count in zip(tables, cursor.fetchone()):
+                stats[f'{table}_count'] = count
+            
+            # Игры, перенесенные в архивные месяцы
+            cursor.execute('SELECT COUNT(*), COALESCE(SUM(games), 0) FROM history_archives')
+            stats['archived_months'], stats['archived_games'] = cursor.fetchone()
+            
+            # Результаты в карантине (plausibility.check)
+            cursor.execute('SELECT COUNT(*) FROM quarantined_games')
+            stats['quarantined_games'] = cursor.fetchone()[0]
             
             # Активные пользователи за последние 7 дней
             week_ago = (datetime.now() - timedelta(days=7)).isoformat()
             cursor.execute('SELECT COUNT(*) FROM users WHERE last_seen > ?', (week_ago,))
             stats['active_users_7d'] = cursor.fetchone()[0]
             
-            # Игры за последние 24 часа
-            day_ago = (datetime.now() - timedelta(days=1)).isoformat()
-            cursor.execute('SELECT COUNT(*) FROM games WHERE played_at > ?', (day_ago,))
+            # Игры за последние 24 часа (played_at — секунды эпохи)
+            now = int(time.time())
+            cursor.execute('SELECT COUNT(*) FROM games WHERE played_at > ?', (now - 86400,))
             stats['games_24h'] = cursor.fetchone()[0]
             
             # Средний счет за последние 7 дней
             cursor.execute('''
                 SELECT AVG(score) FROM games 
                 WHERE played_at > ?
-            ''', (week_ago,))
+            ''', (now - 7 * 86400,))
             result = cursor.fetchone()[0]
             stats['avg_score_7d'] = round(result, 1) if result else 0
             
@@ -98,17 +124,19 @@ class AdminUtils:
     
     def cleanup_inactive_users(self, days: int = 180) -> int:
         """Удалить неактивных пользователей без игр"""
-        conn = sqlite3.connect(self.db_name)
+        conn = connect(self.db_name)
         cursor = conn.cursor()
         
         try:
             cutoff_date = (datetime.now() - timedelta(days=days)).isoformat()
             
             # Удаляем пользователей, которые не заходили и не играли
+            # (игры старых месяцев уже в архиве, поэтому смотрим и на user_stats)
             cursor.execute('''
                 DELETE FROM users 
                 WHERE last_seen < ? 
                 AND user_id NOT IN (SELECT DISTINCT user_id FROM games)
+                AND user_id NOT IN (SELECT user_id FROM user_stats WHERE games_played > 0)
             ''', (cutoff_date,))
             
             deleted = cursor.rowcount
@@ -123,7 +151,7 @@ class AdminUtils:
     
     def export_leaderboard(self, limit: int = 100, format: str = "json") -> Optional[str]:
         """Экспортировать таблицу лидеров"""
-        conn = sqlite3.connect(self.db_name)
+        conn = connect(self.db_name)
         cursor = conn.cursor()
         
         try:
@@ -138,7 +166,7 @@ class AdminUtils:
                 FROM user_stats s
                 JOIN users u ON s.user_id = u.user_id
                 WHERE s.best_score > 0
-                ORDER BY s.best_score DESC
+                ORDER BY s.best_score DESC, s.games_played ASC
                 LIMIT ?
             ''', (limit,))
             
@@ -182,7 +210,7 @@ class AdminUtils:
     
     def reset_daily_challenges(self):
         """Сбросить все ежедневные задания"""
-        conn = sqlite3.connect(self.db_name)
+        conn = connect(self.db_name)
         cursor = conn.cursor()
         
         try:
@@ -199,7 +227,7 @@ class AdminUtils:
     
     def grant_achievement(self, user_id: int, achievement_key: str) -> bool:
         """Вручную выдать достижение пользователю"""
-        conn = sqlite3.connect(self.db_name)
+        conn = connect(self.db_name)
         cursor = conn.cursor()
         
         try:
@@ -207,9 +235,15 @@ class AdminUtils:
                 INSERT OR IGNORE INTO achievements (user_id, achievement_key)
                 VALUES (?, ?)
             ''', (user_id, achievement_key))
+            success = cursor.rowcount > 0
+            
+            # Держим битовую маску в user_stats в согласии с таблицей
+            cursor.execute('''
+                UPDATE user_stats SET achievement_mask = achievement_mask | ?
+                WHERE user_id = ?
+            ''', (achievement_engine.mask_of([achievement_key]), user_id))
             
             conn.commit()
-            success = cursor.rowcount > 0
             
             if success:
                 logger.info(f"✅ Достижение {achievement_key} выдано пользователю {user_id}")
@@ -225,7 +259,7 @@ class AdminUtils:
     
     def get_user_report(self, user_id: int) -> Optional[Dict]:
         """Получить подробный отчет по пользователю"""
-        conn = sqlite3.connect(self.db_name)
+        conn = connect(self.db_name)
         cursor = conn.cursor()
         
         try:
@@ -242,21 +276,25 @@ class AdminUtils:
             
             # Достижения
             cursor.execute('''
-                SELECT achievement_key, unlocked_at 
+                SELECT achievement_key, datetime(unlocked_at, 'unixepoch') 
                 FROM achievements 
                 WHERE user_id = ?
             ''', (user_id,))
             achievements = cursor.fetchall()
             
-            # Последние игры
-            cursor.execute('''
-                SELECT score, level, difficulty, played_at 
+            # Последние игры: сначала основная БД, затем архивные месяцы
+            cursor.execute(f'''
+                SELECT {RECENT_COLUMNS}
                 FROM games 
                 WHERE user_id = ? 
                 ORDER BY played_at DESC 
                 LIMIT 10
             ''', (user_id,))
             recent_games = cursor.fetchall()
+            if len(recent_games) < 10:
+                recent_games += self.archive.recent_games(
+                    user_id, 10 - len(recent_games), [game[0] for game in recent_games]
+                )
             
             report = {
                 'user': {
@@ -278,13 +316,15 @@ class AdminUtils:
                 ],
                 'recent_games': [
                     {
-                        'score': game[0],
-                        'level': game[1],
-                        'difficulty': game[2],
-                        'played_at': game[3]
+                        'score': game[1],
+                        'level': game[2],
+                        'difficulty': DIFFICULTY_NAMES.get(game[3]),
+                        'played_at': game[7]
                     }
                     for game in recent_games
-                ]
+                ],
+                # Итоги по архивным месяцам (из свертки по дням)
+                'history': self.archive.monthly_totals(user_id)
             }
             
             return report
@@ -294,9 +334,34 @@ class AdminUtils:
         finally:
             conn.close()
     
+    def get_analytics_report(self) -> Dict:
+        """Распределения счета, перцентили, DAU/WAU/MAU и удержание (см. analytics.py)"""
+        try:
+            analytics = GameAnalytics(self.db_name, archive=self.archive)
+            analytics.refresh()
+            return analytics.report()
+        except AnalyticsUnavailable as e:
+            logger.error(f"❌ {e}")
+            return {}
+        except Exception as e:
+            logger.error(f"❌ Ошибка построения аналитики: {e}")
+            return {}
+    
+    def get_level_timing(self, difficulty: str = None) -> List[Dict]:
+        """Время прохождения уровней по сложностям (среднее и разброс)"""
+        conn = connect(self.db_name)
+        
+        try:
+            return level_report(conn, difficulty)
+        except Exception as e:
+            logger.error(f"❌ Ошибка получения времени уровней: {e}")
+            return []
+        finally:
+            conn.close()
+    
     def optimize_database(self):
         """Оптимизировать базу данных"""
-        conn = sqlite3.connect(self.db_name)
+        conn = connect(self.db_name)
         cursor = conn.cursor()
         
         try:
@@ -331,6 +396,8 @@ def main():
         print("4. Очистить старые данные")
         print("5. Оптимизировать базу данных")
         print("6. Отчет по пользователю")
+        print("7. Время прохождения уровней")
+        print("8. Аналитика игр")
         print("0. Выход")
         
         choice = input("\nВыберите операцию: ")
@@ -369,6 +436,19 @@ def main():
             else:
                 print("❌ Пользователь не найден")
         
+        elif choice == "7":
+            difficulty = input("Сложность (пусто — все): ").strip() or None
+            for row in admin.get_level_timing(difficulty):
+                print(
+                    f"  {row['difficulty']:<10} ур. {row['level']:>3}: {row['games']:>7} игр, "
+                    f"{row['avg_seconds']:>6.1f} ± {row['stddev_seconds']:.1f} с"
+                )
+        
+        elif choice == "8":
+            report = admin.get_analytics_report()
+            if report:
+                print(json.dumps(report, indent=2, ensure_ascii=False))
+        
         elif choice == "0":
             print("👋 До свидания!")
             break
@@ -0,0 +1,312 @@
+"""
+Game analytics for Space Shooter Bot
+Аналитика по истории игр на NumPy: распределения счета, перцентили, DAU/WAU/MAU, удержание D1/D7
+
+Колонки games хранятся на диске в ANALYTICS_CACHE_DIR как .npy и
+открываются через memmap. При обновлении читаются только игры с id выше
+сохраненной отметки (high-water mark): запрос идет по первичному ключу,
+строки забираются fetchmany в заранее выделенный буфер и дописываются в
+конец колонок. Первое построение читает и архивные месяцы истории (см.
+history_archive), иначе первая игра старого игрока и удержание считались бы
+по неполным данным. Отметка и число строк записываются в meta.json после
+записи колонок, поэтому прерванное обновление просто повторяется.
+
+Все отчеты считаются векторно по колонкам целиком, без запросов к БД.
+Пакет numpy необязателен: без него бот работает, недоступны только отчеты.
+
+Запуск: python analytics.py --db space_shooter.db
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Dict, Iterator, Optional
+
+from config import (
+    ANALYTICS_CACHE_DIR, ANALYTICS_CHUNK_ROWS, ANALYTICS_SCORE_BINS, DATABASE_NAME,
+    DIFFICULTY_CODES
+)
+from history_archive import GameArchive
+
+try:
+    import numpy as np
+except ImportError:  # аналитика необязательна
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Колонка -> тип (little-endian, одинаковый на всех машинах)
+COLUMNS = (
+    ('id', '<i8'),
+    ('user_id', '<i8'),
+    ('score', '<i8'),
+    ('level', '<i2'),
+    ('difficulty', '<i1'),
+    ('duration_seconds', '<i4'),
+    ('enemies_killed', '<i4'),
+    ('accuracy_percent', '<f4'),
+    ('played_at', '<i8'),
+)
+
+SELECT_COLUMNS = '''
+    SELECT id, COALESCE(user_id, 0), COALESCE(score, 0), COALESCE(level, 0),
+           COALESCE(difficulty, 0), COALESCE(duration_seconds, 0), COALESCE(enemies_killed, 0),
+           COALESCE(accuracy_percent, 0), COALESCE(played_at, 0)
+    FROM games
+'''
+
+# Ключ пары (игрок, день): user_id * DAY_KEY + день (дней с 1970-01-01 меньше 100000)
+DAY_KEY = 100_000
+
+PERCENTILES = (50, 90, 99)
+
+
+class AnalyticsUnavailable(Exception):
+    """Не установлен numpy"""
+    pass
+
+
+class ColumnStore:
+    """Колонки игр в файлах .npy с запасом емкости"""
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self.meta_path = os.path.join(cache_dir, 'meta.json')
+        self.meta = {'high_water': 0, 'rows': 0}
+        self.arrays: Dict[str, 'np.ndarray'] = {}
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.meta = json.load(f)
+            if self.meta['rows']:
+                self.arrays = {
+                    name: np.load(self._path(name), mmap_mode='r+') for name, _ in COLUMNS
+                }
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, f"games_{name}.npy")
+
+    @property
+    def rows(self) -> int:
+        return self.meta['rows']
+
+    @property
+    def capacity(self) -> int:
+        return len(self.arrays['id']) if self.arrays else 0
+
+    def columns(self) -> Dict[str, 'np.ndarray']:
+        """Заполненная часть колонок"""
+        if not self.arrays:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS}
+        return {name: array[:self.rows] for name, array in self.arrays.items()}
+
+    def reset(self):
+        """Забыть все строки (файлы перезаписываются при следующем росте)"""
+        if os.path.exists(self.meta_path):
+            os.remove(self.meta_path)
+        self.arrays = {}
+        self.meta = {'high_water': 0, 'rows': 0}
+
+    def _grow(self, needed: int):
+        """Увеличить емкость колонок вдвое (или до needed), копируя заполненную часть"""
+        capacity = max(self.capacity * 2, needed, ANALYTICS_CHUNK_ROWS)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        arrays = {}
+        for name, dtype in COLUMNS:
+            tmp = self._path(name) + '.tmp'
+            grown = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype, shape=(capacity,))
+            if name in self.arrays:
+                grown[:self.rows] = self.arrays[name][:self.rows]
+            grown.flush()
+            del grown
+            os.replace(tmp, self._path(name))
+            arrays[name] = np.load(self._path(name), mmap_mode='r+')
+        self.arrays = arrays
+
+    def append(self, buffer: 'np.ndarray', count: int):
+        """Дописать первые count строк буфера"""
+        if self.rows + count > self.capacity:
+            self._grow(self.rows + count)
+        start = self.rows
+        for name, _ in COLUMNS:
+            self.arrays[name][start:start + count] = buffer[name][:count]
+        self.meta['rows'] = start + count
+
+    def commit(self, high_water: int):
+        """Сбросить колонки на диск и атомарно записать отметку"""
+        for array in self.arrays.values():
+            array.flush()
+        self.meta['high_water'] = high_water
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = self.meta_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self.meta_path)
+
+
+class GameAnalytics:
+    """Отчеты по всем играм (основная БД и архивные месяцы)"""
+
+    def __init__(self, db_name: str = DATABASE_NAME, cache_dir: str = ANALYTICS_CACHE_DIR,
+                 chunk_rows: int = ANALYTICS_CHUNK_ROWS, archive: GameArchive = None):
+        if np is None:
+            raise AnalyticsUnavailable("Для аналитики нужен пакет numpy")
+        self.db_name = db_name
+        self.chunk_rows = chunk_rows
+        self.archive = archive or GameArchive()
+        self.store = ColumnStore(cache_dir)
+        self.row_dtype = np.dtype(list(COLUMNS))
+
+    # ===== ОБНОВЛЕНИЕ =====
+
+    def _stream(self, conn: sqlite3.Connection, sql: str, params=()) -> Iterator[int]:
+        """Перелить результат запроса в колонки; возвращает id последних строк пачек"""
+        buffer = np.empty(self.chunk_rows, dtype=self.row_dtype)
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(self.chunk_rows)
+            if not rows:
+                break
+            # Присваивание списка кортежей в готовый буфер: без промежуточных массивов
+            buffer[:len(rows)] = rows
+            self.store.append(buffer, len(rows))
+            yield rows[-1][0]
+
+    def refresh(self) -> int:
+        """Дочитать новые игры. Возвращает число добавленных строк"""
+        started = time.perf_counter()
+        before = self.store.rows
+        conn = sqlite3.connect(f"file:{self.db_name}?mode=ro", uri=True)
+        try:
+            max_id = conn.execute('SELECT MAX(id) FROM games').fetchone()[0] or 0
+            high_water = self.store.meta['high_water']
+            if max_id < high_water:
+                # БД восстановлена из копии или пересоздана: строим заново
+                logger.warning("⚠️ Отметка аналитики впереди БД, колонки строятся заново")
+                self.store.reset()
+                high_water = before = 0
+
+            if self.store.rows == 0:
+                for month in sorted(self.archive.months()):
+                    archive_conn = sqlite3.connect(f"file:{self.archive.path_for(month)}?mode=ro", uri=True)
+                    try:
+                        for _ in self._stream(archive_conn, SELECT_COLUMNS + ' ORDER BY id'):
+                            pass
+                    finally:
+                        archive_conn.close()
+
+            for last_id in self._stream(conn, SELECT_COLUMNS + ' WHERE id > ? ORDER BY id', (high_water,)):
+                high_water = last_id
+        finally:
+            conn.close()
+
+        self.store.commit(high_water)
+        added = self.store.rows - before
+        logger.info(
+            f"✅ Аналитика обновлена: +{added} игр (всего {self.store.rows}) "
+            f"за {time.perf_counter() - started:.2f} с"
+        )
+        return added
+
+    # ===== ОТЧЕТЫ =====
+
+    def report(self, now: float = None) -> Dict:
+        """Все отчеты по текущим колонкам"""
+        now = int(now if now is not None else time.time())
+        columns = self.store.columns()
+        return {
+            'games': int(self.store.rows),
+            'activity': activity(columns, now),
+            'retention': retention(columns, now),
+            'score_percentiles': percentiles_by_difficulty(columns, 'score'),
+            'accuracy_percentiles': percentiles_by_difficulty(columns, 'accuracy_percent'),
+            'score_histogram': score_histogram(columns),
+        }
+
+
+def activity(columns: Dict, now: int) -> Dict[str, int]:
+    """Уникальные игроки за сутки, неделю и 30 дней"""
+    played_at = columns['played_at']
+    user_id = columns['user_id']
+    return {
+        name: int(np.unique(user_id[played_at >= now - days * 86400]).size)
+        for name, days in (('dau', 1), ('wau', 7), ('mau', 30))
+    }
+
+
+def retention(columns: Dict, now: int) -> Dict[str, Optional[float]]:
+    """Доля игроков, вернувшихся на 1-й и 7-й день после первой игры (дни по UTC)"""
+    pairs = np.unique(columns['user_id'] * DAY_KEY + columns['played_at'] // 86400)
+    result: Dict[str, Optional[float]] = {}
+    if not pairs.size:
+        return {'d1': None, 'd7': None, 'd1_cohort': 0, 'd7_cohort': 0}
+
+    users = pairs // DAY_KEY
+    days = pairs % DAY_KEY
+    # pairs отсортированы по (игрок, день): первая пара игрока — день первой игры
+    _, first = np.unique(users, return_index=True)
+    first_users, first_days = users[first], days[first]
+    today = now // 86400
+
+    for offset in (1, 7):
+        # Только когорты, для которых день offset уже закончился
+        eligible = first_days + offset < today
+        target = first_users[eligible] * DAY_KEY + first_days[eligible] + offset
+        position = np.minimum(np.searchsorted(pairs, target), pairs.size - 1)
+        returned = int(np.count_nonzero(pairs[position] == target))
+        cohort = int(np.count_nonzero(eligible))
+        result[f'd{offset}'] = round(returned / cohort, 4) if cohort else None
+        result[f'd{offset}_cohort'] = cohort
+    return result
+
+
+def percentiles_by_difficulty(columns: Dict, column: str) -> Dict[str, Dict[str, float]]:
+    """p50/p90/p99 колонки по сложностям"""
+    values = columns[column]
+    difficulty = columns['difficulty']
+    result = {}
+    for name, code in DIFFICULTY_CODES.items():
+        selected = values[difficulty == code]
+        if selected.size:
+            result[name] = {
+                f'p{pct}': round(float(value), 1)
+                for pct, value in zip(PERCENTILES, np.percentile(selected, PERCENTILES))
+            }
+    return result
+
+
+def score_histogram(columns: Dict, bins: int = ANALYTICS_SCORE_BINS) -> Dict:
+    """Гистограмма счета по сложностям с общими границами корзин"""
+    score = columns['score']
+    if not score.size:
+        return {'edges': [], 'counts': {}}
+    edges = np.linspace(0, max(int(score.max()), 1), bins + 1)
+    difficulty = columns['difficulty']
+    return {
+        'edges': [int(edge) for edge in edges],
+        'counts': {
+            name: np.histogram(score[difficulty == code], bins=edges)[0].tolist()
+            for name, code in DIFFICULTY_CODES.items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--db', default=DATABASE_NAME)
+    parser.add_argument('--cache-dir', default=ANALYTICS_CACHE_DIR)
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    analytics = GameAnalytics(args.db, args.cache_dir)
+    analytics.refresh()
+    started = time.perf_counter()
+    report = analytics.report()
+    logger.info(f"✅ Отчет посчитан за {(time.perf_counter() - started) * 1000:.0f} мс")
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Async database facade for Space Shooter Bot
+Асинхронный доступ к БД: запросы выполняются в пуле потоков, а не в цикле событий
+"""
+
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from config import DB_POOL_SIZE
+from database import Database, db
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDatabase:
+    """Асинхронный фасад над Database
+
+    Каждый публичный метод Database доступен как корутина с той же сигнатурой.
+    Вызовы выполняются в ограниченном пуле потоков; у каждого потока свое
+    соединение из Database.get_connection (threading.local).
+    """
+
+    def __init__(self, database: Database, max_workers: int = DB_POOL_SIZE):
+        self.database = database
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="db"
+        )
+        logger.info(f"✅ Пул потоков БД создан: {max_workers} потоков")
+
+    async def run(self, func, *args, **kwargs):
+        """Выполнить произвольную функцию в пуле потоков БД"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.database, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        # Кэшируем обертку, чтобы не создавать её при каждом вызове
+        setattr(self, name, method)
+        return method
+
+    def shutdown(self, wait: bool = True):
+        """Остановить пул потоков"""
+        self._executor.shutdown(wait=wait)
+        logger.info("✅ Пул потоков БД остановлен")
+
+
+# Создание асинхронного фасада для общего экземпляра базы данных
+adb = AsyncDatabase(db)
@@ -0,0 +1,262 @@
+"""
+Online database backups for Space Shooter Bot
+Резервное копирование БД на ходу: sqlite3 backup API по страницам, сжатие, ротация и проверка
+
+Копия снимается через Connection.backup порциями по DB_BACKUP_PAGES_PER_STEP
+страниц с паузой DB_BACKUP_STEP_SLEEP_MS между порциями, поэтому бот
+продолжает писать в базу во время копирования. Если запись в базу слишком
+часто перезапускает копирование, копия снимается за один проход.
+Готовая копия проверяется (PRAGMA integrity_check), сжимается потоково,
+проверяется повторно после сжатия и только тогда появляется в каталоге под
+своим именем; старые копии сверх DB_BACKUP_KEEP удаляются.
+"""
+
+import glob
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config import (
+    DATABASE_NAME, DB_BACKUP_COMPRESSION, DB_BACKUP_DIR, DB_BACKUP_KEEP,
+    DB_BACKUP_MAX_RESTARTS, DB_BACKUP_PAGES_PER_STEP, DB_BACKUP_STEP_SLEEP_MS
+)
+
+try:
+    import zstandard
+except ImportError:  # сжатие zstd необязательно
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+BACKUP_PREFIX = "space_shooter_backup_"
+
+# Расширение файла для каждого вида сжатия
+EXTENSIONS = {'none': '.db', 'gzip': '.db.gz', 'zstd': '.db.zst'}
+
+# Размер блока при потоковом сжатии и проверке
+COPY_CHUNK = 1024 * 1024
+
+
+class BackupError(Exception):
+    """Ошибка создания или проверки резервной копии"""
+    pass
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def compression_of(path: str) -> str:
+    """Вид сжатия по имени файла копии"""
+    for compression, extension in EXTENSIONS.items():
+        if compression != 'none' and path.endswith(extension):
+            return compression
+    return 'none'
+
+
+def open_backup(path: str, mode: str = 'rb', compression: str = None):
+    """Открыть файл копии с распаковкой на лету (сжатие по умолчанию — по имени)"""
+    compression = compression or compression_of(path)
+    if compression == 'gzip':
+        return gzip.open(path, mode)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise BackupError("Для копий .zst нужен пакет zstandard")
+        return zstandard.open(path, mode)
+    return open(path, mode)
+
+
+def integrity_check(db_path: str) -> None:
+    """PRAGMA integrity_check несжатого файла БД"""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        result = [row[0] for row in conn.execute('PRAGMA integrity_check').fetchall()]
+    finally:
+        conn.close()
+    if result != ['ok']:
+        raise BackupError(f"integrity_check: {'; '.join(result[:5])}")
+
+
+def unpack(path: str, target: str) -> None:
+    """Распаковать копию в target (несжатая копия просто копируется)"""
+    with open_backup(path) as source, open(target, 'wb') as out:
+        shutil.copyfileobj(source, out, COPY_CHUNK)
+
+
+class OnlineBackup:
+    """Резервные копии работающей БД"""
+
+    def __init__(self, db_name: str = DATABASE_NAME, backup_dir: str = DB_BACKUP_DIR,
+                 compression: str = DB_BACKUP_COMPRESSION, keep: int = DB_BACKUP_KEEP,
+                 pages_per_step: int = DB_BACKUP_PAGES_PER_STEP,
+                 step_sleep_ms: float = DB_BACKUP_STEP_SLEEP_MS,
+                 max_restarts: int = DB_BACKUP_MAX_RESTARTS):
+        if compression not in EXTENSIONS:
+            raise ValueError(f"Неизвестное сжатие копий: {compression}. Доступны: {', '.join(EXTENSIONS)}")
+        if compression == 'zstd' and zstandard is None:
+            logger.warning("⚠️ Пакет zstandard не установлен, копии сжимаются gzip")
+            compression = 'gzip'
+        self.db_name = db_name
+        self.backup_dir = backup_dir
+        self.compression = compression
+        self.keep = keep
+        self.pages_per_step = pages_per_step
+        self.step_sleep = step_sleep_ms / 1000
+        self.max_restarts = max_restarts
+        self.last_result: Optional[Dict] = None
+
+    # ===== СОЗДАНИЕ =====
+
+    def run(self) -> Optional[str]:
+        """Снять, проверить, сжать копию и удалить старые. Возвращает путь или None"""
+        try:
+            return self.create()
+        except Exception as e:
+            logger.error(f"❌ Ошибка создания резервной копии: {e}")
+            return None
+
+    def create(self) -> str:
+        """То же, что run, но с исключением при ошибке"""
+        started = time.perf_counter()
+        os.makedirs(self.backup_dir, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(self.backup_dir, f"{BACKUP_PREFIX}{timestamp}{EXTENSIONS[self.compression]}")
+
+        # Временные файлы в том же каталоге: os.replace остается атомарным
+        fd, snapshot = tempfile.mkstemp(prefix='.snapshot-', suffix='.db', dir=self.backup_dir)
+        os.close(fd)
+        partial = f"{path}.partial"
+        try:
+            steps, restarts = self._snapshot(snapshot)
+            integrity_check(snapshot)
+            size = os.path.getsize(snapshot)
+
+            if self.compression == 'none':
+                os.replace(snapshot, path)
+            else:
+                self._compress(snapshot, partial)
+                self._verify_archive(partial, size)
+                os.replace(partial, path)
+        finally:
+            for leftover in (snapshot, partial):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+
+        removed = self.prune()
+        self.last_result = {
+            'path': path,
+            'db_bytes': size,
+            'backup_bytes': os.path.getsize(path),
+            'steps': steps,
+            'restarts': restarts,
+            'seconds': time.perf_counter() - started,
+            'pruned': len(removed),
+        }
+        logger.info(
+            f"✅ Резервная копия создана: {path} ({size / 1024 / 1024:.1f} МБ -> "
+            f"{self.last_result['backup_bytes'] / 1024 / 1024:.1f} МБ, {steps} шагов, "
+            f"перезапусков {restarts}, {self.last_result['seconds']:.1f} с)"
+        )
+        return path
+
+    def _snapshot(self, target: str):
+        """Скопировать БД в target через backup API, вернуть (шагов, перезапусков)"""
+        progress = {'steps': 0, 'restarts': 0, 'remaining': None}
+
+        def on_step(status, remaining, total):
+            progress['steps'] += 1
+            # Запись в базу через другое соединение начинает копирование заново
+            if progress['remaining'] is not None and remaining > progress['remaining']:
+                progress['restarts'] += 1
+                if progress['restarts'] > self.max_restarts:
+                    raise _TooManyRestarts()
+            progress['remaining'] = remaining
+            if remaining:
+                # Пауза между порциями: писатели успевают взять блокировку
+                time.sleep(self.step_sleep)
+
+        source = sqlite3.connect(self.db_name)
+        destination = sqlite3.connect(target)
+        try:
+            try:
+                source.backup(destination, pages=self.pages_per_step, progress=on_step)
+            except _TooManyRestarts:
+                logger.warning(
+                    f"⚠️ Копирование перезапускалось {progress['restarts']} раз, "
+                    f"копия снимается за один проход"
+                )
+                source.backup(destination, pages=-1)
+                progress['steps'] += 1
+            # Снимок хранится одним файлом, без -wal рядом
+            destination.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            destination.close()
+            source.close()
+        return progress['steps'], progress['restarts']
+
+    def _compress(self, snapshot: str, target: str):
+        """Потоковое сжатие снимка"""
+        with open(snapshot, 'rb') as source:
+            if self.compression == 'gzip':
+                with gzip.open(target, 'wb', compresslevel=6) as out:
+                    shutil.copyfileobj(source, out, COPY_CHUNK)
+            else:
+                with zstandard.open(target, 'wb') as out:
+                    shutil.copyfileobj(source, out, COPY_CHUNK)
+
+    def _verify_archive(self, path: str, expected_size: int):
+        """Прочитать архив целиком: контрольная сумма формата и исходный размер"""
+        size = 0
+        with open_backup(path, compression=self.compression) as source:
+            while True:
+                chunk = source.read(COPY_CHUNK)
+                if not chunk:
+                    break
+                size += len(chunk)
+        if size != expected_size:
+            raise BackupError(f"размер после распаковки {size} вместо {expected_size}")
+
+    # ===== РОТАЦИЯ И ПРОВЕРКА =====
+
+    def list_backups(self) -> List[str]:
+        """Копии в каталоге, от новых к старым"""
+        paths = []
+        for extension in EXTENSIONS.values():
+            paths += glob.glob(os.path.join(self.backup_dir, f"{BACKUP_PREFIX}*{extension}"))
+        # Временная метка в имени сортируется как строка
+        return sorted(set(paths), key=os.path.basename, reverse=True)
+
+    def prune(self) -> List[str]:
+        """Удалить копии сверх self.keep самых новых"""
+        if self.keep <= 0:
+            return []
+        removed = []
+        for path in self.list_backups()[self.keep:]:
+            try:
+                os.remove(path)
+                removed.append(path)
+            except OSError as e:
+                logger.error(f"❌ Не удалось удалить старую копию {path}: {e}")
+        if removed:
+            logger.info(f"🗑 Удалено старых копий: {len(removed)}")
+        return removed
+
+    def verify(self, path: str) -> bool:
+        """Распаковать копию во временный файл и проверить integrity_check"""
+        fd, target = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        try:
+            unpack(path, target)
+            integrity_check(target)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Копия {path} повреждена: {e}")
+            return False
+        finally:
+            os.remove(target)
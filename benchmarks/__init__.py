@@ -0,0 +1,4 @@
+"""
+Benchmarks for Space Shooter Bot
+Нагрузочные замеры бота и базы данных (запуск: python -m benchmarks.<имя>)
+"""
@@ -0,0 +1,127 @@
+"""
+Handler latency benchmark: synchronous Database vs AsyncDatabase
+Сравнение задержки обработчиков при блокирующих и асинхронных запросах к БД
+
+Запуск: python -m benchmarks.async_db_latency --users 2000 --requests 2000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+from typing import Dict, List
+
+from async_database import AsyncDatabase
+from benchmarks.stats import report
+from config import DB_POOL_SIZE
+from database import Database
+
+
+def seed(database: Database, users: int, games_per_user: int = 3):
+    """Наполнить БД игроками и играми"""
+    for user_id in range(1, users + 1):
+        database.add_user(user_id, first_name=f"Player{user_id}")
+    games = [
+        {
+            'user_id': random.randint(1, users),
+            'score': random.randint(0, 5000),
+            'level': random.randint(1, 15),
+            'difficulty': random.choice(['easy', 'normal', 'hard', 'nightmare']),
+            'duration_seconds': random.randint(30, 600),
+            'enemies_killed': random.randint(0, 200),
+            'accuracy_percent': random.uniform(10, 90)
+        }
+        for _ in range(users * games_per_user)
+    ]
+    for i in range(0, len(games), 500):
+        database.save_games(games[i:i + 500])
+
+
+def random_game(users: int) -> Dict:
+    return {
+        'user_id': random.randint(1, users),
+        'score': random.randint(0, 5000),
+        'level': random.randint(1, 15),
+        'difficulty': random.choice(['easy', 'normal', 'hard', 'nightmare']),
+        'duration_seconds': random.randint(30, 600),
+        'enemies_killed': random.randint(0, 200),
+        'accuracy_percent': random.uniform(10, 90)
+    }
+
+
+async def menu_sync(database: Database, user_id: int):
+    database.add_user(user_id, first_name=f"Player{user_id}")
+    database.get_user_stats(user_id, use_cache=False)
+    database.get_user_rank(user_id)
+    database.get_daily_challenges(user_id)
+
+
+async def menu_async(database: AsyncDatabase, user_id: int):
+    await database.add_user(user_id, first_name=f"Player{user_id}")
+    await database.get_user_stats(user_id, use_cache=False)
+    await database.get_user_rank(user_id)
+    await database.get_daily_challenges(user_id)
+
+
+async def run_load(database, is_async: bool, users: int, requests: int, rate: float) -> Dict[str, List[float]]:
+    """Запустить поток запросов с пуассоновскими интервалами и замерить задержки"""
+    loop = asyncio.get_running_loop()
+    latencies: Dict[str, List[float]] = {'menu': [], 'game': [], 'leaderboard': [], 'help': []}
+    start = loop.time()
+
+    async def one(kind: str, arrival: float):
+        await asyncio.sleep(max(0.0, arrival - loop.time()))
+        user_id = random.randint(1, users)
+        if kind == 'menu':
+            await (menu_async(database, user_id) if is_async else menu_sync(database, user_id))
+        elif kind == 'help':
+            # Обработчик без БД: показывает, насколько занят цикл событий
+            await asyncio.sleep(0)
+        elif kind == 'game':
+            game = random_game(users)
+            if is_async:
+                await database.save_game(**game)
+            else:
+                database.save_game(**game)
+        else:
+            if is_async:
+                await database.get_global_stats()
+            else:
+                database.get_global_stats()
+        # Задержка считается от планового времени прихода запроса
+        latencies[kind].append((loop.time() - arrival) * 1000)
+
+    tasks = []
+    arrival = start
+    for _ in range(requests):
+        arrival += random.expovariate(rate)
+        kind = random.choices(['menu', 'game', 'leaderboard', 'help'], weights=[60, 20, 10, 10])[0]
+        tasks.append(asyncio.create_task(one(kind, arrival)))
+    await asyncio.gather(*tasks)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--rate', type=float, default=500.0, help='запросов в секунду')
+    parser.add_argument('--workers', type=int, default=DB_POOL_SIZE)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = Database(os.path.join(tmp, 'bench.db'))
+        seed(database, args.users)
+
+        latencies = asyncio.run(run_load(database, False, args.users, args.requests, args.rate))
+        report("Синхронный Database (блокирует цикл событий)", latencies)
+
+        async_db = AsyncDatabase(database, max_workers=args.workers)
+        latencies = asyncio.run(run_load(async_db, True, args.users, args.requests, args.rate))
+        report(f"AsyncDatabase ({args.workers} потоков)", latencies)
+        async_db.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""
+End-to-end bot benchmark: replay synthetic updates against the real handlers
+Реплей обновлений (/start, кнопки, WEB_APP_DATA) через обработчики bot.py на временной БД
+
+Бот не ходит в сеть (benchmarks.stub_bot), обновления обрабатываются тем же
+PerUserUpdateProcessor, что и в продакшене. База наращивается по шагам
+--scales, и на каждом шаге печатаются:
+  - пропускная способность (обновлений/с) и p50/p95/p99 по обработчикам;
+  - задержки горячих запросов к БД: ранг игрока, глобальная статистика,
+    проверка достижений.
+
+Запуск: python -m benchmarks.bot_replay --scales 1000,10000,100000 --updates 5000
+"""
+
+import argparse
+import asyncio
+import importlib
+import logging
+import os
+import random
+import tempfile
+import time
+from typing import Dict, List
+
+from benchmarks.stats import report
+from benchmarks.stub_bot import make_stub_bot
+from benchmarks.updates import random_update
+
+
+def handler_name(data: Dict) -> str:
+    """Имя обработчика, который получит обновление"""
+    if 'callback_query' in data:
+        return f"cb:{data['callback_query']['data']}"
+    message = data['message']
+    if 'web_app_data' in message:
+        return 'web_app_data'
+    return message['text'].split()[0]
+
+
+def probe_queries(database, engine, users: int, samples: int, rng: random.Random) -> Dict[str, List[float]]:
+    """Задержки запросов, которые деградируют с ростом базы"""
+    latencies: Dict[str, List[float]] = {'get_user_rank': [], 'get_global_stats': [], 'achievements': []}
+    for _ in range(samples):
+        user_id = rng.randint(1, users)
+
+        started = time.perf_counter()
+        database.get_user_rank(user_id)
+        latencies['get_user_rank'].append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        database.get_global_stats()
+        latencies['get_global_stats'].append((time.perf_counter() - started) * 1000)
+
+        old = database.get_user_stats(user_id, use_cache=False)
+        new = dict(old, best_score=old['best_score'] + 1000, games_played=old['games_played'] + 1,
+                   total_score=old['total_score'] + 1000)
+        started = time.perf_counter()
+        engine.evaluate(
+            old, new, old.get('achievement_mask', 0),
+            rank_getter=lambda: database.rank_index.rank_for(user_id, new['best_score'], new['games_played'])
+        )
+        latencies['achievements'].append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+async def replay(application, updates: List[Dict]):
+    """Прогнать обновления через обработчик обновлений приложения"""
+    from telegram import Update
+
+    latencies: Dict[str, List[float]] = {}
+
+    async def timed(data: Dict, update: Update):
+        started = time.perf_counter()
+        await application.process_update(update)
+        latencies.setdefault(handler_name(data), []).append((time.perf_counter() - started) * 1000)
+
+    parsed = [(data, Update.de_json(data, application.bot)) for data in updates]
+    started = time.perf_counter()
+    # Задачи создаются в порядке поступления, как в Application._update_fetcher
+    tasks = [
+        asyncio.create_task(application.update_processor.process_update(update, timed(data, update)))
+        for data, update in parsed
+    ]
+    await asyncio.gather(*tasks)
+    return latencies, time.perf_counter() - started
+
+
+async def run(bot, scales: List[int], updates_count: int, max_games: int, workers: int,
+              probes: int, concurrency: int, mix):
+    from telegram.ext import Application
+
+    from achievements import achievement_engine
+    from dataset_populator import populate
+    from update_processor import PerUserUpdateProcessor
+
+    application = (
+        Application.builder()
+        .bot(make_stub_bot())
+        .updater(None)
+        .concurrent_updates(PerUserUpdateProcessor(concurrency))
+        .build()
+    )
+    bot.register_handlers(application)
+    rng = random.Random(42)
+
+    async with application:
+        await bot.post_init(application)
+        try:
+            seeded = 0
+            for scale in scales:
+                started = time.perf_counter()
+                # Генерация в процессах-воркерах, поэтому из главного потока (fork)
+                populate(bot.db, scale - seeded, max_games=max_games, workers=workers)
+                seeded = scale
+                print(f"\n===== {scale:,} игроков (наполнение {time.perf_counter() - started:.1f} с) =====")
+
+                report("Запросы к БД", probe_queries(bot.db, achievement_engine, scale, probes, rng), label='запрос')
+
+                updates = [
+                    random_update(update_id, rng.randint(1, scale), rng, weights=mix)
+                    for update_id in range(1, updates_count + 1)
+                ]
+                latencies, elapsed = await replay(application, updates)
+                report(
+                    f"Обработчики: {updates_count / elapsed:.0f} обновлений/с "
+                    f"({concurrency} параллельно)",
+                    dict(sorted(latencies.items()))
+                )
+        finally:
+            await bot.post_shutdown(application)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--scales', default='1000,10000,100000',
+                        help='размеры базы через запятую, например 1000,10000,100000,1000000')
+    parser.add_argument('--updates', type=int, default=5000, help='обновлений на каждом шаге')
+    parser.add_argument('--max-games', type=int, default=6, help='максимум игр на игрока при наполнении')
+    parser.add_argument('--workers', type=int, default=None, help='процессов наполнения (по умолчанию по числу CPU)')
+    parser.add_argument('--probes', type=int, default=500, help='замеров запросов к БД на шаге')
+    parser.add_argument('--concurrency', type=int, default=None, help='по умолчанию MAX_CONCURRENT_UPDATES')
+    parser.add_argument('--mix', default='40,40,20', help='доли команд, кнопок и результатов игр')
+    parser.add_argument('--verbose', action='store_true', help='не глушить логи бота')
+    args = parser.parse_args()
+
+    scales = sorted(int(value) for value in args.scales.split(','))
+    mix = tuple(int(value) for value in args.mix.split(','))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # database.db создается при импорте, поэтому путь задается до импорта bot
+        os.environ['DATABASE_NAME'] = os.path.join(tmp, 'bench.db')
+        bot = importlib.import_module('bot')
+        if not args.verbose:
+            logging.getLogger().setLevel(logging.WARNING)
+
+        from config import MAX_CONCURRENT_UPDATES
+        asyncio.run(run(
+            bot, scales, args.updates, args.max_games, args.workers, args.probes,
+            args.concurrency or MAX_CONCURRENT_UPDATES, mix
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Web App payload micro-benchmark: parse and validate web_app_data
+Стоимость разбора данных из Web App: прежний двойной json.loads против parse_payload
+
+Сравниваются:
+  - legacy      — как было в bot.py: json.loads в suggestion_handler, второй
+                  json.loads в web_app_data_handler и data.get без проверок;
+  - parse       — parse_payload на честных результатах игры (горячий путь);
+  - coerce      — parse_payload на данных со строками, дробями и выходом за
+                  диапазоны (медленный путь приведения типов);
+  - suggestion  — parse_payload на предложениях.
+
+Запуск: python -m benchmarks.payload_parse --payloads 2000 --repeat 5
+"""
+
+import argparse
+import json
+import random
+import time
+from typing import Callable, Dict, List
+
+from benchmarks.updates import game_payload
+from webapp_payload import parse_payload
+
+
+def legacy_parse(raw: str):
+    """Прежний путь: два json.loads и чтение полей через get"""
+    data = json.loads(raw)
+    if data.get('type') == 'suggestion':
+        return data.get('text', '').strip(), data.get('category', 'general')
+    data = json.loads(raw)
+    level_deltas = data.get('level_deltas', [])
+    return (
+        data.get('score', 0), data.get('level', 1), data.get('difficulty', 'normal'),
+        data.get('duration_seconds', 0), data.get('enemies_killed', 0),
+        data.get('accuracy_percent', 0.0), data.get('bosses_killed', 0),
+        round(sum(level_deltas) / len(level_deltas), 1) if level_deltas else 0
+    )
+
+
+def dirty_payload(rng: random.Random) -> Dict:
+    """Результат игры, который приходится приводить к типам"""
+    payload = game_payload(rng)
+    payload['score'] = str(payload['score'])
+    payload['level'] = float(payload['level']) + 0.5
+    payload['difficulty'] = rng.choice(['normal', 'HARD', None, ['easy']])
+    payload['accuracy_percent'] = rng.choice([150, -3, 'NaN', '42.5'])
+    payload['enemies_killed'] = rng.choice([10 ** 12, -5, True])
+    payload['level_deltas'] = [str(delta) for delta in payload['level_deltas']]
+    return payload
+
+
+def suggestion_payload(rng: random.Random) -> Dict:
+    return {
+        'type': 'suggestion',
+        'text': ' '.join(rng.choice(['добавьте', 'боссов', 'музыку', 'уровни']) for _ in range(20)),
+        'category': rng.choice(['gameplay', 'music', 'bug', 'unknown'])
+    }
+
+
+def measure(func: Callable, payloads: List[str], repeat: int) -> float:
+    """Лучшее из repeat прогонов, микросекунд на один разбор"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for raw in payloads:
+            func(raw)
+        best = min(best, time.perf_counter() - started)
+    return best / len(payloads) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--payloads', type=int, default=2000, help='данных в одном прогоне')
+    parser.add_argument('--repeat', type=int, default=5, help='прогонов (берется лучший)')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    clean = [json.dumps(game_payload(rng)) for _ in range(args.payloads)]
+    dirty = [json.dumps(dirty_payload(rng)) for _ in range(args.payloads)]
+    suggestions = [json.dumps(suggestion_payload(rng), ensure_ascii=False) for _ in range(args.payloads)]
+
+    # путь -> (функция, данные, сколько раз в пути вызывается json.loads)
+    paths = {
+        'legacy': (legacy_parse, clean, 2),
+        'parse': (parse_payload, clean, 1),
+        'coerce': (parse_payload, dirty, 1),
+        'suggestion': (parse_payload, suggestions, 1),
+    }
+
+    print(f"\nРазбор web_app_data ({args.payloads} данных, лучший из {args.repeat} прогонов)")
+    print(f"  {'путь':<12} {'мкс/разбор':>11} {'json.loads':>11} {'остальное':>10}")
+    for name, (func, payloads, decodes) in paths.items():
+        micros = measure(func, payloads, args.repeat)
+        decode = measure(json.loads, payloads, args.repeat) * decodes
+        print(f"  {name:<12} {micros:>11.2f} {decode:>11.2f} {micros - decode:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+"""
+Shared helpers for benchmark reports
+Общие функции для отчетов бенчмарков
+"""
+
+from typing import Dict, List
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Перцентиль по отсортированному списку"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(title: str, latencies: Dict[str, List[float]], label: str = 'обработчик'):
+    """Напечатать таблицу p50/p95/p99 (значения в миллисекундах)"""
+    print(f"\n{title}")
+    print(f"  {label:<16} {'n':>7} {'p50, мс':>10} {'p95, мс':>10} {'p99, мс':>10}")
+    for kind, values in latencies.items():
+        print(
+            f"  {kind:<16} {len(values):>7} {percentile(values, 50):>10.2f} "
+            f"{percentile(values, 95):>10.2f} {percentile(values, 99):>10.2f}"
+        )
@@ -0,0 +1,60 @@
+"""
+Offline Bot for benchmarks
+Bot без сетевого ввода-вывода: запросы к Bot API получают готовые ответы
+"""
+
+import json
+import time
+from typing import Dict, Tuple
+
+from telegram import Bot
+from telegram.request import BaseRequest, RequestData
+
+STUB_TOKEN = "123456:BENCHMARK-TOKEN"
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'Space Shooter', 'username': 'space_shooter_bot'}
+
+
+class NullRequest(BaseRequest):
+    """Запросы к Bot API без сети: сообщения «отправляются» мгновенно"""
+
+    def __init__(self):
+        self.calls: Dict[str, int] = {}
+        self._message_id = 0
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: RequestData = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> Tuple[int, bytes]:
+        endpoint = url.rsplit('/', 1)[-1]
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+        params = request_data.parameters if request_data else {}
+        return 200, json.dumps({'ok': True, 'result': self._result(endpoint, params)}).encode()
+
+    def _result(self, endpoint: str, params: Dict):
+        if endpoint == 'getMe':
+            return BOT_USER
+        if endpoint in ('sendMessage', 'editMessageText', 'sendPhoto'):
+            self._message_id += 1
+            chat_id = params.get('chat_id') or 1
+            return {
+                'message_id': params.get('message_id') or self._message_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': BOT_USER,
+                'text': params.get('text', '')
+            }
+        return True
+
+
+def make_stub_bot() -> Bot:
+    """Bot, который не обращается к api.telegram.org"""
+    return Bot(STUB_TOKEN, request=NullRequest(), get_updates_request=NullRequest())
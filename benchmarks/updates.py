@@ -0,0 +1,106 @@
+"""
+Synthetic Telegram updates for benchmarks
+Генерация JSON обновлений Telegram: команды, нажатия кнопок и результаты игр
+"""
+
+import json
+import random
+import time
+from typing import Dict
+
+COMMANDS = ('/start', '/stats', '/leaderboard', '/achievements', '/daily', '/help', '/play')
+BUTTONS = ('stats', 'leaderboard', 'achievements', 'daily', 'help', 'back_to_menu')
+DIFFICULTY_KEYS = ('easy', 'normal', 'hard', 'nightmare')
+
+
+def _user(user_id: int) -> Dict:
+    return {
+        'id': user_id,
+        'is_bot': False,
+        'first_name': f"Player{user_id}",
+        'username': f"player{user_id}",
+        'language_code': 'ru'
+    }
+
+
+def _message(update_id: int, user_id: int, **fields) -> Dict:
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': _user(user_id)
+    }
+    message.update(fields)
+    return message
+
+
+def command_update(update_id: int, user_id: int, command: str = '/start') -> Dict:
+    """Сообщение с командой бота"""
+    return {
+        'update_id': update_id,
+        'message': _message(
+            update_id, user_id,
+            text=command,
+            entities=[{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+        )
+    }
+
+
+def callback_update(update_id: int, user_id: int, data: str = 'stats') -> Dict:
+    """Нажатие инлайн-кнопки под сообщением бота"""
+    bot_message = _message(update_id, user_id, text='menu')
+    bot_message['from'] = {'id': 1, 'is_bot': True, 'first_name': 'Bot'}
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': _user(user_id),
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': bot_message
+        }
+    }
+
+
+def game_payload(rng: random.Random = random) -> Dict:
+    """Результат игры в формате tg.sendData из game-code.js"""
+    level = rng.randint(1, 15)
+    deltas = [rng.randint(15, 90) for _ in range(level - 1)]
+    return {
+        'score': rng.randint(0, 200) * level * 10,
+        'level': level,
+        'difficulty': rng.choice(DIFFICULTY_KEYS),
+        'maxCombo': rng.randint(0, 30),
+        'coins': rng.randint(0, 500),
+        'shipLvl': rng.randint(1, 5),
+        'duration_seconds': sum(deltas) + rng.randint(5, 60),
+        'enemies_killed': rng.randint(0, 40) * level,
+        'accuracy_percent': rng.randint(10, 95),
+        'bosses_killed': level // 5,
+        'level_deltas': deltas
+    }
+
+
+def web_app_update(update_id: int, user_id: int, payload: Dict = None) -> Dict:
+    """Сообщение WEB_APP_DATA с результатом игры"""
+    return {
+        'update_id': update_id,
+        'message': _message(
+            update_id, user_id,
+            web_app_data={
+                'data': json.dumps(payload or game_payload()),
+                'button_text': '🎮 ИГРАТЬ'
+            }
+        )
+    }
+
+
+def random_update(update_id: int, user_id: int, rng: random.Random = random,
+                  weights=(40, 40, 20)) -> Dict:
+    """Случайное обновление: команда / кнопка / результат игры"""
+    kind = rng.choices(('command', 'callback', 'web_app'), weights=weights)[0]
+    if kind == 'command':
+        return command_update(update_id, user_id, rng.choice(COMMANDS))
+    if kind == 'callback':
+        return callback_update(update_id, user_id, rng.choice(BUTTONS))
+    return web_app_update(update_id, user_id, game_payload(rng))
@@ -0,0 +1,252 @@
+"""
+Update ingestion benchmark: embedded webhook server vs long polling
+Сравнение задержки доставки обновлений до update_queue: вебхук и long polling
+
+Для polling поднимается локальный фейковый Bot API (getMe, deleteWebhook,
+getUpdates), и настоящий Updater опрашивает его через base_url. Для вебхука
+обновления отправляются POST-запросами во WebhookServer по нескольким
+keep-alive соединениям, как это делает Telegram. --rtt-ms добавляет
+сетевую задержку (половина RTT на запрос и половина на ответ).
+
+Запуск: python -m benchmarks.webhook_vs_polling --updates 3000 --rate 300 --rtt-ms 40
+Реплей записанных обновлений: --file updates.jsonl (одно обновление JSON на строку)
+"""
+
+import argparse
+import asyncio
+import json
+import random
+from typing import Dict, List
+from urllib.parse import parse_qs
+
+from telegram.ext import Application
+
+from benchmarks.stats import report
+from benchmarks.updates import random_update
+from config import ALLOWED_UPDATES
+from webhook_server import WebhookServer
+
+FAKE_TOKEN = "123456:BENCHMARK-TOKEN"
+SECRET = "benchmark-secret"
+
+
+def load_updates(path: str = None, count: int = 1000, users: int = 500) -> List[Dict]:
+    """Загрузить записанные обновления или сгенерировать синтетические"""
+    if path:
+        with open(path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    rng = random.Random(42)
+    return [random_update(i + 1, rng.randint(1, users), rng) for i in range(count)]
+
+
+async def collect(application: Application, expected: int, sent_at: Dict[int, float],
+                  latencies: List[float]):
+    """Забирать обновления из update_queue и считать задержку доставки"""
+    loop = asyncio.get_running_loop()
+    while len(latencies) < expected:
+        update = await application.update_queue.get()
+        latencies.append((loop.time() - sent_at[update.update_id]) * 1000)
+
+
+def schedule(updates: List[Dict], rate: float, start: float) -> List[float]:
+    """Пуассоновские моменты появления обновлений"""
+    times, current = [], start
+    for _ in updates:
+        current += random.expovariate(rate)
+        times.append(current)
+    return times
+
+
+# ===== ВЕБХУК =====
+
+async def bench_webhook(updates: List[Dict], rate: float, rtt: float, connections: int) -> List[float]:
+    application = Application.builder().token(FAKE_TOKEN).updater(None).build()
+    server = WebhookServer(application, '/telegram', SECRET, '127.0.0.1', 0)
+    await server.start()
+
+    loop = asyncio.get_running_loop()
+    outbox: asyncio.Queue = asyncio.Queue()
+    sent_at: Dict[int, float] = {}
+    latencies: List[float] = []
+
+    async def producer():
+        for update, at in zip(updates, schedule(updates, rate, loop.time())):
+            await asyncio.sleep(max(0.0, at - loop.time()))
+            sent_at[update['update_id']] = at
+            outbox.put_nowait(json.dumps(update).encode())
+
+    async def connection():
+        reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+        try:
+            while True:
+                body = await outbox.get()
+                await asyncio.sleep(rtt / 2)
+                writer.write(
+                    b"POST /telegram HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+                    + f"X-Telegram-Bot-Api-Secret-Token: {SECRET}\r\n"
+                      f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+                )
+                await writer.drain()
+                while (await reader.readline()) not in (b'\r\n', b''):
+                    pass
+                await asyncio.sleep(rtt / 2)
+        finally:
+            writer.close()
+
+    senders = [asyncio.create_task(connection()) for _ in range(connections)]
+    await asyncio.gather(producer(), collect(application, len(updates), sent_at, latencies))
+    for task in senders:
+        task.cancel()
+    await asyncio.gather(*senders, return_exceptions=True)
+    await server.stop()
+    return latencies
+
+
+# ===== LONG POLLING =====
+
+class FakeBotApi:
+    """Минимальный Bot API: getMe, deleteWebhook и long polling getUpdates"""
+
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.pending: List[Dict] = []
+        self.changed = asyncio.Condition()
+        self.port = None
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+
+    async def publish(self, update: Dict):
+        async with self.changed:
+            self.pending.append(update)
+            self.changed.notify_all()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                await asyncio.sleep(self.rtt / 2)
+                method = request_line.split()[1].decode().rsplit('/', 1)[-1]
+                result = await self._call(method, self._params(body, headers))
+                await asyncio.sleep(self.rtt / 2)
+
+                payload = json.dumps({'ok': True, 'result': result}).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _params(body: bytes, headers: Dict) -> Dict:
+        if not body:
+            return {}
+        if 'json' in headers.get('content-type', ''):
+            return json.loads(body)
+        return {key: values[0] for key, values in parse_qs(body.decode()).items()}
+
+    async def _call(self, method: str, params: Dict):
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        if method != 'getUpdates':
+            return True
+
+        offset = int(params.get('offset') or 0)
+        timeout = float(params.get('timeout') or 0)
+        limit = int(params.get('limit') or 100)
+        async with self.changed:
+            self.pending = [u for u in self.pending if u['update_id'] >= offset]
+            if not self.pending and timeout:
+                try:
+                    await asyncio.wait_for(self.changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            return self.pending[:limit]
+
+
+async def bench_polling(updates: List[Dict], rate: float, rtt: float) -> List[float]:
+    api = FakeBotApi(rtt)
+    await api.start()
+    application = (
+        Application.builder()
+        .token(FAKE_TOKEN)
+        .base_url(f"http://127.0.0.1:{api.port}/bot")
+        .build()
+    )
+    await application.initialize()
+    await application.updater.start_polling(poll_interval=0, timeout=10, allowed_updates=ALLOWED_UPDATES)
+
+    loop = asyncio.get_running_loop()
+    sent_at: Dict[int, float] = {}
+    latencies: List[float] = []
+
+    async def producer():
+        for update, at in zip(updates, schedule(updates, rate, loop.time())):
+            await asyncio.sleep(max(0.0, at - loop.time()))
+            sent_at[update['update_id']] = at
+            await api.publish(update)
+
+    await asyncio.gather(producer(), collect(application, len(updates), sent_at, latencies))
+    await application.updater.stop()
+    await application.shutdown()
+    await api.stop()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--updates', type=int, default=3000)
+    parser.add_argument('--rate', type=float, default=300.0, help='обновлений в секунду')
+    parser.add_argument('--rtt-ms', type=float, default=40.0, help='сетевой RTT до Telegram')
+    parser.add_argument('--connections', type=int, default=40, help='соединений вебхука (max_connections)')
+    parser.add_argument('--file', help='JSONL с записанными обновлениями')
+    args = parser.parse_args()
+
+    updates = load_updates(args.file, args.updates)
+    rtt = args.rtt_ms / 1000
+
+    results = {}
+    for name, bench in (
+        ('polling', lambda: bench_polling(updates, args.rate, rtt)),
+        ('webhook', lambda: bench_webhook(updates, args.rate, rtt, args.connections)),
+    ):
+        results[name] = asyncio.run(_timed(bench))
+
+    report(
+        f"Доставка {len(updates)} обновлений при {args.rate:.0f}/с, RTT {args.rtt_ms:.0f} мс",
+        {name: latencies for name, (latencies, _) in results.items()},
+        label='режим'
+    )
+    for name, (latencies, elapsed) in results.items():
+        print(f"  {name}: {len(latencies) / elapsed:.0f} обновлений/с")
+
+
+async def _timed(bench):
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    latencies = await bench()
+    return latencies, loop.time() - start
+
+
+if __name__ == '__main__':
+    main()
@@ -3,8 +3,11 @@ Space Shooter Telegram Bot v2.0
 Улучшенная версия с достижениями, заданиями и расширенной статистикой
 """
 
+import asyncio
+import dataclasses
+import functools
 import logging
-import json
+import time
 from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo, BotCommand
 from telegram.ext import (
@@ -14,44 +17,67 @@ from telegram.ext import (
 from telegram.error import TelegramError
 
 from database import db, DatabaseError
+from logging_setup import SAMPLED, setup_logging
+from metrics import metrics, MetricsServer
+from async_database import adb
+from backup import OnlineBackup
+from plausibility import plausibility
+from update_processor import PerUserUpdateProcessor
+from webapp_payload import GameResult, PayloadError, Suggestion, parse_payload
+from webhook_server import run_webhook
+from write_queue import GameWriteQueue
 from config import (
     BOT_TOKEN, GAME_URL, DIFFICULTIES, ACHIEVEMENTS,
-    Messages, BOT_COMMANDS, LEADERBOARD_SIZE
+    Messages, BOT_COMMANDS, LEADERBOARD_SIZE, LEADERBOARD_CACHE_SECONDS, DB_WRITE_BATCHING,
+    GLOBAL_STATS_RECONCILE_HOURS, CACHE_PURGE_SECONDS, USER_SEEN_FLUSH_SECONDS,
+    BOT_MODE, ALLOWED_UPDATES, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT,
+    WEBHOOK_PATH, WEBHOOK_SECRET_TOKEN, MAX_CONCURRENT_UPDATES, ADMIN_CHAT_ID,
+    DB_BACKUP_ENABLED, DB_BACKUP_INTERVAL_HOURS, HISTORY_ARCHIVE_INTERVAL_HOURS,
+    SUGGESTION_CATEGORIES, SUGGESTION_MAX_LENGTH, PLAUSIBILITY_ENABLED, PLAUSIBILITY_REFRESH_MINUTES,
+    PLAUSIBILITY_SAMPLE_GAMES
 )
 
-# Настройка расширенного логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO,
-    handlers=[
-        logging.FileHandler('bot.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+# Логирование через очередь: файлы пишутся в отдельном потоке
+setup_logging()
 logger = logging.getLogger(__name__)
 
+# Очередь пакетной записи результатов игр
+game_writer = GameWriteQueue(adb) if DB_WRITE_BATCHING else None
+
+# Резервные копии БД по расписанию
+db_backup = OnlineBackup(db.db_name) if DB_BACKUP_ENABLED else None
+
+# Фоновые периодические задачи (запускаются в post_init)
+background_tasks = []
+
+# HTTP-эндпоинт метрик (запускается в post_init, если METRICS_ENABLED)
+metrics_server = MetricsServer(metrics) if metrics.enabled else None
+
 
 # ===== ДЕКОРАТОРЫ =====
 
 def log_command(func):
     """Декоратор для логирования команд"""
+    @functools.wraps(func)
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user = update.effective_user
         command = update.message.text if update.message else update.callback_query.data
-        logger.info(f"👤 Пользователь {user.id} ({user.first_name}) -> {command}")
+        logger.info("👤 Пользователь %s (%s) -> %s", user.id, user.first_name, command, extra=SAMPLED)
         try:
             return await func(update, context)
         except Exception as e:
             logger.error(f"❌ Ошибка в {func.__name__}: {e}", exc_info=True)
+            metrics.inc('bot_handler_errors_total', (func.__name__,))
             await send_error_message(update, context)
     return wrapper
 
 
 def register_user(func):
     """Декоратор для автоматической регистрации пользователя"""
+    @functools.wraps(func)
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user = update.effective_user
-        db.add_user(
+        await adb.touch_user(
             user_id=user.id,
             username=user.username,
             first_name=user.first_name,
@@ -71,8 +97,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик команды /start"""
     user = update.effective_user
     
-    stats = db.get_user_stats(user.id) or {'best_score': 0, 'games_played': 0}
-    rank = db.get_user_rank(user.id) or '—'
+    profile = await adb.get_profile_bundle(user.id, parts=('stats', 'rank'))
+    stats = profile.stats or {'best_score': 0, 'games_played': 0}
+    rank = profile.rank or '—'
     
     welcome_text = Messages.WELCOME.format(
         name=user.first_name,
@@ -126,21 +153,25 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик команды /stats - статистика игрока"""
     user = update.effective_user
     
-    stats = db.get_user_stats(user.id)
+    profile = await adb.get_profile_bundle(
+        user.id, parts=('stats', 'rank', 'recent_games'), recent_limit=3
+    )
+    stats = profile.stats
     if not stats:
         stats = {
             'best_score': 0, 'games_played': 0, 'max_level': 0,
             'easy_games': 0, 'normal_games': 0, 'hard_games': 0, 'nightmare_games': 0,
-            'total_score': 0, 'total_enemies_killed': 0, 'avg_accuracy': 0,
-            'win_streak': 0, 'best_win_streak': 0
+            'total_score': 0, 'total_playtime_seconds': 0, 'total_enemies_killed': 0,
+            'total_bosses_killed': 0, 'avg_accuracy': 0, 'win_streak': 0, 'best_win_streak': 0
         }
     
-    rank = db.get_user_rank(user.id) or '—'
-    recent_games = db.get_recent_games(user.id, limit=3)
+    rank = profile.rank or '—'
+    recent_games = profile.recent_games
+    percentile = await adb.get_score_percentile(stats['best_score']) if stats['games_played'] else {}
     
     # Вычисляем средние показатели
     avg_score = stats['total_score'] // stats['games_played'] if stats['games_played'] > 0 else 0
-    total_dur = stats.get('total_duration', 0)
+    total_dur = stats['total_playtime_seconds']
     avg_dur   = total_dur // stats['games_played'] if stats['games_played'] > 0 else 0
     avg_dur_str = f"{avg_dur // 60}м {avg_dur % 60}с" if avg_dur > 0 else "—"
 
@@ -154,10 +185,10 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 • Макс. уровень: <code>{stats['max_level']}</code>
 • Среднее время забега: <code>{avg_dur_str}</code>
 • Место в рейтинге: <code>#{rank}</code>
-
+{percentile_text(percentile, "по лучшему счету")}
 <b>🎯 Боевая статистика:</b>
 • Врагов убито: <code>{stats['total_enemies_killed']}</code>
-• Боссов побеждено: <code>{stats.get('total_bosses_killed', 0)}</code>
+• Боссов побеждено: <code>{stats['total_bosses_killed'] or 0}</code>
 • Средняя точность: <code>{stats['avg_accuracy']:.1f}%</code>
 • Текущая серия побед: <code>{stats['win_streak']}</code>
 • Лучшая серия: <code>{stats['best_win_streak']}</code>
@@ -200,29 +231,56 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         )
 
 
-@log_command
-@register_user
-async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Обработчик команды /leaderboard - таблица лидеров"""
-    top_players = db.get_top_players(limit=LEADERBOARD_SIZE)
-    global_stats = db.get_global_stats()
-
-    leaderboard_text = "🏆 <b>ТАБЛИЦА ЛИДЕРОВ</b>\n\n"
-
-    medals = ["🥇", "🥈", "🥉"]
-    for i, player in enumerate(top_players, 1):
-        medal = medals[i-1] if i <= 3 else f"{i}."
-        premium = "⭐" if player.get('is_premium') else ""
-        leaderboard_text += (
-            f"{medal} {player['name']} {premium}\n"
-            f"   └ <code>{player['score']}</code> очков "
-            f"({player['games_played']} игр)\n"
+class LeaderboardSnapshot:
+    """Готовое сообщение таблицы лидеров, общее для всех пользователей
+
+    Перерисовывается, только если db.leaderboard_version изменилась или
+    прошло LEADERBOARD_CACHE_SECONDS, поэтому просмотр топа не делает запросов.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.expires_at = 0.0
+        self.text = None
+        self.reply_markup = None
+        self._lock = asyncio.Lock()
+
+    def is_fresh(self) -> bool:
+        return (
+            self.text is not None
+            and self.version == db.leaderboard_version
+            and time.monotonic() < self.expires_at
         )
 
-    if not top_players:
-        leaderboard_text += "Пока никто не играл. Будьте первым! 🚀\n"
+    async def get(self):
+        """Вернуть (текст, клавиатура), перерисовав при необходимости"""
+        if not self.is_fresh():
+            async with self._lock:
+                if not self.is_fresh():
+                    await self._render()
+        return self.text, self.reply_markup
+
+    async def _render(self):
+        version = db.leaderboard_version
+        top_players = await adb.get_top_players(limit=LEADERBOARD_SIZE)
+        global_stats = await adb.get_global_stats()
+
+        leaderboard_text = "🏆 <b>ТАБЛИЦА ЛИДЕРОВ</b>\n\n"
+
+        medals = ["🥇", "🥈", "🥉"]
+        for i, player in enumerate(top_players, 1):
+            medal = medals[i-1] if i <= 3 else f"{i}."
+            premium = "⭐" if player.get('is_premium') else ""
+            leaderboard_text += (
+                f"{medal} {player['name']} {premium}\n"
+                f"   └ <code>{player['score']}</code> очков "
+                f"({player['games_played']} игр)\n"
+            )
+
+        if not top_players:
+            leaderboard_text += "Пока никто не играл. Будьте первым! 🚀\n"
 
-    leaderboard_text += f"""
+        leaderboard_text += f"""
 \n<b>📊 Глобальная статистика:</b>
 👥 Всего игроков: {global_stats.get('total_users', 0)}
 🎮 Игр сыграно: {global_stats.get('total_games', 0)}
@@ -230,14 +288,28 @@ async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 📈 Средний счет: {global_stats.get('avg_score', 0)}
 """
 
-    keyboard = [
-        [InlineKeyboardButton("🎮 Играть", web_app=WebAppInfo(url=GAME_URL))],
-        [
-            InlineKeyboardButton("📊 Моя статистика", callback_data="stats"),
-            InlineKeyboardButton("« Назад", callback_data="back_to_menu")
+        keyboard = [
+            [InlineKeyboardButton("🎮 Играть", web_app=WebAppInfo(url=GAME_URL))],
+            [
+                InlineKeyboardButton("📊 Моя статистика", callback_data="stats"),
+                InlineKeyboardButton("« Назад", callback_data="back_to_menu")
+            ]
         ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+
+        self.text = leaderboard_text
+        self.reply_markup = InlineKeyboardMarkup(keyboard)
+        self.version = version
+        self.expires_at = time.monotonic() + LEADERBOARD_CACHE_SECONDS
+
+
+leaderboard_snapshot = LeaderboardSnapshot()
+
+
+@log_command
+@register_user
+async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /leaderboard - таблица лидеров"""
+    leaderboard_text, reply_markup = await leaderboard_snapshot.get()
 
     if update.callback_query:
         await update.callback_query.edit_message_text(
@@ -259,9 +331,10 @@ async def achievements_command(update: Update, context: ContextTypes.DEFAULT_TYP
     """Обработчик команды /achievements - достижения"""
     user = update.effective_user
 
-    unlocked = db.get_user_achievements(user.id)
-    stats = db.get_user_stats(user.id) or {}
-    stats['rank'] = db.get_user_rank(user.id) or 999
+    profile = await adb.get_profile_bundle(user.id, parts=('achievements', 'stats', 'rank'))
+    unlocked = profile.achievements
+    stats = profile.stats or {}
+    stats['rank'] = profile.rank or 999
 
     achievements_text = f"🎯 <b>Достижения {user.first_name}</b>\n\n"
     achievements_text += f"Разблокировано: {len(unlocked)}/{len(ACHIEVEMENTS)}\n\n"
@@ -310,7 +383,7 @@ async def achievements_command(update: Update, context: ContextTypes.DEFAULT_TYP
 async def daily_challenges(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик команды /daily - ежедневные задания"""
     user = update.effective_user
-    challenges = db.get_daily_challenges(user.id)
+    challenges = await adb.get_daily_challenges(user.id)
 
     challenges_text = "📅 <b>Ежедневные задания</b>\n\n"
 
@@ -445,7 +518,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     handler = handlers.get(query.data)
     if handler:
-        await handler(update, context)
+        await metrics.instrument_handler(handler, f"button_{query.data}")(update, context)
 
 
 @register_user
@@ -453,8 +526,9 @@ async def back_to_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     """Возврат в главное меню"""
     user = update.effective_user
 
-    stats = db.get_user_stats(user.id) or {'best_score': 0, 'games_played': 0}
-    rank = db.get_user_rank(user.id) or '—'
+    profile = await adb.get_profile_bundle(user.id, parts=('stats', 'rank', 'daily_challenges'))
+    stats = profile.stats or {'best_score': 0, 'games_played': 0}
+    rank = profile.rank or '—'
 
     welcome_text = f"""
 🚀 <b>Space Shooter - Главное меню</b>
@@ -468,7 +542,7 @@ async def back_to_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 """
 
     # Проверяем незавершенные задания
-    challenges = db.get_daily_challenges(user.id)
+    challenges = profile.daily_challenges
     uncompleted = [c for c in challenges if not c['completed']]
     if uncompleted:
         welcome_text += f"\n📅 Активных заданий: {len(uncompleted)}"
@@ -494,54 +568,94 @@ async def back_to_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     )
 
 
+# ===== ДАННЫЕ ИЗ WEB APP =====
+
+async def web_app_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Разбор web_app_data и передача результата игры или предложения обработчику"""
+    try:
+        payload = parse_payload(update.effective_message.web_app_data.data)
+    except PayloadError as e:
+        logger.error(f"❌ Ошибка разбора данных Web App: {e}")
+        await update.effective_message.reply_text(Messages.ERROR_SAVE_GAME)
+        return
+
+    if isinstance(payload, Suggestion):
+        await suggestion_handler(update, context, payload)
+    else:
+        await web_app_data_handler(update, context, payload)
+
+
 # ===== ОБРАБОТЧИК РЕЗУЛЬТАТОВ ИГРЫ =====
 
-async def web_app_data_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def web_app_data_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, result: GameResult) -> None:
     """Обработчик данных из Web App (результаты игры)"""
     try:
-        # Получаем данные из игры
-        data = json.loads(update.effective_message.web_app_data.data)
         user_id = update.effective_user.id
-        user = update.effective_user
 
-        score = data.get('score', 0)
-        level = data.get('level', 1)
-        difficulty = data.get('difficulty', 'normal')
-        duration = data.get('duration_seconds', 0)
-        enemies_killed = data.get('enemies_killed', 0)
-        accuracy = data.get('accuracy_percent', 0.0)
-        # Новые поля аналитики
-        bosses_killed = data.get('bosses_killed', 0)
-        level_deltas  = data.get('level_deltas', [])   # секунды между уровнями
-
-        # Вычисляем агрегаты из дельт уровней
-        avg_level_time = round(sum(level_deltas) / len(level_deltas), 1) if level_deltas else 0
-
-        # Расширенное логирование каждой сессии
+        # Поля уже приведены к типам и диапазонам (webapp_payload)
+        score = result.score
+        level = result.level
+        difficulty = result.difficulty
+        duration = result.duration_seconds
+        enemies_killed = result.enemies_killed
+        accuracy = result.accuracy_percent
+        bosses_killed = result.bosses_killed
+        level_deltas = list(result.level_deltas)   # секунды между уровнями
+        avg_level_time = result.avg_level_time
+
+        # Короткая строка в текстовый лог, полная сессия (с level_deltas) — в JSON Lines
         logger.info(
-            f"📊 СЕССИЯ: user={user_id}({user.first_name}) "
-            f"score={score} lvl={level} diff={difficulty} "
-            f"dur={duration}s kills={enemies_killed} bosses={bosses_killed} "
-            f"acc={accuracy:.1f}% avg_lvl_time={avg_level_time}s "
-            f"deltas={level_deltas}"
+            "📊 СЕССИЯ: user=%s score=%s lvl=%s diff=%s dur=%ss kills=%s bosses=%s avg_lvl_time=%ss",
+            user_id, score, level, difficulty, duration, enemies_killed, bosses_killed, avg_level_time,
+            extra={'session': {
+                'event': 'game_session',
+                'user_id': user_id,
+                'score': score,
+                'level': level,
+                'difficulty': difficulty,
+                'duration_seconds': duration,
+                'enemies_killed': enemies_killed,
+                'accuracy_percent': accuracy,
+                'bosses_killed': bosses_killed,
+                'avg_level_time': avg_level_time,
+                'level_deltas': level_deltas,
+            }}
         )
 
+        # Неправдоподобный результат не доходит до save_game: рейтинг и кэш топа не меняются
+        reason = plausibility.check(result) if PLAUSIBILITY_ENABLED else None
+        if reason:
+            metrics.inc('bot_games_quarantined_total', (reason,))
+            logger.warning(f"⚠️ Результат в карантине: user={user_id} score={score} lvl={level} причина={reason}")
+            await adb.quarantine_game(user_id, dataclasses.asdict(result), reason)
+            await update.effective_message.reply_text(Messages.GAME_QUARANTINED)
+            return
+
         # Получаем старый ранг
-        old_rank = db.get_user_rank(user_id)
+        old_rank = await adb.get_user_rank(user_id)
 
         # Сохраняем результат в БД
-        success, result_info = db.save_game(
-            user_id, score, level, difficulty,
-            duration, enemies_killed, accuracy
-        )
+        if game_writer:
+            success, result_info = await game_writer.submit(
+                user_id, score, level, difficulty,
+                duration, enemies_killed, accuracy,
+                bosses_killed, result.level_deltas
+            )
+        else:
+            success, result_info = await adb.save_game(
+                user_id, score, level, difficulty,
+                duration, enemies_killed, accuracy,
+                bosses_killed, result.level_deltas
+            )
 
         if not success:
             await update.effective_message.reply_text(Messages.ERROR_SAVE_GAME)
             return
 
         # Получаем обновленную статистику
-        stats = db.get_user_stats(user_id, use_cache=False)
-        new_rank = db.get_user_rank(user_id)
+        stats = await adb.get_user_stats(user_id, use_cache=False)
+        new_rank = await adb.get_user_rank(user_id)
+        percentile = await adb.get_score_percentile(score, difficulty)
 
         # Определяем изменение ранга
         rank_change = ""
@@ -599,6 +713,7 @@ async def web_app_data_handler(update: Update, context: ContextTypes.DEFAULT_TYP
 • Среднее время на уровень: {avg_lvl_str}
 • Серия побед: {result_info.get('win_streak', 0)} 🔥
 """
+        message += percentile_text(percentile, f"на сложности {diff_config.emoji} {diff_config.name}")
         
         keyboard = [
             [InlineKeyboardButton("🎮 Играть снова", web_app=WebAppInfo(url=GAME_URL))],
@@ -617,13 +732,10 @@ async def web_app_data_handler(update: Update, context: ContextTypes.DEFAULT_TYP
         )
         
         logger.info(
-            f"✅ Результат сохранен: user={user_id}, score={score}, "
-            f"level={level}, achievements={len(result_info.get('new_achievements', []))}"
+            "✅ Результат сохранен: user=%s, score=%s, level=%s, achievements=%s",
+            user_id, score, level, len(result_info.get('new_achievements', [])), extra=SAMPLED
         )
         
-    except json.JSONDecodeError as e:
-        logger.error(f"❌ Ошибка парсинга JSON: {e}")
-        await update.effective_message.reply_text(Messages.ERROR_SAVE_GAME)
     except DatabaseError as e:
         logger.error(f"❌ Ошибка БД: {e}")
         await update.effective_message.reply_text(Messages.ERROR_SAVE_GAME)
@@ -636,41 +748,28 @@ async def web_app_data_handler(update: Update, context: ContextTypes.DEFAULT_TYP
 
 # ===== ОБРАБОТЧИК ПРЕДЛОЖЕНИЙ ИЗ ИГРЫ =====
 
-async def suggestion_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def suggestion_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, suggestion: Suggestion) -> None:
     """Обработчик предложений по игре, отправленных через WebApp"""
     try:
-        data = json.loads(update.effective_message.web_app_data.data)
-
-        if data.get('type') != 'suggestion':
-            # Передаём обычному обработчику результатов
-            await web_app_data_handler(update, context)
-            return
-
         user = update.effective_user
-        suggestion_text = data.get('text', '').strip()
-        category = data.get('category', 'general')
+        suggestion_text = suggestion.text
+        category = suggestion.category
 
         if not suggestion_text:
             await update.effective_message.reply_text("❌ Пустое предложение не принято.")
             return
 
-        if len(suggestion_text) > 1000:
-            await update.effective_message.reply_text("❌ Слишком длинное предложение (макс. 1000 символов).")
+        if len(suggestion_text) > SUGGESTION_MAX_LENGTH:
+            await update.effective_message.reply_text(
+                f"❌ Слишком длинное предложение (макс. {SUGGESTION_MAX_LENGTH} символов)."
+            )
             return
 
-        category_labels = {
-            'gameplay': '🎮 Геймплей',
-            'balance': '⚖️ Баланс',
-            'graphics': '🎨 Графика',
-            'music': '🎵 Музыка',
-            'bug': '🐛 Баг-репорт',
-            'general': '💡 Общее'
-        }
-        cat_label = category_labels.get(category, '💡 Общее')
+        cat_label = SUGGESTION_CATEGORIES[category]
 
         # Сохраняем предложение в БД если есть метод
         try:
-            db.save_suggestion(user.id, suggestion_text, category)
+            await adb.save_suggestion(user.id, suggestion_text, category)
         except Exception:
             pass  # БД может не иметь этой таблицы
 
@@ -682,11 +781,7 @@ async def suggestion_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
             parse_mode='HTML'
         )
 
-        # ── Пересылаем предложение администратору ──
-        # Укажи свой Telegram ID в ADMIN_CHAT_ID ниже.
-        # Узнать свой ID: напиши боту @userinfobot
-        ADMIN_CHAT_ID = 307592252  # ← ВСТАВЬ СВОЙ TELEGRAM ID СЮДА, например: 123456789
-
+        # ── Пересылаем предложение администратору (ADMIN_CHAT_ID в config.py) ──
         if ADMIN_CHAT_ID:
             try:
                 admin_msg = (
@@ -706,19 +801,38 @@ async def suggestion_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
             except Exception as e:
                 logger.warning(f"Не удалось переслать предложение: {e}")
         else:
-            logger.warning("⚠️  ADMIN_CHAT_ID не задан — предложение не переслано. Укажи свой Telegram ID в bot.py")
+            logger.warning("⚠️  ADMIN_CHAT_ID не задан — предложение не переслано. Укажи свой Telegram ID в config.py")
 
         logger.info(f"💡 Предложение от {user.id} ({user.first_name}): [{category}] {suggestion_text[:50]}...")
 
-    except json.JSONDecodeError:
-        # Не JSON или обычные данные — передаём дальше
-        await web_app_data_handler(update, context)
     except Exception as e:
         logger.error(f"❌ Ошибка обработки предложения: {e}", exc_info=True)
         await update.effective_message.reply_text("😔 Не удалось принять предложение. Попробуйте позже.")
 
+# ===== СЛУЖЕБНЫЕ КОМАНДЫ =====
+
+async def metrics_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Сводка метрик для администратора (/metrics)"""
+    if update.effective_user.id != ADMIN_CHAT_ID:
+        return
+
+    await update.message.reply_text(f"<pre>{metrics.summary()}</pre>", parse_mode='HTML')
+
+
 # ===== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ =====
 
+def percentile_text(percentile: dict, scope: str) -> str:
+    """Строки "лучше X% игроков" и "до следующей ступени" (пусто, если игроков мало)"""
+    if not percentile:
+        return ""
+    text = Messages.SCORE_PERCENTILE.format(percentile=percentile['percentile'], scope=scope) + "\n"
+    if percentile['next_bracket']:
+        text += Messages.NEXT_BRACKET.format(
+            bracket=percentile['next_bracket'], points=percentile['points_to_next']
+        ) + "\n"
+    return text
+
+
 def get_achievement_progress(key: str, stats: dict) -> str:
     """Получить текст прогресса достижения"""
     progress_map = {
@@ -761,6 +875,31 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     await send_error_message(update, context)
 
 
+async def refresh_plausibility() -> None:
+    """Пересчитать пороги правдоподобия по последним играм"""
+    rows = await adb.get_game_samples(PLAUSIBILITY_SAMPLE_GAMES)
+    # Сортировка выборки — вне цикла событий
+    await asyncio.to_thread(plausibility.refresh, rows)
+
+
+async def run_periodically(interval_seconds: float, job, name: str) -> None:
+    """Выполнять корутину job каждые interval_seconds секунд"""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await job()
+        except Exception as e:
+            logger.error(f"❌ Ошибка фоновой задачи {name}: {e}", exc_info=True)
+
+
+def start_background_task(interval_seconds: float, job, name: str) -> None:
+    """Запустить периодическую фоновую задачу"""
+    background_tasks.append(
+        asyncio.create_task(run_periodically(interval_seconds, job, name), name=name)
+    )
+    logger.info(f"✅ Фоновая задача {name} запущена (каждые {interval_seconds:.0f} с)")
+
+
 async def post_init(application: Application) -> None:
     """Действия после инициализации бота"""
     # Устанавливаем команды бота
@@ -769,49 +908,129 @@ async def post_init(application: Application) -> None:
     ])
     logger.info("✅ Команды бота установлены")
 
+    if game_writer:
+        await game_writer.start()
+
+    start_background_task(
+        GLOBAL_STATS_RECONCILE_HOURS * 3600,
+        adb.rebuild_global_counters,
+        "global-counters-reconcile"
+    )
+    start_background_task(
+        CACHE_PURGE_SECONDS,
+        lambda: adb.run(db.cache.purge_expired),
+        "cache-purge"
+    )
+    start_background_task(USER_SEEN_FLUSH_SECONDS, adb.flush_last_seen, "last-seen-flush")
+    if DB_BACKUP_ENABLED:
+        # Копирование идет минутами: в отдельном потоке, не занимая поток БД
+        start_background_task(
+            DB_BACKUP_INTERVAL_HOURS * 3600,
+            lambda: asyncio.to_thread(db_backup.run),
+            "db-backup"
+        )
+    if PLAUSIBILITY_ENABLED:
+        await refresh_plausibility()
+        start_background_task(PLAUSIBILITY_REFRESH_MINUTES * 60, refresh_plausibility, "plausibility-refresh")
+    # Перенос старых месяцев идет пачками, тоже в своем потоке и со своим соединением
+    start_background_task(
+        HISTORY_ARCHIVE_INTERVAL_HOURS * 3600,
+        lambda: asyncio.to_thread(db.archive_old_games),
+        "history-archive"
+    )
+
+    if metrics_server:
+        await metrics_server.start()
+
+
+async def post_shutdown(application: Application) -> None:
+    """Действия перед остановкой бота"""
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+
+    if metrics_server:
+        await metrics_server.stop()
+
+    if game_writer:
+        await game_writer.stop()
+
+    await adb.flush_last_seen()
+    adb.shutdown()
+
 
 # ===== ЗАПУСК БОТА =====
 
+def register_handlers(application: Application) -> None:
+    """Регистрация обработчиков (используется и бенчмарками)"""
+    # Без METRICS_ENABLED обработчики регистрируются как есть
+    timed = metrics.instrument_handler
+
+    # Команды
+    application.add_handler(CommandHandler("start", timed(start)))
+    application.add_handler(CommandHandler("play", timed(play)))
+    application.add_handler(CommandHandler("stats", timed(stats)))
+    application.add_handler(CommandHandler("leaderboard", timed(leaderboard)))
+    application.add_handler(CommandHandler("achievements", timed(achievements_command)))
+    application.add_handler(CommandHandler("daily", timed(daily_challenges)))
+    application.add_handler(CommandHandler("help", timed(help_command)))
+    application.add_handler(CommandHandler("metrics", metrics_command))
+
+    # Обработчик кнопок
+    application.add_handler(CallbackQueryHandler(timed(button_handler)))
+
+    # Обработчик данных из Web App (результаты игры + предложения)
+    application.add_handler(
+        MessageHandler(filters.StatusUpdate.WEB_APP_DATA, timed(web_app_handler, "web_app_data"))
+    )
+
+    # Обработчик ошибок
+    application.add_error_handler(error_handler)
+
+
 def main() -> None:
     """Запуск бота"""
     try:
+        metrics.install_log_counter()
+        update_processor = PerUserUpdateProcessor(MAX_CONCURRENT_UPDATES)
+        metrics.add_collector(update_processor.collect_metrics)
+
         # Создание приложения
-        application = (
+        builder = (
             Application.builder()
             .token(BOT_TOKEN)
             .post_init(post_init)
-            .build()
-        )
-
-        # Регистрация обработчиков команд
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(CommandHandler("play", play))
-        application.add_handler(CommandHandler("stats", stats))
-        application.add_handler(CommandHandler("leaderboard", leaderboard))
-        application.add_handler(CommandHandler("achievements", achievements_command))
-        application.add_handler(CommandHandler("daily", daily_challenges))
-        application.add_handler(CommandHandler("help", help_command))
-
-        # Обработчик кнопок
-        application.add_handler(CallbackQueryHandler(button_handler))
-
-        # Обработчик данных из Web App (результаты игры + предложения)
-        application.add_handler(
-            MessageHandler(filters.StatusUpdate.WEB_APP_DATA, suggestion_handler)
+            .post_shutdown(post_shutdown)
+            .concurrent_updates(update_processor)
         )
-
-        # Обработчик ошибок
-        application.add_error_handler(error_handler)
+        if BOT_MODE == 'webhook':
+            # Обновления приходят во встроенный сервер, Updater не нужен
+            builder = builder.updater(None)
+        application = builder.build()
+        register_handlers(application)
 
         # Запуск бота
         logger.info("🚀 Space Shooter Bot v2.0 запущен!")
         logger.info(f"📊 База данных: {db.db_name}")
         logger.info(f"🎮 URL игры: {GAME_URL}")
-
-        application.run_polling(
-            allowed_updates=Update.ALL_TYPES,
-            drop_pending_updates=True
-        )
+        logger.info(f"📡 Режим получения обновлений: {BOT_MODE}")
+
+        if BOT_MODE == 'webhook':
+            asyncio.run(run_webhook(
+                application,
+                webhook_url=WEBHOOK_URL,
+                path=WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET_TOKEN,
+                host=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                allowed_updates=ALLOWED_UPDATES
+            ))
+        else:
+            application.run_polling(
+                allowed_updates=ALLOWED_UPDATES,
+                drop_pending_updates=True
+            )
 
     except Exception as e:
         logger.error(f"❌ Критическая ошибка при запуске: {e}", exc_info=True)
@@ -0,0 +1,201 @@
+"""
+Sharded TTL cache for Space Shooter Bot
+Потокобезопасный кэш с вытеснением LRU+TTL, разбиением блокировок и метриками
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List
+
+from config import CACHE_MAX_ENTRIES, CACHE_SHARDS
+
+_MISSING = object()
+
+METRIC_NAMES = ('hits', 'misses', 'evictions', 'expirations', 'invalidations')
+
+
+class _Shard:
+    """Часть кэша со своей блокировкой и порядком LRU"""
+
+    __slots__ = ('lock', 'data', 'max_entries', 'generation', 'metrics')
+
+    def __init__(self, max_entries: int):
+        self.lock = threading.Lock()
+        # (namespace, key) -> (expires_at, value), от старых к новым
+        self.data: OrderedDict = OrderedDict()
+        self.max_entries = max_entries
+        # Растет при каждой инвалидации: защищает от записи устаревших данных
+        self.generation = 0
+        self.metrics: Dict[str, List[int]] = {}
+
+    def count(self, namespace: str, metric: int, amount: int = 1):
+        counters = self.metrics.get(namespace)
+        if counters is None:
+            counters = self.metrics[namespace] = [0] * len(METRIC_NAMES)
+        counters[metric] += amount
+
+
+HITS, MISSES, EVICTIONS, EXPIRATIONS, INVALIDATIONS = range(len(METRIC_NAMES))
+
+
+class ShardedTTLCache:
+    """Кэш, разбитый на шарды по хэшу ключа
+
+    Каждый шард — OrderedDict в порядке LRU со своей блокировкой, поэтому
+    потоки, работающие с разными ключами, почти не конкурируют.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, shards: int = CACHE_SHARDS):
+        per_shard = max(1, max_entries // shards)
+        self._shards = [_Shard(per_shard) for _ in range(shards)]
+        self._namespaces: Dict[str, 'CacheNamespace'] = {}
+
+    def namespace(self, name: str, ttl: float) -> 'CacheNamespace':
+        """Получить (или создать) пространство имен с заданным TTL"""
+        if name not in self._namespaces:
+            self._namespaces[name] = CacheNamespace(self, name, ttl)
+        return self._namespaces[name]
+
+    def _shard(self, full_key: tuple) -> _Shard:
+        return self._shards[hash(full_key) % len(self._shards)]
+
+    # ===== ОПЕРАЦИИ =====
+
+    def get(self, namespace: str, key: Hashable, default: Any = None) -> Any:
+        full_key = (namespace, key)
+        shard = self._shard(full_key)
+        with shard.lock:
+            entry = shard.data.get(full_key)
+            if entry is None:
+                shard.count(namespace, MISSES)
+                return default
+            if entry[0] <= time.monotonic():
+                del shard.data[full_key]
+                shard.count(namespace, EXPIRATIONS)
+                shard.count(namespace, MISSES)
+                return default
+            shard.data.move_to_end(full_key)
+            shard.count(namespace, HITS)
+            return entry[1]
+
+    def set(self, namespace: str, key: Hashable, value: Any, ttl: float, generation: int = None):
+        full_key = (namespace, key)
+        shard = self._shard(full_key)
+        now = time.monotonic()
+        with shard.lock:
+            if generation is not None and generation != shard.generation:
+                # Пока значение загружалось, ключ был инвалидирован
+                return
+            shard.data[full_key] = (now + ttl, value)
+            shard.data.move_to_end(full_key)
+            self._prune(shard, now)
+
+    def _prune(self, shard: _Shard, now: float):
+        """Удалить истекшие записи из начала LRU и вытеснить лишние"""
+        data = shard.data
+        while data:
+            full_key, (expires_at, _) = next(iter(data.items()))
+            if expires_at > now and len(data) <= shard.max_entries:
+                break
+            del data[full_key]
+            shard.count(full_key[0], EXPIRATIONS if expires_at <= now else EVICTIONS)
+
+    def generation(self, namespace: str, key: Hashable) -> int:
+        """Текущее поколение шарда ключа (для get_or_load)"""
+        return self._shard((namespace, key)).generation
+
+    def invalidate(self, namespace: str, key: Hashable):
+        full_key = (namespace, key)
+        shard = self._shard(full_key)
+        with shard.lock:
+            shard.generation += 1
+            if shard.data.pop(full_key, None) is not None:
+                shard.count(namespace, INVALIDATIONS)
+
+    def invalidate_namespace(self, namespace: str):
+        for shard in self._shards:
+            with shard.lock:
+                shard.generation += 1
+                stale = [full_key for full_key in shard.data if full_key[0] == namespace]
+                for full_key in stale:
+                    del shard.data[full_key]
+                shard.count(namespace, INVALIDATIONS, len(stale))
+
+    def clear(self):
+        for shard in self._shards:
+            with shard.lock:
+                shard.generation += 1
+                shard.data.clear()
+
+    def purge_expired(self) -> int:
+        """Удалить все истекшие записи (для периодической очистки)"""
+        removed = 0
+        now = time.monotonic()
+        for shard in self._shards:
+            with shard.lock:
+                expired = [k for k, (expires_at, _) in shard.data.items() if expires_at <= now]
+                for full_key in expired:
+                    del shard.data[full_key]
+                    shard.count(full_key[0], EXPIRATIONS)
+                removed += len(expired)
+        return removed
+
+    # ===== МЕТРИКИ =====
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        """Метрики по пространствам имен: попадания, промахи, вытеснения, размер"""
+        result = {name: dict.fromkeys(METRIC_NAMES + ('size',), 0) for name in self._namespaces}
+        for shard in self._shards:
+            with shard.lock:
+                for name, counters in shard.metrics.items():
+                    stats = result.setdefault(name, dict.fromkeys(METRIC_NAMES + ('size',), 0))
+                    for metric, value in zip(METRIC_NAMES, counters):
+                        stats[metric] += value
+                for name, _ in shard.data:
+                    result.setdefault(name, dict.fromkeys(METRIC_NAMES + ('size',), 0))['size'] += 1
+
+        for stats in result.values():
+            lookups = stats['hits'] + stats['misses']
+            stats['hit_ratio'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        return result
+
+
+class CacheNamespace:
+    """Пространство имен кэша со своим TTL"""
+
+    def __init__(self, cache: ShardedTTLCache, name: str, ttl: float):
+        self.cache = cache
+        self.name = name
+        self.ttl = ttl
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        return self.cache.get(self.name, key, default)
+
+    def set(self, key: Hashable, value: Any, generation: int = None):
+        """Записать значение; с generation — только если ключ не инвалидировали после чтения"""
+        self.cache.set(self.name, key, value, self.ttl, generation)
+
+    def generation(self, key: Hashable) -> int:
+        """Поколение ключа: берется до чтения из БД и передается в set"""
+        return self.cache.generation(self.name, key)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Вернуть значение из кэша или загрузить и закэшировать (None не кэшируется)"""
+        value = self.cache.get(self.name, key, _MISSING)
+        if value is not _MISSING:
+            return value
+        generation = self.generation(key)
+        value = loader()
+        if value is not None:
+            self.cache.set(self.name, key, value, self.ttl, generation)
+        return value
+
+    def invalidate(self, key: Hashable):
+        self.cache.invalidate(self.name, key)
+
+    def clear(self):
+        self.cache.invalidate_namespace(self.name)
+
+    def metrics(self) -> Dict[str, float]:
+        return self.cache.metrics().get(self.name, {})
@@ -0,0 +1,382 @@
+"""
+Compact storage layout for Space Shooter Bot (schema v2)
+Компактная схема: время игр в секундах эпохи, код сложности вместо строки, достижения WITHOUT ROWID
+
+games (самая большая таблица) хранит played_at как INTEGER (секунды UTC)
+вместо строки из 19 символов и difficulty как код из DIFFICULTY_CODES.
+AUTOINCREMENT сохраняется (это одна строка в sqlite_sequence): id игр не
+переиспользуются, на это опираются архив истории (отсев повторов по id) и
+аналитика (отметка по id). achievements переходит на WITHOUT ROWID с ключом
+(user_id, achievement_key): пропадают колонка id и отдельный уникальный индекс.
+
+Перенос идет онлайн: создаются таблицы games_v2 и achievements_v2,
+триггеры на старых таблицах зеркалируют в них новые записи, а существующие
+строки копируются пачками по id в коротких транзакциях. Прогресс хранится в
+schema_v2_progress, поэтому прерванный перенос продолжается с места
+остановки. Переключение (удаление старых таблиц и переименование новых)
+выполняет миграция 3 при запуске бота новой версии — к этому моменту
+остается докопировать только хвост.
+
+Запуск при работающем боте старой версии:
+    python compact_schema.py --db space_shooter.db
+Отчет «до/после» на копии базы:
+    python compact_schema.py --db copy.db --finish --report
+"""
+
+import argparse
+import logging
+import random
+import sqlite3
+import time
+from typing import Dict, Optional
+
+from config import DIFFICULTY_CODES
+
+logger = logging.getLogger(__name__)
+
+# Секунды эпохи по умолчанию (unixepoch() есть только с SQLite 3.38)
+EPOCH_NOW = "(CAST(strftime('%s', 'now') AS INTEGER))"
+
+GAMES_V2 = f'''
+    CREATE TABLE IF NOT EXISTS games_v2 (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        score INTEGER,
+        level INTEGER,
+        difficulty INTEGER NOT NULL DEFAULT 0,
+        duration_seconds INTEGER DEFAULT 0,
+        enemies_killed INTEGER DEFAULT 0,
+        accuracy_percent REAL DEFAULT 0,
+        played_at INTEGER NOT NULL DEFAULT {EPOCH_NOW},
+        FOREIGN KEY (user_id) REFERENCES users (user_id)
+    )
+'''
+
+ACHIEVEMENTS_V2 = f'''
+    CREATE TABLE IF NOT EXISTS achievements_v2 (
+        user_id INTEGER NOT NULL,
+        achievement_key TEXT NOT NULL,
+        unlocked_at INTEGER NOT NULL DEFAULT {EPOCH_NOW},
+        PRIMARY KEY (user_id, achievement_key),
+        FOREIGN KEY (user_id) REFERENCES users (user_id)
+    ) WITHOUT ROWID
+'''
+
+# Индексы новых таблиц (создаются после переименования; имена как в миграции 2)
+INDEXES_V2 = (
+    'CREATE INDEX IF NOT EXISTS idx_games_user_played ON games(user_id, played_at DESC)',
+    'CREATE INDEX IF NOT EXISTS idx_games_score ON games(score DESC)',
+    'CREATE INDEX IF NOT EXISTS idx_games_played_at ON games(played_at DESC)',
+    # Ключ (user_id, achievement_key) входит в индекс WITHOUT ROWID таблицы: индекс покрывающий
+    'CREATE INDEX IF NOT EXISTS idx_achievements_user_unlocked ON achievements(user_id, unlocked_at DESC)',
+)
+
+
+def _epoch(column: str) -> str:
+    """SQL: строковое время CURRENT_TIMESTAMP -> секунды эпохи"""
+    return f"COALESCE(CAST(strftime('%s', {column}) AS INTEGER), 0)"
+
+
+def _difficulty_code(column: str) -> str:
+    """SQL: имя сложности -> код из DIFFICULTY_CODES"""
+    cases = ' '.join(f"WHEN '{name}' THEN {code}" for name, code in DIFFICULTY_CODES.items())
+    return f"CASE {column} {cases} ELSE 0 END"
+
+
+# Таблица -> (новая таблица, колонки новой таблицы, выражения над строкой старой таблицы)
+GAME_COLUMNS = ('id', 'user_id', 'score', 'level', 'difficulty', 'duration_seconds',
+                'enemies_killed', 'accuracy_percent', 'played_at')
+ACHIEVEMENT_COLUMNS = ('user_id', 'achievement_key', 'unlocked_at')
+
+
+def _game_values(row: str) -> str:
+    return ', '.join(
+        _epoch(f'{row}.played_at') if column == 'played_at'
+        else _difficulty_code(f'{row}.difficulty') if column == 'difficulty'
+        else f'{row}.{column}'
+        for column in GAME_COLUMNS
+    )
+
+
+def _achievement_values(row: str) -> str:
+    return f"{row}.user_id, {row}.achievement_key, {_epoch(f'{row}.unlocked_at')}"
+
+
+TABLES = {
+    'games': ('games_v2', GAME_COLUMNS, _game_values),
+    'achievements': ('achievements_v2', ACHIEVEMENT_COLUMNS, _achievement_values),
+}
+
+# Триггеры на старых таблицах: новые записи сразу попадают в новые таблицы
+TRIGGERS = (
+    f'''CREATE TRIGGER IF NOT EXISTS games_v2_insert AFTER INSERT ON games BEGIN
+        INSERT OR REPLACE INTO games_v2 ({', '.join(GAME_COLUMNS)}) VALUES ({_game_values('NEW')});
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS games_v2_update AFTER UPDATE ON games BEGIN
+        DELETE FROM games_v2 WHERE id = OLD.id;
+        INSERT OR REPLACE INTO games_v2 ({', '.join(GAME_COLUMNS)}) VALUES ({_game_values('NEW')});
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS games_v2_delete AFTER DELETE ON games BEGIN
+        DELETE FROM games_v2 WHERE id = OLD.id;
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS achievements_v2_insert AFTER INSERT ON achievements BEGIN
+        INSERT OR REPLACE INTO achievements_v2 ({', '.join(ACHIEVEMENT_COLUMNS)})
+        VALUES ({_achievement_values('NEW')});
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS achievements_v2_update AFTER UPDATE ON achievements BEGIN
+        DELETE FROM achievements_v2 WHERE user_id = OLD.user_id AND achievement_key = OLD.achievement_key;
+        INSERT OR REPLACE INTO achievements_v2 ({', '.join(ACHIEVEMENT_COLUMNS)})
+        VALUES ({_achievement_values('NEW')});
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS achievements_v2_delete AFTER DELETE ON achievements BEGIN
+        DELETE FROM achievements_v2 WHERE user_id = OLD.user_id AND achievement_key = OLD.achievement_key;
+    END''',
+)
+
+
+def is_compact(conn: sqlite3.Connection) -> bool:
+    """БД уже в компактной схеме (games.played_at хранится как INTEGER)"""
+    columns = {row[1]: row[2].upper() for row in conn.execute('PRAGMA table_info(games)')}
+    return columns.get('played_at') == 'INTEGER'
+
+
+class CompactMigration:
+    """Возобновляемый перенос games и achievements в компактную схему"""
+
+    def __init__(self, conn: sqlite3.Connection, chunk_rows: int = 20000, pause_ms: float = 0):
+        self.conn = conn
+        self.chunk_rows = chunk_rows
+        self.pause = pause_ms / 1000
+
+    def prepare(self) -> bool:
+        """Создать новые таблицы, триггеры и прогресс. False, если переносить нечего"""
+        if is_compact(self.conn):
+            return False
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            self.conn.execute(GAMES_V2)
+            self.conn.execute(ACHIEVEMENTS_V2)
+            for trigger in TRIGGERS:
+                self.conn.execute(trigger)
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS schema_v2_progress (
+                    table_name TEXT PRIMARY KEY,
+                    last_id INTEGER NOT NULL
+                )
+            ''')
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO schema_v2_progress (table_name, last_id) VALUES (?, 0)',
+                [(table,) for table in TABLES]
+            )
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return True
+
+    def progress(self) -> Dict[str, Dict[str, int]]:
+        """Скопировано/всего строк по таблицам"""
+        result = {}
+        for table, (target, _, _) in TABLES.items():
+            last_id = self.conn.execute(
+                'SELECT last_id FROM schema_v2_progress WHERE table_name = ?', (table,)
+            ).fetchone()[0]
+            result[table] = {
+                'copied': self.conn.execute(f'SELECT COUNT(*) FROM {table} WHERE id <= ?', (last_id,)).fetchone()[0],
+                'total': self.conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0],
+            }
+        return result
+
+    def _copy_chunk(self, table: str) -> int:
+        """Скопировать следующую пачку строк по id (внутри уже открытой транзакции)"""
+        target, columns, values = TABLES[table]
+        last_id = self.conn.execute(
+            'SELECT last_id FROM schema_v2_progress WHERE table_name = ?', (table,)
+        ).fetchone()[0]
+        bound = self.conn.execute(
+            f'SELECT MAX(id) FROM (SELECT id FROM {table} WHERE id > ? ORDER BY id LIMIT ?)',
+            (last_id, self.chunk_rows)
+        ).fetchone()[0]
+        if bound is None:
+            return 0
+        # Строки, уже записанные триггерами, не перезаписываются
+        cursor = self.conn.execute(f'''
+            INSERT OR IGNORE INTO {target} ({', '.join(columns)})
+            SELECT {values(table)} FROM {table} WHERE id > ? AND id <= ?
+        ''', (last_id, bound))
+        self.conn.execute(
+            'UPDATE schema_v2_progress SET last_id = ? WHERE table_name = ?', (bound, table)
+        )
+        return max(cursor.rowcount, 1)
+
+    def copy(self) -> int:
+        """Скопировать все строки короткими транзакциями с паузами между ними"""
+        copied = 0
+        for table in TABLES:
+            while True:
+                self.conn.execute('BEGIN IMMEDIATE')
+                try:
+                    rows = self._copy_chunk(table)
+                    self.conn.commit()
+                except Exception:
+                    self.conn.rollback()
+                    raise
+                if not rows:
+                    break
+                copied += rows
+                if self.pause:
+                    # Пауза: запись бота не ждет блокировку подолгу
+                    time.sleep(self.pause)
+        return copied
+
+    def finish(self):
+        """Докопировать хвост и заменить старые таблицы новыми (одна транзакция)"""
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            for table in TABLES:
+                while self._copy_chunk(table):
+                    pass
+            # Последний выданный id старой games может быть больше MAX(id) (удаленные строки)
+            sequence = self.conn.execute(
+                "SELECT seq FROM sqlite_sequence WHERE name = 'games'"
+            ).fetchone()
+            for table, (target, _, _) in TABLES.items():
+                # Вместе с таблицей удаляются её индексы и триггеры
+                self.conn.execute(f'DROP TABLE {table}')
+                self.conn.execute(f'ALTER TABLE {target} RENAME TO {table}')
+            for sql in INDEXES_V2:
+                self.conn.execute(sql)
+            if sequence:
+                set_games_sequence(self.conn, sequence[0])
+            self.conn.execute('DROP TABLE schema_v2_progress')
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def run(self) -> bool:
+        """Полный перенос: подготовка, копирование, переключение"""
+        if not self.prepare():
+            return False
+        copied = self.copy()
+        self.finish()
+        logger.info(f"✅ Компактная схема: перенесено строк {copied}")
+        return True
+
+
+def set_games_sequence(conn: sqlite3.Connection, min_id: int):
+    """Следующий id games будет больше min_id (и больше уже выданных)"""
+    current = conn.execute(
+        "SELECT MAX(COALESCE((SELECT MAX(id) FROM games), 0), "
+        "COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'games'), 0))"
+    ).fetchone()[0]
+    conn.execute("DELETE FROM sqlite_sequence WHERE name = 'games'")
+    conn.execute(
+        "INSERT INTO sqlite_sequence (name, seq) VALUES ('games', ?)", (max(current, min_id),)
+    )
+
+
+# ===== ОТЧЕТ =====
+
+def _table_sizes(conn: sqlite3.Connection) -> Optional[Dict[str, int]]:
+    """Байт на таблицу вместе с её индексами (нужен модуль dbstat)"""
+    try:
+        rows = conn.execute('''
+            SELECT m.tbl_name, SUM(s.pgsize)
+            FROM dbstat s JOIN sqlite_master m ON m.name = s.name
+            GROUP BY m.tbl_name
+        ''').fetchall()
+    except sqlite3.OperationalError:
+        return None
+    return dict(rows)
+
+
+def _timed(conn: sqlite3.Connection, sql: str, params_list) -> float:
+    """Медиана времени запроса, мс"""
+    timings = []
+    for params in params_list:
+        started = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def measure(conn: sqlite3.Connection, samples: int = 200, seed: int = 1) -> Dict[str, float]:
+    """Размер БД и время типичных запросов к games и achievements"""
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    used_pages = conn.execute('PRAGMA page_count').fetchone()[0] - conn.execute('PRAGMA freelist_count').fetchone()[0]
+    result = {'db_mb': used_pages * page_size / 1024 / 1024}
+    for table, size in (_table_sizes(conn) or {}).items():
+        if table in TABLES:
+            result[f'{table}_mb'] = size / 1024 / 1024
+
+    rng = random.Random(seed)
+    max_user = conn.execute('SELECT MAX(user_id) FROM users').fetchone()[0] or 1
+    users = [(rng.randint(1, max_user),) for _ in range(samples)]
+    week_ago = time.time() - 7 * 86400
+    since = int(week_ago) if is_compact(conn) else time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(week_ago))
+
+    result['recent_games_ms'] = _timed(conn, '''
+        SELECT score, level, difficulty, played_at FROM games
+        WHERE user_id = ? ORDER BY played_at DESC LIMIT 5
+    ''', users)
+    result['achievements_ms'] = _timed(conn, '''
+        SELECT achievement_key FROM achievements WHERE user_id = ? ORDER BY unlocked_at DESC
+    ''', users)
+    result['games_7d_ms'] = _timed(conn, 'SELECT COUNT(*), AVG(score) FROM games WHERE played_at > ?',
+                                   [(since,)] * 5)
+    result['by_difficulty_ms'] = _timed(conn, 'SELECT difficulty, COUNT(*) FROM games GROUP BY difficulty',
+                                        [()] * 3)
+    return result
+
+
+def print_report(before: Dict[str, float], after: Dict[str, float]):
+    print(f"\n{'показатель':<20} {'до':>10} {'после':>10} {'изменение':>10}")
+    for key, old in before.items():
+        new = after.get(key)
+        if new is None:
+            continue
+        change = f"{(new - old) / old:+.0%}" if old else '—'
+        print(f"{key:<20} {old:>10.2f} {new:>10.2f} {change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--db', default='space_shooter.db')
+    parser.add_argument('--chunk', type=int, default=20000, help='строк в одной транзакции копирования')
+    parser.add_argument('--pause-ms', type=float, default=20, help='пауза между транзакциями')
+    parser.add_argument('--finish', action='store_true',
+                        help='сразу переключиться на новые таблицы (только при остановленном боте старой версии)')
+    parser.add_argument('--report', action='store_true', help='размер и скорость запросов до и после (с --finish)')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    conn = sqlite3.connect(args.db, timeout=30, isolation_level=None)
+    conn.execute('PRAGMA journal_mode = WAL')
+
+    before = measure(conn) if args.report else None
+    migration = CompactMigration(conn, args.chunk, args.pause_ms)
+    if not migration.prepare():
+        print("ℹ️ База уже в компактной схеме")
+        return
+
+    started = time.perf_counter()
+    copied = migration.copy()
+    print(f"✅ Скопировано строк: {copied} за {time.perf_counter() - started:.1f} с")
+    for table, state in migration.progress().items():
+        print(f"  {table}: {state['copied']}/{state['total']}")
+
+    if args.finish:
+        migration.finish()
+        conn.execute('PRAGMA optimize')
+        print("✅ Таблицы переключены на компактную схему")
+        if before:
+            print_report(before, measure(conn))
+    else:
+        print("ℹ️ Переключение выполнит миграция 3 при запуске бота новой версии")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
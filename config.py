@@ -14,16 +14,76 @@ BOT_TOKEN =  "7797093049:AAG_IQXcjs-_hyVVPzs_QO3x2KSahccG1-o"
 # ВАЖНО: Замените на URL вашей игры
 GAME_URL = "https://vladzah403.github.io/space-shooter-game/"
 
+# ===== РЕЖИМ ПОЛУЧЕНИЯ ОБНОВЛЕНИЙ =====
+# "polling" — long polling, "webhook" — встроенный HTTP-сервер
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")            # публичный https-адрес, например https://example.com/telegram
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN", "")
+# Бот обрабатывает только сообщения (команды, данные WebApp) и нажатия кнопок
+ALLOWED_UPDATES = ["message", "callback_query"]
+# Обновления разных игроков обрабатываются параллельно, одного игрока — по очереди
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "32"))
+
 # ===== НАСТРОЙКИ БАЗЫ ДАННЫХ =====
 DATABASE_NAME = os.getenv("DATABASE_NAME", "space_shooter.db")
 DB_BACKUP_ENABLED = True
 DB_BACKUP_INTERVAL_HOURS = 24
+DB_BACKUP_DIR = os.getenv("DB_BACKUP_DIR", "backups")
+DB_BACKUP_KEEP = 7              # сколько последних копий хранить (0 — не удалять)
+DB_BACKUP_COMPRESSION = os.getenv("DB_BACKUP_COMPRESSION", "gzip")  # "gzip", "zstd" (пакет zstandard) или "none"
+DB_BACKUP_PAGES_PER_STEP = 1024 # страниц БД за один шаг копирования
+DB_BACKUP_STEP_SLEEP_MS = 20    # пауза между шагами, чтобы не мешать записи
+DB_BACKUP_MAX_RESTARTS = 5      # перезапусков из-за записи, после которых копия снимается за один проход
+DB_POOL_SIZE = 1                # потоков для запросов к БД (1 = выделенный поток БД)
+
+# Профиль соединений SQLite: "durable" (максимальная надежность) или "throughput"
+DB_PROFILE = os.getenv("DB_PROFILE", "throughput")
+DB_PROFILES = {
+    'durable': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'cache_size': -2000,            # KiB (отрицательное значение)
+        'temp_store': 'DEFAULT',
+        'mmap_size': 0,
+        'cached_statements': 128,
+    },
+    'throughput': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -64000,           # 64 MiB
+        'temp_store': 'MEMORY',
+        'mmap_size': 256 * 1024 * 1024,
+        'cached_statements': 512,
+    },
+}
+
+# Пакетная запись результатов игр (write-behind)
+DB_WRITE_BATCHING = True
+DB_WRITE_QUEUE_SIZE = 1000      # максимум игр в очереди
+DB_BATCH_MAX_ROWS = 200         # максимум игр в одной транзакции
+DB_BATCH_FLUSH_MS = 50          # максимальная задержка записи
+
+# История игр: старые месяцы переносятся из games в архивные БД (по файлу на месяц)
+HISTORY_HOT_DAYS = 90           # игры моложе этого срока остаются в основной БД
+HISTORY_ARCHIVE_DIR = os.getenv("HISTORY_ARCHIVE_DIR", "archive")
+HISTORY_ARCHIVE_INTERVAL_HOURS = 24
+HISTORY_ARCHIVE_CHUNK = 2000    # игр в одной транзакции переноса
+
+# Аналитика для отчетов администратора (нужен пакет numpy)
+ANALYTICS_CACHE_DIR = os.getenv("ANALYTICS_CACHE_DIR", "analytics_cache")  # колонки games в .npy
+ANALYTICS_CHUNK_ROWS = 65536    # строк в одном fetchmany
+ANALYTICS_SCORE_BINS = 20       # корзин гистограммы счета
 
 # ===== НАСТРОЙКИ ЛОГИРОВАНИЯ =====
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
-LOG_FILE = "bot.log"
+LOG_FILE = os.getenv("LOG_FILE", "bot.log")
 LOG_MAX_BYTES = 10 * 1024 * 1024  # 10MB
 LOG_BACKUP_COUNT = 5
+LOG_SESSIONS_FILE = os.getenv("LOG_SESSIONS_FILE", "")             # JSON Lines сессий ("" — выключено)
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))       # доля частых INFO-событий в логе
 
 # ===== ИГРОВЫЕ НАСТРОЙКИ =====
 @dataclass
@@ -72,78 +132,175 @@ DIFFICULTIES = {
     )
 }
 
+# Коды сложностей в таблице games (0 — неизвестная сложность).
+# Коды хранятся в БД: новые сложности получают новые коды, старые не меняются.
+DIFFICULTY_CODES = {'easy': 1, 'normal': 2, 'hard': 3, 'nightmare': 4}
+DIFFICULTY_NAMES = {code: name for name, code in DIFFICULTY_CODES.items()}
+
+# ===== ДАННЫЕ ИЗ WEB APP =====
+# Допустимые диапазоны полей результата игры: значения вне диапазона обрезаются
+PAYLOAD_LIMITS = {
+    'score': (0, 10_000_000),
+    'level': (1, 1_000),
+    'duration_seconds': (0, 24 * 3600),
+    'enemies_killed': (0, 1_000_000),
+    'accuracy_percent': (0.0, 100.0),
+    'bosses_killed': (0, 10_000),
+    'level_delta': (0, 65535),          # секунд на уровень (хранится как uint16)
+}
+PAYLOAD_MAX_BYTES = 4096                # Telegram не присылает web_app_data длиннее
+PAYLOAD_MAX_LEVEL_DELTAS = 1_000
+
+# Категории предложений по игре
+SUGGESTION_CATEGORIES = {
+    'gameplay': '🎮 Геймплей',
+    'balance': '⚖️ Баланс',
+    'graphics': '🎨 Графика',
+    'music': '🎵 Музыка',
+    'bug': '🐛 Баг-репорт',
+    'general': '💡 Общее'
+}
+SUGGESTION_MAX_LENGTH = 1000
+
+# ===== ПРОВЕРКА ПРАВДОПОДОБИЯ РЕЗУЛЬТАТОВ =====
+# Неправдоподобные результаты попадают в quarantined_games, а не в рейтинг
+PLAUSIBILITY_ENABLED = True
+PLAUSIBILITY_REFRESH_MINUTES = 30       # как часто пересчитывать распределения по games
+PLAUSIBILITY_SAMPLE_GAMES = 50_000      # последних игр в выборке
+PLAUSIBILITY_MIN_SAMPLES = 200          # меньше игр сложности — используются лимиты по умолчанию
+PLAUSIBILITY_QUANTILE = 0.999           # квантиль распределения, от которого считается порог
+PLAUSIBILITY_MARGIN = 2.0               # порог = квантиль * запас
+PLAUSIBILITY_SAFE_QUANTILE = 0.5        # счет не выше этого квантиля принимается без проверок отношений
+PLAUSIBILITY_MIN_LEVEL_SECONDS = 3      # быстрее уровень пройти нельзя
+PLAUSIBILITY_DURATION_SLACK = 30        # допуск между суммой level_deltas и duration_seconds, секунд
+# Лимиты до накопления статистики (очки нормированы на score_multiplier сложности)
+PLAUSIBILITY_DEFAULT_LIMITS = {
+    'points_per_second': 2000.0,        # очков в секунду игры
+    'points_per_kill': 3000.0,          # очков на (врагов + 1) и уровень
+    'safe_score': 1000,
+}
+
 # ===== НАСТРОЙКИ ДОСТИЖЕНИЙ =====
+# Условие достижения: field >= threshold (или field <= threshold при lower_is_better).
+# bit — номер бита в user_stats.achievement_mask: у новых достижений только новые биты.
 ACHIEVEMENTS = {
     'first_blood': {
         'name': 'Первая кровь',
         'emoji': '🎯',
         'description': 'Сыграть первую игру',
-        'condition': lambda stats: stats['games_played'] >= 1
+        'bit': 0,
+        'field': 'games_played',
+        'threshold': 1
     },
     'veteran': {
         'name': 'Ветеран',
         'emoji': '🎖️',
         'description': 'Сыграть 50 игр',
-        'condition': lambda stats: stats['games_played'] >= 50
+        'bit': 1,
+        'field': 'games_played',
+        'threshold': 50
     },
     'centurion': {
         'name': 'Центурион',
         'emoji': '💯',
         'description': 'Сыграть 100 игр',
-        'condition': lambda stats: stats['games_played'] >= 100
+        'bit': 2,
+        'field': 'games_played',
+        'threshold': 100
     },
     'high_scorer': {
         'name': 'Высокий счет',
         'emoji': '⭐',
         'description': 'Набрать 1000 очков',
-        'condition': lambda stats: stats['best_score'] >= 1000
+        'bit': 3,
+        'field': 'best_score',
+        'threshold': 1000
     },
     'master': {
         'name': 'Мастер',
         'emoji': '🏆',
         'description': 'Набрать 5000 очков',
-        'condition': lambda stats: stats['best_score'] >= 5000
+        'bit': 4,
+        'field': 'best_score',
+        'threshold': 5000
     },
     'legend': {
         'name': 'Легенда',
         'emoji': '👑',
         'description': 'Набрать 10000 очков',
-        'condition': lambda stats: stats['best_score'] >= 10000
+        'bit': 5,
+        'field': 'best_score',
+        'threshold': 10000
     },
     'level_10': {
         'name': 'Уровень 10',
         'emoji': '🔟',
         'description': 'Достичь 10 уровня',
-        'condition': lambda stats: stats['max_level'] >= 10
+        'bit': 6,
+        'field': 'max_level',
+        'threshold': 10
     },
     'nightmare_survivor': {
         'name': 'Выживший кошмар',
         'emoji': '💀',
         'description': 'Пройти 10 игр на кошмаре',
-        'condition': lambda stats: stats['nightmare_games'] >= 10
+        'bit': 7,
+        'field': 'nightmare_games',
+        'threshold': 10
     },
     'top_3': {
         'name': 'Топ 3',
         'emoji': '🥉',
         'description': 'Войти в топ 3 игроков',
-        'condition': lambda stats: stats.get('rank', 999) <= 3
+        'bit': 8,
+        'field': 'rank',
+        'threshold': 3,
+        'lower_is_better': True
     },
     'champion': {
         'name': 'Чемпион',
         'emoji': '🥇',
         'description': 'Стать первым в рейтинге',
-        'condition': lambda stats: stats.get('rank', 999) == 1
+        'bit': 9,
+        'field': 'rank',
+        'threshold': 1,
+        'lower_is_better': True
     }
 }
 
 # ===== НАСТРОЙКИ РЕЙТИНГА =====
 LEADERBOARD_SIZE = 10
 LEADERBOARD_CACHE_SECONDS = 60
+GLOBAL_STATS_RECONCILE_HOURS = 24   # сверка global_counters с таблицей games
+
+# Перцентили лучшего счета ("лучше, чем у X% игроков"), см. score_percentiles.py
+PERCENTILE_BUCKET_START = 100       # верхняя граница первой корзины [0, 100)
+PERCENTILE_BUCKET_GROWTH = 1.1      # каждая следующая корзина шире на 10%
+PERCENTILE_BRACKETS = (50, 75, 90, 95, 99)  # пороги "лучше X% игроков" для "до следующей ступени"
+PERCENTILE_MIN_PLAYERS = 20         # меньше игроков — перцентиль не показывается
 
 # ===== НАСТРОЙКИ СТАТИСТИКИ =====
 RECENT_GAMES_LIMIT = 5
 STATS_CACHE_SECONDS = 30
 
+# ===== НАСТРОЙКИ КЭША =====
+CACHE_MAX_ENTRIES = 100_000     # суммарно по всем пространствам имен
+CACHE_SHARDS = 16               # число независимых блокировок
+CACHE_PURGE_SECONDS = 60        # периодическая очистка истекших записей
+USER_SEEN_FLUSH_SECONDS = 60    # пакетная запись last_seen пользователей
+USER_FINGERPRINT_SECONDS = 3600  # сколько помнить профиль пользователя без полного upsert
+
+# ===== МЕТРИКИ =====
+# Гистограммы задержек обработчиков и запросов к БД (Prometheus: GET /metrics)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0") == "1"
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+# ===== АДМИНИСТРАТОР =====
+# Получает предложения из игры и может вызывать служебные команды (/metrics).
+# Узнать свой ID: напиши боту @userinfobot
+ADMIN_CHAT_ID = int(os.getenv("ADMIN_CHAT_ID", "307592252"))
+
 # ===== НАСТРОЙКИ УВЕДОМЛЕНИЙ =====
 NOTIFY_NEW_RECORD = True
 NOTIFY_ACHIEVEMENT = True
@@ -218,6 +375,11 @@ class Messages:
 
     NEW_ACHIEVEMENT = "\n🎊 <b>Новое достижение:</b> {emoji} {name}\n{description}"
 
+    SCORE_PERCENTILE = "• Лучше, чем у <code>{percentile}%</code> игроков {scope}"
+    NEXT_BRACKET = "• До ступени «лучше {bracket}%»: <code>{points}</code> очков"
+
+    GAME_QUARANTINED = "⏳ Результат выглядит необычно и отправлен на проверку."
+
     ERROR_SAVE_GAME = "❌ Произошла ошибка при сохранении результата. Попробуйте еще раз."
     ERROR_GENERIC = "❌ Произошла ошибка. Пожалуйста, попробуйте позже."
 
@@ -234,6 +396,34 @@ def validate_config() -> tuple[bool, Optional[str]]:
     if not GAME_URL.startswith(('http://', 'https://')):
         return False, "GAME_URL должен начинаться с http:// или https://"
     
+    if BOT_MODE not in ('polling', 'webhook'):
+        return False, "BOT_MODE должен быть polling или webhook"
+    
+    if BOT_MODE == 'webhook' and not WEBHOOK_URL.startswith('https://'):
+        return False, "Для режима webhook укажите WEBHOOK_URL, начинающийся с https://"
+
+    if BOT_MODE == 'webhook' and not WEBHOOK_SECRET_TOKEN:
+        return False, "Для режима webhook укажите WEBHOOK_SECRET_TOKEN (иначе вебхук открыт для поддельных обновлений)"
+
+    if MAX_CONCURRENT_UPDATES < 1:
+        return False, "MAX_CONCURRENT_UPDATES должен быть не меньше 1"
+
+    missing_codes = set(DIFFICULTIES) - set(DIFFICULTY_CODES)
+    if missing_codes:
+        return False, f"Нет кода в DIFFICULTY_CODES для сложностей: {', '.join(sorted(missing_codes))}"
+
+    if not 0 < PLAUSIBILITY_SAFE_QUANTILE <= PLAUSIBILITY_QUANTILE < 1:
+        return False, "Нужно 0 < PLAUSIBILITY_SAFE_QUANTILE <= PLAUSIBILITY_QUANTILE < 1"
+
+    if PERCENTILE_BUCKET_START < 1 or PERCENTILE_BUCKET_GROWTH <= 1:
+        return False, "Нужно PERCENTILE_BUCKET_START >= 1 и PERCENTILE_BUCKET_GROWTH > 1"
+
+    if not all(0 < bracket < 100 for bracket in PERCENTILE_BRACKETS) or list(PERCENTILE_BRACKETS) != sorted(PERCENTILE_BRACKETS):
+        return False, "PERCENTILE_BRACKETS должны возрастать и лежать в (0, 100)"
+
+    if DB_BACKUP_COMPRESSION not in ('gzip', 'zstd', 'none'):
+        return False, "DB_BACKUP_COMPRESSION должен быть gzip, zstd или none"
+    
     return True, None
 
 
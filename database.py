@@ -6,35 +6,92 @@ Database module for Space Shooter Bot v2.0
 import sqlite3
 import logging
 import json
-from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Tuple
+from datetime import datetime
+from typing import Optional, List, Dict, Tuple, Iterable, Sequence
 from contextlib import contextmanager
+from dataclasses import dataclass, field
 from functools import lru_cache
 import threading
+import time
+
+from achievements import achievement_engine
+from cache import METRIC_NAMES, ShardedTTLCache
+from config import DATABASE_NAME, DIFFICULTY_CODES, DIFFICULTY_NAMES, HISTORY_HOT_DAYS, STATS_CACHE_SECONDS, LEADERBOARD_CACHE_SECONDS, LEADERBOARD_SIZE, PERCENTILE_MIN_PLAYERS, USER_FINGERPRINT_SECONDS
+from db_profile import connect, check_profile
+from history_archive import RECENT_COLUMNS, GameArchive
+from level_stats import UPSERT_LEVEL_TIMING, pack_level_deltas, timing_rows
+from leaderboard_index import LeaderboardIndex
+from logging_setup import SAMPLED
+from metrics import metrics
+from migrations import current_version, migrate
+from score_percentiles import OVERALL, UPSERT_DIFFICULTY_BEST, UPSERT_HISTOGRAM, ScoreHistogram, difficulty_code
 
 logger = logging.getLogger(__name__)
 
+# Сложности, для которых в user_stats есть счетчик <difficulty>_games
+DIFFICULTY_COLUMNS = ('easy', 'normal', 'hard', 'nightmare')
+
+# Игра с таким счетом считается победой и продлевает серию побед
+WIN_SCORE = 100
+
+# Цели ежедневных заданий
+DAILY_CHALLENGE_TARGETS = {'daily_score': 1000, 'daily_kills': 50}
+
 
 class DatabaseError(Exception):
     """Базовое исключение для ошибок БД"""
     pass
 
 
+# Части профиля, которые можно запросить через get_profile_bundle
+PROFILE_PARTS = ('stats', 'rank', 'recent_games', 'daily_challenges', 'achievements')
+
+
+@dataclass
+class ProfileBundle:
+    """Данные профиля игрока для экранов меню и статистики"""
+    stats: Optional[Dict] = None
+    rank: Optional[int] = None
+    recent_games: List[Dict] = field(default_factory=list)
+    daily_challenges: List[Dict] = field(default_factory=list)
+    achievements: List[str] = field(default_factory=list)
+
+
 class Database:
-    def __init__(self, db_name: str = "space_shooter.db"):
+    def __init__(self, db_name: str = DATABASE_NAME):
         """Инициализация базы данных с пулом соединений"""
         self.db_name = db_name
         self._local = threading.local()
         self.init_db()
-        self._cache_stats = {}
-        self._cache_expiry = {}
+        with self.get_connection() as conn:
+            self.pragmas = check_profile(conn)
+        self.cache = ShardedTTLCache()
+        self._stats_cache = self.cache.namespace('user_stats', STATS_CACHE_SECONDS)
+        self._achievements_cache = self.cache.namespace('achievements', STATS_CACHE_SECONDS)
+        self._daily_cache = self.cache.namespace('daily_challenges', STATS_CACHE_SECONDS)
+        self._top_cache = self.cache.namespace('top_players', LEADERBOARD_CACHE_SECONDS)
+        # Растет, когда меняется состав или порядок топа LEADERBOARD_SIZE
+        self.leaderboard_version = 0
+        # Отпечатки профилей (LRU+TTL) и отложенные обновления last_seen (см. touch_user)
+        self._seen_lock = threading.Lock()
+        self._fingerprint_cache = self.cache.namespace('user_fingerprints', USER_FINGERPRINT_SECONDS)
+        self._pending_seen: Dict[int, str] = {}
+        self.rank_index = LeaderboardIndex()
+        self._load_rank_index()
+        # Перцентили лучшего счета (см. score_percentiles.py)
+        self.score_histogram = ScoreHistogram()
+        self._load_score_histogram()
+        # Старые месяцы истории игр (см. archive_old_games)
+        self.archive = GameArchive()
+        metrics.instrument_methods(self, 'database', exclude=('get_connection',))
+        metrics.add_collector(self._cache_metrics)
         logger.info(f"✅ База данных инициализирована: {db_name}")
     
     @contextmanager
     def get_connection(self):
         """Контекстный менеджер для безопасной работы с БД"""
         if not hasattr(self._local, 'conn'):
-            self._local.conn = sqlite3.connect(
+            self._local.conn = connect(
                 self.db_name,
                 check_same_thread=False,
                 timeout=10.0
@@ -49,134 +106,75 @@ class Database:
             raise DatabaseError(f"Database error: {e}")
     
     def init_db(self):
-        """Создание таблиц в базе данных"""
+        """Создание и обновление схемы БД (см. migrations.py)"""
+        with self.get_connection() as conn:
+            migrate(conn)
+            logger.info(f"✅ Схема БД версии {current_version(conn)}")
+        
+        # Первичное заполнение счетчиков для существующей БД
+        with self.get_connection() as conn:
+            has_counters = conn.execute('SELECT 1 FROM global_counters WHERE id = 1').fetchone()
+        if not has_counters:
+            self.rebuild_global_counters()
+    
+    def _load_rank_index(self):
+        """Построить индекс рейтинга из таблицы user_stats"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            
-            # Таблица пользователей
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    language_code TEXT DEFAULT 'ru',
-                    is_premium INTEGER DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Таблица игр
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS games (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    score INTEGER,
-                    level INTEGER,
-                    difficulty TEXT,
-                    duration_seconds INTEGER DEFAULT 0,
-                    enemies_killed INTEGER DEFAULT 0,
-                    accuracy_percent REAL DEFAULT 0,
-                    played_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            ''')
-            
-            # Индексы для быстрого поиска
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_games_user_id 
-                ON games(user_id)
-            ''')
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_games_score 
-                ON games(score DESC)
-            ''')
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_games_played_at 
-                ON games(played_at DESC)
-            ''')
-            
-            # Таблица статистики (денормализованная для производительности)
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_stats (
-                    user_id INTEGER PRIMARY KEY,
-                    best_score INTEGER DEFAULT 0,
-                    max_level INTEGER DEFAULT 0,
-                    games_played INTEGER DEFAULT 0,
-                    total_score INTEGER DEFAULT 0,
-                    total_playtime_seconds INTEGER DEFAULT 0,
-                    total_enemies_killed INTEGER DEFAULT 0,
-                    avg_accuracy REAL DEFAULT 0,
-                    easy_games INTEGER DEFAULT 0,
-                    normal_games INTEGER DEFAULT 0,
-                    hard_games INTEGER DEFAULT 0,
-                    nightmare_games INTEGER DEFAULT 0,
-                    win_streak INTEGER DEFAULT 0,
-                    best_win_streak INTEGER DEFAULT 0,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            ''')
-            
-            # Таблица достижений
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS achievements (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    achievement_key TEXT,
-                    unlocked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(user_id, achievement_key),
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_achievements_user_id 
-                ON achievements(user_id)
-            ''')
-            
-            # Таблица ежедневных заданий
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS daily_challenges (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    challenge_type TEXT,
-                    target_value INTEGER,
-                    current_value INTEGER DEFAULT 0,
-                    completed INTEGER DEFAULT 0,
-                    reward_claimed INTEGER DEFAULT 0,
-                    date DATE DEFAULT (date('now')),
-                    UNIQUE(user_id, challenge_type, date),
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            ''')
-            
-            # Таблица сессий (для аналитики)
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS sessions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    ended_at TIMESTAMP,
-                    games_count INTEGER DEFAULT 0,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            ''')
-            
-            conn.commit()
-            logger.info("✅ Все таблицы созданы успешно")
+            cursor.execute('SELECT user_id, best_score, games_played FROM user_stats')
+            self.rank_index.rebuild(cursor.fetchall())
+        logger.info(f"✅ Индекс рейтинга построен: {len(self.rank_index)} игроков")
+    
+    def _load_score_histogram(self):
+        """Загрузить гистограмму лучшего счета; построить заново, если она не сходится с БД"""
+        with self.get_connection() as conn:
+            rows = conn.execute('SELECT difficulty, floor, players FROM score_histogram').fetchall()
+            players = conn.execute('SELECT total_users FROM global_counters WHERE id = 1').fetchone()
+        # Игроков с играми (total_users) должно быть столько же, сколько в общей гистограмме
+        if not self.score_histogram.load(rows) or self.score_histogram.total(OVERALL) != (players[0] if players else 0):
+            logger.warning("⚠️ Гистограмма лучшего счета не сходится с БД, строится заново")
+            self.rebuild_score_histogram()
+            return
+        logger.info(f"✅ Гистограмма лучшего счета загружена: {self.score_histogram.total(OVERALL)} игроков")
     
     def _invalidate_cache(self, user_id: int = None):
         """Инвалидация кэша"""
         if user_id:
-            cache_key = f"stats_{user_id}"
-            if cache_key in self._cache_stats:
-                del self._cache_stats[cache_key]
-                del self._cache_expiry[cache_key]
+            self._stats_cache.invalidate(user_id)
+            self._achievements_cache.invalidate(user_id)
+            self._daily_cache.invalidate((user_id, datetime.now().date()))
         else:
-            self._cache_stats.clear()
-            self._cache_expiry.clear()
+            self.cache.clear()
+    
+    @staticmethod
+    def _begin_immediate(cursor, operation: str):
+        """BEGIN IMMEDIATE с замером ожидания блокировки записи"""
+        started = time.perf_counter()
+        cursor.execute('BEGIN IMMEDIATE')
+        metrics.observe('bot_db_lock_wait_seconds', (operation,), time.perf_counter() - started)
+    
+    def _cache_metrics(self):
+        """Метрики кэша по пространствам имен (коллектор для /metrics)"""
+        stats = self.cache.metrics()
+        samples = [
+            (f'bot_cache_{name}_total', 'counter', f'Кэш: {name}',
+             [({'namespace': namespace}, values[name]) for namespace, values in stats.items()])
+            for name in METRIC_NAMES
+        ]
+        samples.append(('bot_cache_entries', 'gauge', 'Записей в кэше',
+                        [({'namespace': namespace}, values['size']) for namespace, values in stats.items()]))
+        samples.append(('bot_cache_hit_ratio', 'gauge', 'Доля попаданий в кэш',
+                        [({'namespace': namespace}, values['hit_ratio']) for namespace, values in stats.items()]))
+        return samples
+    
+    def reload(self):
+        """Перечитать производные данные после записи в файл БД в обход Database
+        (массовая загрузка, восстановление из резервной копии)"""
+        self._load_rank_index()
+        self.rebuild_global_counters()
+        self.rebuild_score_histogram()
+        self._invalidate_cache()
+        self.leaderboard_version += 1
     
     def add_user(self, user_id: int, username: str = None, 
                  first_name: str = None, last_name: str = None,
@@ -196,232 +194,506 @@ class Database:
                         language_code = excluded.language_code,
                         is_premium = excluded.is_premium,
                         last_seen = CURRENT_TIMESTAMP
-                ''', (user_id, username, first_name, last_name, language_code, int(is_premium)))
+                ''', (user_id, username, first_name, last_name, language_code, int(bool(is_premium))))
                 
                 # Создать запись статистики если её нет
                 cursor.execute('''
                     INSERT OR IGNORE INTO user_stats (user_id)
                     VALUES (?)
                 ''', (user_id,))
+                stats_created = cursor.rowcount > 0
                 
                 conn.commit()
-                logger.info(f"✅ Пользователь {user_id} добавлен/обновлен")
+                
+                if stats_created:
+                    self.rank_index.update(user_id, 0, 0)
+                logger.info("✅ Пользователь %s добавлен/обновлен", user_id, extra=SAMPLED)
                 return True
             except Exception as e:
                 logger.error(f"❌ Ошибка добавления пользователя: {e}")
                 return False
     
+    def touch_user(self, user_id: int, username: str = None,
+                   first_name: str = None, last_name: str = None,
+                   language_code: str = 'ru', is_premium: bool = False) -> bool:
+        """Зарегистрировать активность пользователя
+        
+        Полный upsert выполняется, только если профиль изменился с прошлого
+        раза (или отпечаток вытеснен из кэша); иначе last_seen откладывается
+        до flush_last_seen.
+        """
+        fingerprint = hash((username, first_name, last_name, language_code, bool(is_premium)))
+        with self._seen_lock:
+            if self._fingerprint_cache.get(user_id) == fingerprint:
+                self._pending_seen[user_id] = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+                return True
+        
+        if not self.add_user(user_id, username, first_name, last_name, language_code, is_premium):
+            return False
+        with self._seen_lock:
+            self._fingerprint_cache.set(user_id, fingerprint)
+            self._pending_seen.pop(user_id, None)
+        return True
+    
+    def flush_last_seen(self) -> int:
+        """Записать накопленные last_seen одной транзакцией
+        
+        Если строки пользователя уже нет (удалена cleanup_inactive_users, в том
+        числе из другого процесса), его отпечаток сбрасывается: следующий
+        touch_user снова выполнит полный upsert и создаст строку.
+        """
+        with self._seen_lock:
+            pending, self._pending_seen = self._pending_seen, {}
+        if not pending:
+            return 0
+        
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            
+            try:
+                missing = []
+                for user_id, seen in pending.items():
+                    cursor.execute('''
+                        UPDATE users SET last_seen = ? WHERE user_id = ?
+                    ''', (seen, user_id))
+                    if cursor.rowcount == 0:
+                        missing.append(user_id)
+                conn.commit()
+                
+                for user_id in missing:
+                    self._fingerprint_cache.invalidate(user_id)
+                logger.info(f"✅ Обновлен last_seen: {len(pending)} пользователей")
+                return len(pending)
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"❌ Ошибка обновления last_seen: {e}")
+                # Возвращаем записи, чтобы не потерять их до следующей попытки
+                with self._seen_lock:
+                    for user_id, seen in pending.items():
+                        self._pending_seen.setdefault(user_id, seen)
+                return 0
+    
     def save_game(self, user_id: int, score: int, level: int, difficulty: str,
                   duration_seconds: int = 0, enemies_killed: int = 0, 
-                  accuracy_percent: float = 0.0) -> Tuple[bool, Dict]:
+                  accuracy_percent: float = 0.0, bosses_killed: int = 0,
+                  level_deltas: Sequence[int] = ()) -> Tuple[bool, Dict]:
         """Сохранить результат игры с транзакцией"""
+        return self.save_games([{
+            'user_id': user_id,
+            'score': score,
+            'level': level,
+            'difficulty': difficulty,
+            'duration_seconds': duration_seconds,
+            'enemies_killed': enemies_killed,
+            'accuracy_percent': accuracy_percent,
+            'bosses_killed': bosses_killed,
+            'level_deltas': level_deltas
+        }])[0]
+    
+    def save_games(self, games: List[Dict]) -> List[Tuple[bool, Dict]]:
+        """Сохранить пачку результатов игр одной транзакцией
+        
+        Игры применяются по порядку, поэтому результат каждой игры
+        (рекорд, серия побед) совпадает с последовательными вызовами save_game.
+        """
+        if not games:
+            return []
+        
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
             try:
                 # Начинаем транзакцию
-                cursor.execute('BEGIN IMMEDIATE')
+                self._begin_immediate(cursor, 'save_games')
                 
-                # Получаем текущую статистику
-                cursor.execute('''
-                    SELECT best_score, games_played, win_streak, best_win_streak 
-                    FROM user_stats WHERE user_id = ?
-                ''', (user_id,))
+                user_ids = list(dict.fromkeys(game['user_id'] for game in games))
                 
-                result = cursor.fetchone()
-                if not result:
-                    # Создаем статистику если её нет
-                    cursor.execute('INSERT INTO user_stats (user_id) VALUES (?)', (user_id,))
-                    old_best = 0
-                    games_played = 0
-                    win_streak = 0
-                    best_win_streak = 0
-                else:
-                    old_best, games_played, win_streak, best_win_streak = result
+                # Создаем статистику если её нет
+                cursor.executemany('''
+                    INSERT OR IGNORE INTO user_stats (user_id) VALUES (?)
+                ''', [(user_id,) for user_id in user_ids])
                 
-                # Сохраняем игру
-                cursor.execute('''
+                # Получаем текущую статистику всех игроков пачки
+                placeholders = ','.join('?' * len(user_ids))
+                cursor.execute(f'''
+                    SELECT * FROM user_stats WHERE user_id IN ({placeholders})
+                ''', user_ids)
+                
+                deltas = {}
+                for row in cursor.fetchall():
+                    deltas[row['user_id']] = {
+                        'old': dict(row),
+                        'best_score': row['best_score'],
+                        'games_played': row['games_played'],
+                        'win_streak': row['win_streak'],
+                        'best_win_streak': row['best_win_streak'],
+                        'achievement_mask': row['achievement_mask'] or 0,
+                        'games': 0,
+                        'max_level': 0,
+                        'score': 0,
+                        'playtime': 0,
+                        'enemies_killed': 0,
+                        'bosses_killed': 0,
+                        'accuracy': 0.0,
+                        'difficulties': dict.fromkeys(DIFFICULTY_COLUMNS, 0),
+                        'difficulty_best': {},
+                        'last_game': None
+                    }
+                
+                # Рекорды по сложностям: старые значения нужны, чтобы перенести игрока между корзинами
+                cursor.execute(f'''
+                    SELECT user_id, difficulty, best_score FROM difficulty_best WHERE user_id IN ({placeholders})
+                ''', user_ids)
+                old_difficulty_best = {(row[0], row[1]): row[2] for row in cursor.fetchall()}
+                
+                # Применяем игры по порядку и вычисляем результат каждой
+                results = []
+                for i, game in enumerate(games):
+                    delta = deltas[game['user_id']]
+                    score = game['score']
+                    old_best = delta['best_score']
+                    is_new_record = score > old_best
+                    delta['best_score'] = max(old_best, score)
+                    
+                    # Обновляем серию побед (если набрал WIN_SCORE очков - считаем победой)
+                    if score >= WIN_SCORE:
+                        delta['win_streak'] += 1
+                        delta['best_win_streak'] = max(delta['best_win_streak'], delta['win_streak'])
+                    else:
+                        delta['win_streak'] = 0
+                    
+                    delta['games'] += 1
+                    delta['max_level'] = max(delta['max_level'], game['level'])
+                    delta['score'] += score
+                    delta['playtime'] += game.get('duration_seconds', 0)
+                    delta['enemies_killed'] += game.get('enemies_killed', 0)
+                    delta['bosses_killed'] += game.get('bosses_killed', 0)
+                    delta['accuracy'] += game.get('accuracy_percent', 0.0)
+                    if game['difficulty'] in delta['difficulties']:
+                        delta['difficulties'][game['difficulty']] += 1
+                    code = DIFFICULTY_CODES.get(game['difficulty'])
+                    if code:
+                        best = delta['difficulty_best'].get(code, old_difficulty_best.get((game['user_id'], code)))
+                        if best is None or score > best:
+                            delta['difficulty_best'][code] = score
+                    delta['last_game'] = i
+                    
+                    results.append({
+                        'is_new_record': is_new_record,
+                        'old_best': old_best,
+                        'score_diff': score - old_best if is_new_record else 0,
+                        'new_achievements': [],
+                        'win_streak': delta['win_streak']
+                    })
+                
+                # Сохраняем игры
+                cursor.executemany('''
                     INSERT INTO games (user_id, score, level, difficulty, duration_seconds, 
-                                      enemies_killed, accuracy_percent)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (user_id, score, level, difficulty, duration_seconds, enemies_killed, accuracy_percent))
+                                      enemies_killed, accuracy_percent, level_deltas)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', [
+                    (game['user_id'], game['score'], game['level'],
+                     DIFFICULTY_CODES.get(game['difficulty'], 0),
+                     game.get('duration_seconds', 0), game.get('enemies_killed', 0),
+                     game.get('accuracy_percent', 0.0), pack_level_deltas(game.get('level_deltas')))
+                    for game in games
+                ])
                 
-                # Вычисляем новые значения
-                new_best = max(old_best, score)
-                is_new_record = score > old_best
+                # Агрегаты времени уровней для балансировки (level_stats.level_report)
+                level_rows = timing_rows(
+                    (DIFFICULTY_CODES.get(game['difficulty'], 0), game['level_deltas'])
+                    for game in games if game.get('level_deltas')
+                )
+                if level_rows:
+                    cursor.executemany(UPSERT_LEVEL_TIMING, level_rows)
                 
-                # Обновляем серию побед (если набрал больше 100 очков - считаем победой)
-                if score >= 100:
-                    win_streak += 1
-                    best_win_streak = max(best_win_streak, win_streak)
-                else:
-                    win_streak = 0
+                # Проверяем достижения только по изменившимся полям статистики.
+                # Индекс рейтинга меняется только после коммита, поэтому игроки,
+                # уже обработанные в этой пачке, передаются в rank_for отдельно
+                unlocked_rows = []
+                ranked: Dict[int, Tuple[int, int]] = {}
+                for user_id, delta in deltas.items():
+                    unlocked = achievement_engine.evaluate(
+                        delta['old'],
+                        self._apply_delta(delta),
+                        delta['achievement_mask'],
+                        rank_getter=lambda user_id=user_id, delta=delta: self.rank_index.rank_for(
+                            user_id, delta['best_score'], delta['games_played'] + delta['games'], ranked
+                        )
+                    )
+                    ranked[user_id] = (delta['best_score'], delta['games_played'] + delta['games'])
+                    for rule in unlocked:
+                        delta['achievement_mask'] |= rule.mask
+                        unlocked_rows.append((user_id, rule.key))
+                        logger.info(
+                            "🎊 Новое достижение для %s: %s",
+                            user_id, achievement_engine.definitions[rule.key]['name']
+                        )
+                    results[delta['last_game']]['new_achievements'] = [
+                        achievement_engine.describe(rule) for rule in unlocked
+                    ]
                 
-                # Обновляем статистику
-                difficulty_column = f"{difficulty}_games"
-                cursor.execute(f'''
+                if unlocked_rows:
+                    cursor.executemany('''
+                        INSERT OR IGNORE INTO achievements (user_id, achievement_key)
+                        VALUES (?, ?)
+                    ''', unlocked_rows)
+                
+                # Обновляем статистику объединенными дельтами (по строке на игрока)
+                difficulty_set = ',\n'.join(
+                    f"{key}_games = {key}_games + ?" for key in DIFFICULTY_COLUMNS
+                )
+                cursor.executemany(f'''
                     UPDATE user_stats
                     SET best_score = ?,
-                        games_played = games_played + 1,
+                        games_played = games_played + ?,
                         max_level = MAX(max_level, ?),
                         total_score = total_score + ?,
                         total_playtime_seconds = total_playtime_seconds + ?,
                         total_enemies_killed = total_enemies_killed + ?,
-                        avg_accuracy = (avg_accuracy * games_played + ?) / (games_played + 1),
-                        {difficulty_column} = {difficulty_column} + 1,
+                        total_bosses_killed = total_bosses_killed + ?,
+                        avg_accuracy = (avg_accuracy * games_played + ?) / (games_played + ?),
+                        {difficulty_set},
                         win_streak = ?,
                         best_win_streak = ?,
+                        achievement_mask = ?,
                         updated_at = CURRENT_TIMESTAMP
                     WHERE user_id = ?
-                ''', (new_best, level, score, duration_seconds, enemies_killed, 
-                      accuracy_percent, win_streak, best_win_streak, user_id))
+                ''', [
+                    (delta['best_score'], delta['games'], delta['max_level'], delta['score'],
+                     delta['playtime'], delta['enemies_killed'], delta['bosses_killed'],
+                     delta['accuracy'], delta['games'],
+                     *delta['difficulties'].values(),
+                     delta['win_streak'], delta['best_win_streak'], delta['achievement_mask'], user_id)
+                    for user_id, delta in deltas.items()
+                ])
                 
-                # Проверяем достижения
-                new_achievements = self._check_achievements(cursor, user_id)
+                # Рекорды по сложностям и корзины гистограммы перцентилей
+                cursor.executemany(UPSERT_DIFFICULTY_BEST, [
+                    (user_id, code, best)
+                    for user_id, delta in deltas.items()
+                    for code, best in delta['difficulty_best'].items()
+                ])
+                histogram_changes = self.score_histogram.changes(
+                    [
+                        (OVERALL, delta['old']['best_score'] if delta['games_played'] else None, delta['best_score'])
+                        for delta in deltas.values()
+                    ] + [
+                        (code, old_difficulty_best.get((user_id, code)), best)
+                        for user_id, delta in deltas.items()
+                        for code, best in delta['difficulty_best'].items()
+                    ]
+                )
+                cursor.executemany(UPSERT_HISTOGRAM, [
+                    (code, floor, players) for (code, floor), players in histogram_changes.items()
+                ])
+                
+                # Обновляем глобальные счетчики (первая игра = новый игрок)
+                cursor.execute('''
+                    UPDATE global_counters
+                    SET total_users = total_users + ?,
+                        total_games = total_games + ?,
+                        total_score = total_score + ?,
+                        max_score = MAX(max_score, ?),
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE id = 1
+                ''', (
+                    sum(1 for delta in deltas.values() if delta['games_played'] == 0),
+                    len(games),
+                    sum(delta['score'] for delta in deltas.values()),
+                    max(game['score'] for game in games)
+                ))
                 
                 # Обновляем ежедневные задания
-                self._update_daily_challenges(cursor, user_id, score, enemies_killed)
+                self._update_daily_challenges(cursor, [
+                    (user_id, delta['score'], delta['enemies_killed'])
+                    for user_id, delta in deltas.items()
+                ])
                 
                 conn.commit()
                 
-                # Инвалидируем кэш
-                self._invalidate_cache(user_id)
+                # Обновляем индекс рейтинга и гистограмму только после успешного коммита
+                self.score_histogram.apply(histogram_changes)
+                top_changed = False
+                for user_id, delta in deltas.items():
+                    old_rank = self.rank_index.rank(user_id)
+                    self.rank_index.update(
+                        user_id, delta['best_score'], delta['games_played'] + delta['games']
+                    )
+                    new_rank = self.rank_index.rank(user_id)
+                    top_changed = top_changed or any(
+                        rank is not None and rank <= LEADERBOARD_SIZE for rank in (old_rank, new_rank)
+                    )
+                    # Инвалидируем кэш
+                    self._invalidate_cache(user_id)
+                
+                if top_changed:
+                    self._top_cache.clear()
+                    self.leaderboard_version += 1
                 
-                logger.info(f"✅ Игра сохранена: user={user_id}, score={score}, level={level}")
+                logger.info("✅ Сохранено игр: %s (игроков: %s)", len(games), len(deltas), extra=SAMPLED)
                 
-                return True, {
-                    'is_new_record': is_new_record,
-                    'old_best': old_best,
-                    'score_diff': score - old_best if is_new_record else 0,
-                    'new_achievements': new_achievements,
-                    'win_streak': win_streak
-                }
+                return [(True, result) for result in results]
             
             except Exception as e:
                 conn.rollback()
+                if len(games) > 1:
+                    # Одна некорректная игра не должна терять остальные
+                    logger.warning(f"⚠️ Ошибка пакетного сохранения, сохраняем по одной: {e}")
+                    return [self.save_games([game])[0] for game in games]
                 logger.error(f"❌ Ошибка сохранения игры: {e}")
-                return False, {}
+                return [(False, {})]
     
-    def _check_achievements(self, cursor, user_id: int) -> List[Dict]:
-        """Проверить и разблокировать достижения"""
-        from config import ACHIEVEMENTS
-        
-        # Получаем статистику
-        cursor.execute('''
-            SELECT * FROM user_stats WHERE user_id = ?
-        ''', (user_id,))
-        stats = dict(cursor.fetchone())
-        
-        # Получаем ранг
-        cursor.execute('''
-            SELECT COUNT(*) + 1
-            FROM user_stats
-            WHERE best_score > (SELECT best_score FROM user_stats WHERE user_id = ?)
-        ''', (user_id,))
-        stats['rank'] = cursor.fetchone()[0]
-        
-        # Получаем уже разблокированные достижения
-        cursor.execute('''
-            SELECT achievement_key FROM achievements WHERE user_id = ?
-        ''', (user_id,))
-        unlocked = {row[0] for row in cursor.fetchall()}
-        
-        new_achievements = []
-        
-        # Проверяем каждое достижение
-        for key, achievement in ACHIEVEMENTS.items():
-            if key not in unlocked and achievement['condition'](stats):
-                cursor.execute('''
-                    INSERT INTO achievements (user_id, achievement_key)
-                    VALUES (?, ?)
-                ''', (user_id, key))
-                new_achievements.append({
-                    'key': key,
-                    'name': achievement['name'],
-                    'emoji': achievement['emoji'],
-                    'description': achievement['description']
-                })
-                logger.info(f"🎊 Новое достижение для {user_id}: {achievement['name']}")
-        
-        return new_achievements
+    @staticmethod
+    def _apply_delta(delta: Dict) -> Dict:
+        """Статистика игрока после применения дельты пачки"""
+        stats = dict(delta['old'])
+        stats['best_score'] = delta['best_score']
+        stats['games_played'] = delta['games_played'] + delta['games']
+        stats['max_level'] = max(stats['max_level'], delta['max_level'])
+        stats['total_score'] += delta['score']
+        stats['total_playtime_seconds'] += delta['playtime']
+        stats['total_enemies_killed'] += delta['enemies_killed']
+        stats['total_bosses_killed'] += delta['bosses_killed']
+        stats['win_streak'] = delta['win_streak']
+        stats['best_win_streak'] = delta['best_win_streak']
+        for key, count in delta['difficulties'].items():
+            stats[f'{key}_games'] += count
+        return stats
     
-    def _update_daily_challenges(self, cursor, user_id: int, score: int, enemies_killed: int):
-        """Обновить прогресс ежедневных заданий"""
+    def _update_daily_challenges(self, cursor, progress: List[Tuple[int, int, int]]):
+        """Обновить прогресс ежедневных заданий (user_id, очки, убийства)"""
         today = datetime.now().date()
         
         # Обновляем задание на очки
-        cursor.execute('''
-            INSERT INTO daily_challenges (user_id, challenge_type, target_value, current_value, date)
-            VALUES (?, 'daily_score', 1000, ?, ?)
+        cursor.executemany('''
+            INSERT INTO daily_challenges (user_id, challenge_type, target_value, current_value, completed, date)
+            VALUES (?1, 'daily_score', ?4, ?2, ?2 >= ?4, ?3)
             ON CONFLICT(user_id, challenge_type, date) DO UPDATE SET
                 current_value = current_value + excluded.current_value,
-                completed = CASE WHEN current_value >= target_value THEN 1 ELSE 0 END
-        ''', (user_id, score, today))
+                completed = CASE WHEN current_value + excluded.current_value >= target_value THEN 1 ELSE 0 END
+        ''', [
+            (user_id, score, today, DAILY_CHALLENGE_TARGETS['daily_score'])
+            for user_id, score, _ in progress
+        ])
         
         # Обновляем задание на убийства
-        cursor.execute('''
-            INSERT INTO daily_challenges (user_id, challenge_type, target_value, current_value, date)
-            VALUES (?, 'daily_kills', 50, ?, ?)
+        cursor.executemany('''
+            INSERT INTO daily_challenges (user_id, challenge_type, target_value, current_value, completed, date)
+            VALUES (?1, 'daily_kills', ?4, ?2, ?2 >= ?4, ?3)
             ON CONFLICT(user_id, challenge_type, date) DO UPDATE SET
                 current_value = current_value + excluded.current_value,
-                completed = CASE WHEN current_value >= target_value THEN 1 ELSE 0 END
-        ''', (user_id, enemies_killed, today))
+                completed = CASE WHEN current_value + excluded.current_value >= target_value THEN 1 ELSE 0 END
+        ''', [
+            (user_id, enemies_killed, today, DAILY_CHALLENGE_TARGETS['daily_kills'])
+            for user_id, _, enemies_killed in progress
+        ])
+    
+    def quarantine_game(self, user_id: int, game: Dict, reason: str) -> bool:
+        """Отложить неправдоподобный результат в quarantined_games (user_stats и рейтинг не меняются)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            
+            try:
+                cursor.execute('''
+                    INSERT INTO quarantined_games
+                        (user_id, score, level, difficulty, duration_seconds, enemies_killed,
+                         accuracy_percent, bosses_killed, level_deltas, reason)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    user_id, game['score'], game['level'], DIFFICULTY_CODES.get(game['difficulty'], 0),
+                    game.get('duration_seconds', 0), game.get('enemies_killed', 0),
+                    game.get('accuracy_percent', 0.0), game.get('bosses_killed', 0),
+                    json.dumps(list(game.get('level_deltas', ()))), reason
+                ))
+                conn.commit()
+                return True
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"❌ Ошибка записи в карантин: {e}")
+                return False
+    
+    def get_game_samples(self, limit: int) -> List[Tuple]:
+        """Последние игры для порогов правдоподобия: (difficulty, score, level, duration_seconds, enemies_killed)"""
+        with self.get_connection() as conn:
+            try:
+                return conn.execute('''
+                    SELECT difficulty, score, level, duration_seconds, enemies_killed
+                    FROM games
+                    ORDER BY played_at DESC
+                    LIMIT ?
+                ''', (limit,)).fetchall()
+            except Exception as e:
+                logger.error(f"❌ Ошибка выборки игр: {e}")
+                return []
     
     def get_user_stats(self, user_id: int, use_cache: bool = True) -> Optional[Dict]:
         """Получить статистику пользователя с кэшированием"""
-        cache_key = f"stats_{user_id}"
-        
-        # Проверяем кэш
-        if use_cache and cache_key in self._cache_stats:
-            expiry = self._cache_expiry.get(cache_key, datetime.min)
-            if datetime.now() < expiry:
-                return self._cache_stats[cache_key]
+        if use_cache:
+            stats = self._stats_cache.get_or_load(user_id, lambda: self._load_user_stats(user_id))
+        else:
+            generation = self._stats_cache.generation(user_id)
+            stats = self._load_user_stats(user_id)
+            if stats is not None:
+                self._stats_cache.set(user_id, stats, generation)
         
+        # Копия, чтобы вызывающий код не менял закэшированный словарь
+        return dict(stats) if stats else None
+    
+    def _load_user_stats(self, user_id: int) -> Optional[Dict]:
+        """Прочитать статистику пользователя из БД"""
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
             try:
-                cursor.execute('SELECT * FROM user_stats WHERE user_id = ?', (user_id,))
-                result = cursor.fetchone()
-                
-                if result:
-                    stats = dict(result)
-                    
-                    # Кэшируем на 30 секунд
-                    self._cache_stats[cache_key] = stats
-                    self._cache_expiry[cache_key] = datetime.now() + timedelta(seconds=30)
-                    
-                    return stats
-                return None
+                return self._query_user_stats(conn.cursor(), user_id)
             except Exception as e:
                 logger.error(f"❌ Ошибка получения статистики: {e}")
                 return None
     
+    @staticmethod
+    def _query_user_stats(cursor, user_id: int) -> Optional[Dict]:
+        cursor.execute('SELECT * FROM user_stats WHERE user_id = ?', (user_id,))
+        result = cursor.fetchone()
+        return dict(result) if result else None
+    
     def get_top_players(self, limit: int = 10) -> List[Dict]:
         """Получить топ игроков"""
+        return self._top_cache.get_or_load(
+            limit, lambda: self._attach_profiles(self.rank_index.top(limit))
+        )
+    
+    def get_players_around(self, user_id: int, radius: int = 2) -> List[Dict]:
+        """Получить соседей пользователя по рейтингу"""
+        entries = self.rank_index.around(user_id, radius)
+        return self._attach_profiles(entries)
+    
+    def _attach_profiles(self, entries: List[Dict]) -> List[Dict]:
+        """Дополнить записи индекса именами из таблицы users"""
+        if not entries:
+            return []
+        
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
             try:
-                cursor.execute('''
-                    SELECT u.first_name, u.username, s.best_score, s.games_played, 
-                           u.is_premium
-                    FROM user_stats s
-                    JOIN users u ON s.user_id = u.user_id
-                    WHERE s.best_score > 0
-                    ORDER BY s.best_score DESC, s.games_played ASC
-                    LIMIT ?
-                ''', (limit,))
+                placeholders = ','.join('?' * len(entries))
+                cursor.execute(f'''
+                    SELECT user_id, first_name, username, is_premium
+                    FROM users
+                    WHERE user_id IN ({placeholders})
+                ''', [entry['user_id'] for entry in entries])
                 
-                results = cursor.fetchall()
+                profiles = {row[0]: row for row in cursor.fetchall()}
                 return [
                     {
-                        'name': row[0] or row[1] or 'Аноним',
-                        'score': row[2],
-                        'games_played': row[3],
-                        'is_premium': bool(row[4])
+                        'user_id': entry['user_id'],
+                        'name': profiles[entry['user_id']][1] or profiles[entry['user_id']][2] or 'Аноним',
+                        'score': entry['best_score'],
+                        'games_played': entry['games_played'],
+                        'rank': entry['rank'],
+                        'is_premium': bool(profiles[entry['user_id']][3])
                     }
-                    for row in results
+                    for entry in entries
+                    if entry['user_id'] in profiles
                 ]
             except Exception as e:
                 logger.error(f"❌ Ошибка получения топа: {e}")
@@ -429,100 +701,196 @@ class Database:
     
     def get_user_rank(self, user_id: int) -> Optional[int]:
         """Получить место пользователя в рейтинге"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            try:
-                cursor.execute('''
-                    SELECT COUNT(*) + 1
-                    FROM user_stats
-                    WHERE best_score > (SELECT best_score FROM user_stats WHERE user_id = ?)
-                       OR (best_score = (SELECT best_score FROM user_stats WHERE user_id = ?)
-                           AND games_played < (SELECT games_played FROM user_stats WHERE user_id = ?))
-                ''', (user_id, user_id, user_id))
-                
-                result = cursor.fetchone()
-                return result[0] if result else None
-            except Exception as e:
-                logger.error(f"❌ Ошибка получения ранга: {e}")
-                return None
+        return self.rank_index.rank(user_id)
+    
+    def get_score_percentile(self, score: int, difficulty: str = None) -> Dict:
+        """Какую долю игроков превосходит счет и сколько очков до следующей ступени
+        
+        Считается по гистограмме в памяти; пустой словарь, если игроков меньше
+        PERCENTILE_MIN_PLAYERS.
+        """
+        code = difficulty_code(difficulty)
+        players = self.score_histogram.total(code)
+        if players < PERCENTILE_MIN_PLAYERS:
+            return {}
+        result = {
+            'percentile': self.score_histogram.percentile(score, code),
+            'players': players,
+            'next_bracket': None,
+            'points_to_next': 0
+        }
+        bracket = self.score_histogram.next_bracket(score, code)
+        if bracket:
+            result['next_bracket'], result['points_to_next'] = bracket
+        return result
     
     def get_recent_games(self, user_id: int, limit: int = 5) -> List[Dict]:
         """Получить последние игры пользователя"""
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
             try:
-                cursor.execute('''
-                    SELECT score, level, difficulty, duration_seconds, 
-                           enemies_killed, accuracy_percent, played_at
-                    FROM games
-                    WHERE user_id = ?
-                    ORDER BY played_at DESC
-                    LIMIT ?
-                ''', (user_id, limit))
-                
-                results = cursor.fetchall()
-                return [
-                    {
-                        'score': row[0],
-                        'level': row[1],
-                        'difficulty': row[2],
-                        'duration': row[3],
-                        'enemies_killed': row[4],
-                        'accuracy': row[5],
-                        'played_at': row[6]
-                    }
-                    for row in results
-                ]
+                return self._query_recent_games(conn.cursor(), user_id, limit)
             except Exception as e:
                 logger.error(f"❌ Ошибка получения истории игр: {e}")
                 return []
     
+    def _query_recent_games(self, cursor, user_id: int, limit: int) -> List[Dict]:
+        cursor.execute(f'''
+            SELECT {RECENT_COLUMNS}
+            FROM games
+            WHERE user_id = ?
+            ORDER BY played_at DESC
+            LIMIT ?
+        ''', (user_id, limit))
+        rows = cursor.fetchall()
+        
+        # Не хватило свежих игр — дочитываем из архивных месяцев
+        if len(rows) < limit:
+            rows += self.archive.recent_games(user_id, limit - len(rows), [row[0] for row in rows])
+        
+        return [
+            {
+                'score': row[1],
+                'level': row[2],
+                'difficulty': DIFFICULTY_NAMES.get(row[3]),
+                'duration': row[4],
+                'enemies_killed': row[5],
+                'accuracy': row[6],
+                'played_at': row[7]
+            }
+            for row in rows
+        ]
+    
     def get_user_achievements(self, user_id: int) -> List[str]:
         """Получить разблокированные достижения пользователя"""
+        achievements = self._achievements_cache.get_or_load(
+            user_id, lambda: self._load_user_achievements(user_id)
+        )
+        return achievements if achievements is not None else []
+    
+    def _load_user_achievements(self, user_id: int) -> Optional[List[str]]:
+        """Прочитать достижения пользователя из БД (None при ошибке: не кэшируется)"""
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
             try:
-                cursor.execute('''
-                    SELECT achievement_key, unlocked_at 
-                    FROM achievements 
-                    WHERE user_id = ?
-                    ORDER BY unlocked_at DESC
-                ''', (user_id,))
-                
-                return [row[0] for row in cursor.fetchall()]
+                return self._query_user_achievements(conn.cursor(), user_id)
             except Exception as e:
                 logger.error(f"❌ Ошибка получения достижений: {e}")
-                return []
+                return None
+    
+    @staticmethod
+    def _query_user_achievements(cursor, user_id: int) -> List[str]:
+        cursor.execute('''
+            SELECT achievement_key, unlocked_at 
+            FROM achievements 
+            WHERE user_id = ?
+            ORDER BY unlocked_at DESC
+        ''', (user_id,))
+        
+        return [row[0] for row in cursor.fetchall()]
     
     def get_daily_challenges(self, user_id: int) -> List[Dict]:
         """Получить ежедневные задания пользователя"""
+        today = datetime.now().date()
+        challenges = self._daily_cache.get_or_load(
+            (user_id, today), lambda: self._load_daily_challenges(user_id, today)
+        )
+        return challenges if challenges is not None else []
+    
+    def _load_daily_challenges(self, user_id: int, today) -> Optional[List[Dict]]:
+        """Прочитать ежедневные задания пользователя из БД (None при ошибке: не кэшируется)"""
+        with self.get_connection() as conn:
+            try:
+                return self._query_daily_challenges(conn.cursor(), user_id, today)
+            except Exception as e:
+                logger.error(f"❌ Ошибка получения заданий: {e}")
+                return None
+    
+    @staticmethod
+    def _query_daily_challenges(cursor, user_id: int, today) -> List[Dict]:
+        cursor.execute('''
+            SELECT challenge_type, target_value, current_value, completed, reward_claimed
+            FROM daily_challenges
+            WHERE user_id = ? AND date = ?
+        ''', (user_id, today))
+        
+        return [
+            {
+                'type': row[0],
+                'target': row[1],
+                'current': row[2],
+                'completed': bool(row[3]),
+                'claimed': bool(row[4])
+            }
+            for row in cursor.fetchall()
+        ]
+    
+    def get_profile_bundle(self, user_id: int, parts: Iterable[str] = PROFILE_PARTS,
+                           recent_limit: int = 5) -> ProfileBundle:
+        """Получить несколько частей профиля за одно обращение к БД
+        
+        Части, которых нет в кэше, читаются одной транзакцией чтения
+        на одном соединении; ранг берется из индекса рейтинга.
+        """
+        parts = set(parts)
+        unknown = parts - set(PROFILE_PARTS)
+        if unknown:
+            raise ValueError(f"Неизвестные части профиля: {', '.join(sorted(unknown))}")
+        
+        today = datetime.now().date()
+        bundle = ProfileBundle()
+        if 'rank' in parts:
+            bundle.rank = self.rank_index.rank(user_id)
+        
+        # Сначала берем то, что уже есть в кэше
+        missing = set()
+        cached = {
+            'stats': self._stats_cache.get(user_id),
+            'achievements': self._achievements_cache.get(user_id),
+            'daily_challenges': self._daily_cache.get((user_id, today))
+        }
+        for part, value in cached.items():
+            if part not in parts:
+                continue
+            if value is None:
+                missing.add(part)
+            else:
+                setattr(bundle, part, dict(value) if part == 'stats' else value)
+        if 'recent_games' in parts:
+            missing.add('recent_games')
+        
+        if not missing:
+            return bundle
+        
+        # Поколения до чтения: инвалидация во время чтения не даст закэшировать старое
+        generations = {
+            'stats': self._stats_cache.generation(user_id),
+            'achievements': self._achievements_cache.generation(user_id),
+            'daily_challenges': self._daily_cache.generation((user_id, today))
+        }
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            today = datetime.now().date()
             
             try:
-                cursor.execute('''
-                    SELECT challenge_type, target_value, current_value, completed, reward_claimed
-                    FROM daily_challenges
-                    WHERE user_id = ? AND date = ?
-                ''', (user_id, today))
-                
-                return [
-                    {
-                        'type': row[0],
-                        'target': row[1],
-                        'current': row[2],
-                        'completed': bool(row[3]),
-                        'claimed': bool(row[4])
-                    }
-                    for row in cursor.fetchall()
-                ]
+                # Одна транзакция: все части видят один и тот же снимок БД
+                cursor.execute('BEGIN')
+                if 'stats' in missing:
+                    stats = self._query_user_stats(cursor, user_id)
+                    if stats is not None:
+                        self._stats_cache.set(user_id, stats, generations['stats'])
+                        bundle.stats = dict(stats)
+                if 'achievements' in missing:
+                    bundle.achievements = self._query_user_achievements(cursor, user_id)
+                    self._achievements_cache.set(user_id, bundle.achievements, generations['achievements'])
+                if 'daily_challenges' in missing:
+                    bundle.daily_challenges = self._query_daily_challenges(cursor, user_id, today)
+                    self._daily_cache.set((user_id, today), bundle.daily_challenges, generations['daily_challenges'])
+                if 'recent_games' in missing:
+                    bundle.recent_games = self._query_recent_games(cursor, user_id, recent_limit)
+                conn.commit()
             except Exception as e:
-                logger.error(f"❌ Ошибка получения заданий: {e}")
-                return []
+                conn.rollback()
+                logger.error(f"❌ Ошибка получения профиля: {e}")
+        
+        return bundle
     
     def get_global_stats(self) -> Dict:
         """Получить глобальную статистику"""
@@ -531,48 +899,94 @@ class Database:
             
             try:
                 cursor.execute('''
-                    SELECT 
-                        COUNT(DISTINCT user_id) as total_users,
-                        COUNT(*) as total_games,
-                        SUM(score) as total_score,
-                        MAX(score) as max_score,
-                        AVG(score) as avg_score
-                    FROM games
+                    SELECT total_users, total_games, total_score, max_score
+                    FROM global_counters
+                    WHERE id = 1
                 ''')
                 
                 row = cursor.fetchone()
+                if not row:
+                    return {}
                 return {
                     'total_users': row[0] or 0,
                     'total_games': row[1] or 0,
                     'total_score': row[2] or 0,
                     'max_score': row[3] or 0,
-                    'avg_score': round(row[4], 1) if row[4] else 0
+                    'avg_score': round(row[2] / row[1], 1) if row[1] else 0
                 }
             except Exception as e:
                 logger.error(f"❌ Ошибка получения глобальной статистики: {e}")
                 return {}
     
-    def cleanup_old_data(self, days: int = 90):
-        """Очистка старых данных"""
+    def rebuild_global_counters(self) -> bool:
+        """Пересчитать глобальные счетчики по games и итогам архивных месяцев (сверка)"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
             try:
-                cutoff_date = datetime.now() - timedelta(days=days)
+                self._begin_immediate(cursor, 'rebuild_global_counters')
                 cursor.execute('''
-                    DELETE FROM games 
-                    WHERE played_at < ? AND user_id NOT IN (
-                        SELECT user_id FROM user_stats WHERE best_score > 0
-                    )
-                ''', (cutoff_date,))
-                
-                deleted = cursor.rowcount
+                    INSERT OR REPLACE INTO global_counters
+                        (id, total_users, total_games, total_score, max_score, updated_at)
+                    SELECT 1,
+                           (SELECT COUNT(*) FROM user_stats WHERE games_played > 0),
+                           hot.games + archived.games,
+                           hot.total_score + archived.total_score,
+                           MAX(hot.max_score, archived.max_score),
+                           CURRENT_TIMESTAMP
+                    FROM (SELECT COUNT(*) AS games,
+                                 COALESCE(SUM(score), 0) AS total_score,
+                                 COALESCE(MAX(score), 0) AS max_score
+                          FROM games) AS hot,
+                         (SELECT COALESCE(SUM(games), 0) AS games,
+                                 COALESCE(SUM(total_score), 0) AS total_score,
+                                 COALESCE(MAX(max_score), 0) AS max_score
+                          FROM history_archives) AS archived
+                ''')
                 conn.commit()
-                logger.info(f"✅ Удалено {deleted} старых записей игр")
-                return deleted
+                logger.info("✅ Глобальные счетчики пересчитаны")
+                return True
             except Exception as e:
-                logger.error(f"❌ Ошибка очистки данных: {e}")
-                return 0
+                conn.rollback()
+                logger.error(f"❌ Ошибка пересчета глобальных счетчиков: {e}")
+                return False
+    
+    def rebuild_score_histogram(self) -> bool:
+        """Построить гистограмму лучшего счета по user_stats и difficulty_best"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            
+            try:
+                self._begin_immediate(cursor, 'rebuild_score_histogram')
+                cursor.execute(f'''
+                    SELECT {OVERALL}, best_score FROM user_stats WHERE games_played > 0
+                    UNION ALL
+                    SELECT difficulty, best_score FROM difficulty_best
+                ''')
+                rows = self.score_histogram.build(cursor)
+                cursor.execute('DELETE FROM score_histogram')
+                cursor.executemany(
+                    'INSERT INTO score_histogram (difficulty, floor, players) VALUES (?, ?, ?)', rows
+                )
+                conn.commit()
+                logger.info(f"✅ Гистограмма лучшего счета построена: {self.score_histogram.total(OVERALL)} игроков")
+                return True
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"❌ Ошибка построения гистограммы лучшего счета: {e}")
+                return False
+    
+    def archive_old_games(self, hot_days: int = HISTORY_HOT_DAYS) -> Dict[str, int]:
+        """Перенести месяцы старше hot_days в архивные файлы. {месяц: игр}"""
+        with self.get_connection() as conn:
+            try:
+                moved = self.archive.archive_old(conn, hot_days)
+                if moved:
+                    logger.info(f"✅ Перенесено в архив {sum(moved.values())} игр за месяцев: {len(moved)}")
+                return moved
+            except Exception as e:
+                logger.error(f"❌ Ошибка переноса истории игр в архив: {e}")
+                return {}
 
 
 # Создание экземпляра базы данных
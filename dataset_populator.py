@@ -0,0 +1,305 @@
+"""
+Bulk dataset populator for Space Shooter Bot
+Массовое наполнение БД согласованными синтетическими данными для нагрузочных тестов
+
+Строки генерируются в нескольких процессах (по пачкам игроков) и
+вставляются через executemany; вторичные индексы удаляются на время
+загрузки и создаются заново в конце. user_stats, достижения и ежедневные
+задания вычисляются по сгенерированным играм по тем же правилам, что и в
+Database.save_games, поэтому база неотличима от набранной вызовами save_game.
+
+Запуск: python dataset_populator.py --db bench.db --users 1000000
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import random
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Tuple
+
+from achievements import RANK_FIELD, achievement_engine
+from config import DIFFICULTY_CODES
+from database import Database, DAILY_CHALLENGE_TARGETS, DIFFICULTY_COLUMNS, WIN_SCORE
+from db_profile import connect
+from level_stats import UPSERT_LEVEL_TIMING, pack_level_deltas, timing_rows
+
+logger = logging.getLogger(__name__)
+
+# Таблицы в порядке вставки
+TABLES = ('users', 'games', 'user_stats', 'achievements', 'daily_challenges', 'level_timing',
+          'difficulty_best')
+
+STATS_COLUMNS = (
+    'user_id', 'best_score', 'max_level', 'games_played', 'total_score',
+    'total_playtime_seconds', 'total_enemies_killed', 'total_bosses_killed', 'avg_accuracy',
+    *(f'{key}_games' for key in DIFFICULTY_COLUMNS),
+    'win_streak', 'best_win_streak', 'achievement_mask', 'updated_at'
+)
+
+INSERT_SQL = {
+    'users': '''
+        INSERT INTO users (user_id, username, first_name, language_code, is_premium, created_at, last_seen)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''',
+    'games': '''
+        INSERT INTO games (user_id, score, level, difficulty, duration_seconds,
+                           enemies_killed, accuracy_percent, played_at, level_deltas)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''',
+    'user_stats': f'''
+        INSERT INTO user_stats ({', '.join(STATS_COLUMNS)})
+        VALUES ({', '.join('?' * len(STATS_COLUMNS))})
+    ''',
+    'achievements': '''
+        INSERT INTO achievements (user_id, achievement_key, unlocked_at) VALUES (?, ?, ?)
+    ''',
+    'daily_challenges': '''
+        INSERT INTO daily_challenges (user_id, challenge_type, target_value, current_value, completed, date)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''',
+    'level_timing': UPSERT_LEVEL_TIMING,
+    'difficulty_best': '''
+        INSERT INTO difficulty_best (user_id, difficulty, best_score) VALUES (?, ?, ?)
+    ''',
+}
+
+# Ранговые достижения зависят от всех игроков и выдаются после загрузки
+STAT_RULES = [rule for rule in achievement_engine.rules if rule.field != RANK_FIELD]
+RANK_RULES = [rule for rule in achievement_engine.rules if rule.field == RANK_FIELD]
+
+
+def _timestamp(ts: float) -> str:
+    """Время в формате CURRENT_TIMESTAMP (UTC)"""
+    return datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def generate_user(user_id: int, rng: random.Random, max_games: int,
+                  now: float, days: int) -> Dict[str, List[Tuple]]:
+    """Строки всех таблиц для одного игрока"""
+    rows = {table: [] for table in TABLES}
+    created = now - rng.uniform(0, days * 86400)
+    times = sorted(rng.uniform(created, now) for _ in range(rng.randint(0, max_games)))
+    rows['users'].append((
+        user_id, f"player{user_id}", f"Player{user_id}", 'ru', int(rng.random() < 0.05),
+        _timestamp(created), _timestamp(times[-1] if times else created)
+    ))
+    # Как Database.add_user: нулевая статистика есть у каждого игрока, даже без игр
+    stats = dict.fromkeys(STATS_COLUMNS, 0)
+    stats['user_id'] = user_id
+    stats['avg_accuracy'] = 0.0
+    stats['updated_at'] = _timestamp(created)
+    if not times:
+        rows['user_stats'].append(tuple(stats[column] for column in STATS_COLUMNS))
+        return rows
+
+    unlocked: Dict[str, int] = {}
+    daily: Dict[str, List[int]] = {}
+    difficulty_best: Dict[int, int] = {}
+
+    for ts in times:
+        played_at = _timestamp(ts)
+        level = rng.randint(1, 15)
+        score = rng.randint(0, 200) * level * 10
+        difficulty = rng.choice(DIFFICULTY_COLUMNS)
+        level_deltas = [rng.randint(15, 90) for _ in range(level - 1)]
+        duration = sum(level_deltas) + rng.randint(15, 90)
+        enemies_killed = rng.randint(0, 40) * level
+        bosses_killed = level // 5
+        accuracy = rng.randint(100, 950) / 10
+        rows['games'].append((
+            user_id, score, level, DIFFICULTY_CODES[difficulty], duration, enemies_killed, accuracy, int(ts),
+            pack_level_deltas(level_deltas)
+        ))
+        # Пока сырые дельты: агрегируются на всю пачку в _generate_chunk
+        rows['level_timing'].append((DIFFICULTY_CODES[difficulty], level_deltas))
+        code = DIFFICULTY_CODES[difficulty]
+        difficulty_best[code] = max(difficulty_best.get(code, 0), score)
+
+        # Те же правила, что в Database.save_games (включая порядок операций со средним)
+        games_played = stats['games_played']
+        stats['avg_accuracy'] = (stats['avg_accuracy'] * games_played + accuracy) / (games_played + 1)
+        stats['games_played'] = games_played + 1
+        stats['best_score'] = max(stats['best_score'], score)
+        stats['max_level'] = max(stats['max_level'], level)
+        stats['total_score'] += score
+        stats['total_playtime_seconds'] += duration
+        stats['total_enemies_killed'] += enemies_killed
+        stats['total_bosses_killed'] += bosses_killed
+        stats[f'{difficulty}_games'] += 1
+        if score >= WIN_SCORE:
+            stats['win_streak'] += 1
+            stats['best_win_streak'] = max(stats['best_win_streak'], stats['win_streak'])
+        else:
+            stats['win_streak'] = 0
+        stats['updated_at'] = played_at
+
+        for rule in STAT_RULES:
+            if rule.key not in unlocked and rule.is_met(stats[rule.field]):
+                unlocked[rule.key] = int(ts)
+
+        # Ежедневные задания считаются по локальной дате, как в _update_daily_challenges
+        progress = daily.setdefault(datetime.fromtimestamp(ts).date().isoformat(), [0, 0])
+        progress[0] += score
+        progress[1] += enemies_killed
+
+    stats['achievement_mask'] = achievement_engine.mask_of(unlocked)
+    rows['user_stats'].append(tuple(stats[column] for column in STATS_COLUMNS))
+    rows['achievements'] = [(user_id, key, unlocked_at) for key, unlocked_at in unlocked.items()]
+    rows['difficulty_best'] = [(user_id, code, best) for code, best in difficulty_best.items()]
+    for date, (score, kills) in daily.items():
+        for challenge_type, value in (('daily_score', score), ('daily_kills', kills)):
+            target = DAILY_CHALLENGE_TARGETS[challenge_type]
+            rows['daily_challenges'].append(
+                (user_id, challenge_type, target, value, int(value >= target), date)
+            )
+    return rows
+
+
+def _generate_chunk(task: Tuple[int, int, int, int, float, int]) -> Dict[str, List[Tuple]]:
+    """Сгенерировать пачку игроков [first, last] (выполняется в процессе-воркере)"""
+    first, last, seed, max_games, now, days = task
+    # Сид зависит только от пачки: результат не зависит от числа процессов
+    rng = random.Random(f"{seed}:{first}")
+    chunk = {table: [] for table in TABLES}
+    for user_id in range(first, last + 1):
+        for table, rows in generate_user(user_id, rng, max_games, now, days).items():
+            chunk[table].extend(rows)
+    chunk['level_timing'] = timing_rows(chunk['level_timing'])
+    return chunk
+
+
+def _chunks(first: int, last: int, chunk_size: int, seed: int, max_games: int,
+            now: float, days: int) -> Iterator[Tuple]:
+    for start in range(first, last + 1, chunk_size):
+        yield start, min(last, start + chunk_size - 1), seed, max_games, now, days
+
+
+def _drop_secondary_indexes(conn) -> List[str]:
+    """Удалить вторичные индексы заполняемых таблиц и вернуть их определения"""
+    placeholders = ','.join('?' * len(TABLES))
+    indexes = conn.execute(f'''
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({placeholders})
+    ''', TABLES).fetchall()
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX {name}')
+    return [sql for _, sql in indexes]
+
+
+def _grant_rank_achievements(conn, first_user_id: int) -> int:
+    """Выдать ранговые достижения новым игрокам по итоговому рейтингу
+
+    В продакшене ранг проверяется в момент игры, поэтому историю «был в
+    топе, но вылетел» синтетические данные не воспроизводят.
+    """
+    if not RANK_RULES:
+        return 0
+    worst_rank = max(rule.threshold for rule in RANK_RULES)
+    leaders = conn.execute('''
+        SELECT user_id, best_score, games_played, CAST(strftime('%s', updated_at) AS INTEGER), achievement_mask
+        FROM user_stats WHERE best_score > 0
+        ORDER BY best_score DESC, games_played ASC
+        LIMIT ?
+    ''', (worst_rank * 10,)).fetchall()
+
+    granted, masks = [], []
+    rank, previous = 0, None
+    for position, (user_id, best_score, games_played, updated_at, mask) in enumerate(leaders, 1):
+        # Игроки с одинаковым ключом делят место, как в LeaderboardIndex
+        if (best_score, games_played) != previous:
+            rank, previous = position, (best_score, games_played)
+        if rank > worst_rank:
+            break
+        if user_id < first_user_id:
+            continue
+        new_rules = [rule for rule in RANK_RULES if not mask & rule.mask and rule.is_met(rank)]
+        if new_rules:
+            granted.extend((user_id, rule.key, updated_at) for rule in new_rules)
+            masks.append((mask | achievement_engine.mask_of(rule.key for rule in new_rules), user_id))
+
+    conn.executemany(INSERT_SQL['achievements'], granted)
+    conn.executemany('UPDATE user_stats SET achievement_mask = ? WHERE user_id = ?', masks)
+    return len(granted)
+
+
+class _InlinePool:
+    """Заглушка пула для workers=1: генерация в текущем процессе"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @staticmethod
+    def imap(func, iterable):
+        return map(func, iterable)
+
+
+def populate(database: Database, users: int, max_games: int = 6, days: int = 30,
+             workers: int = None, seed: int = 42, chunk_size: int = 2000,
+             defer_indexes: bool = True) -> Dict[str, int]:
+    """Добавить users новых игроков (id после максимального существующего)
+
+    Возвращает количество вставленных строк по таблицам. После загрузки
+    вызывается database.reload(): индекс рейтинга, счетчики и кэш.
+    """
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+
+    conn = connect(database.db_name)
+    # Данные синтетические: надежность записи не нужна, важна скорость
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA cache_size = -256000')
+    first = (conn.execute('SELECT MAX(user_id) FROM users').fetchone()[0] or 0) + 1
+    tasks = _chunks(first, first + users - 1, chunk_size, seed, max_games, time.time(), days)
+
+    counts = dict.fromkeys(TABLES, 0)
+    indexes = _drop_secondary_indexes(conn) if defer_indexes else []
+    try:
+        # fork: воркерам не нужно заново импортировать модули (и создавать database.db)
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        with context.Pool(workers) if workers > 1 else _InlinePool() as pool:
+            for chunk in pool.imap(_generate_chunk, tasks):
+                for table in TABLES:
+                    conn.executemany(INSERT_SQL[table], chunk[table])
+                    counts[table] += len(chunk[table])
+                conn.commit()
+        counts['achievements'] += _grant_rank_achievements(conn, first)
+        conn.commit()
+    finally:
+        for sql in indexes:
+            conn.execute(sql)
+        conn.execute('PRAGMA optimize')
+        conn.commit()
+        conn.close()
+
+    database.reload()
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"✅ Сгенерировано за {elapsed:.1f} с: "
+        + ", ".join(f"{table} {count:,}" for table, count in counts.items())
+    )
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--db', default='bench.db', help='файл БД (создается при необходимости)')
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--max-games', type=int, default=6, help='максимум игр на игрока (в среднем половина)')
+    parser.add_argument('--days', type=int, default=30, help='период, за который распределены игры')
+    parser.add_argument('--workers', type=int, default=None, help='процессов генерации (по умолчанию по числу CPU)')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    populate(Database(args.db), args.users, args.max_games, args.days, args.workers, args.seed)
+
+
+if __name__ == '__main__':
+    main()
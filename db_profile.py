@@ -0,0 +1,63 @@
+"""
+SQLite connection profile for Space Shooter Bot
+Открытие соединений с прагмами из профиля DB_PROFILE и проверка их применения
+"""
+
+import logging
+import sqlite3
+from typing import Dict
+
+from config import DB_PROFILE, DB_PROFILES
+
+logger = logging.getLogger(__name__)
+
+# Прагмы профиля в порядке применения (journal_mode первым)
+PROFILE_PRAGMAS = ('journal_mode', 'synchronous', 'cache_size', 'temp_store', 'mmap_size')
+
+# Числовые значения, которые SQLite возвращает для synchronous и temp_store
+_SYNCHRONOUS = {0: 'OFF', 1: 'NORMAL', 2: 'FULL', 3: 'EXTRA'}
+_TEMP_STORE = {0: 'DEFAULT', 1: 'FILE', 2: 'MEMORY'}
+
+
+def get_profile(name: str = None) -> Dict:
+    """Получить настройки профиля по имени (по умолчанию DB_PROFILE)"""
+    name = name or DB_PROFILE
+    if name not in DB_PROFILES:
+        raise ValueError(f"Неизвестный профиль БД: {name}. Доступны: {', '.join(DB_PROFILES)}")
+    return DB_PROFILES[name]
+
+
+def connect(db_name: str, profile: str = None, **kwargs) -> sqlite3.Connection:
+    """Открыть соединение и применить прагмы профиля"""
+    settings = get_profile(profile)
+    kwargs.setdefault('cached_statements', settings['cached_statements'])
+    conn = sqlite3.connect(db_name, **kwargs)
+    for pragma in PROFILE_PRAGMAS:
+        conn.execute(f"PRAGMA {pragma} = {settings[pragma]}")
+    return conn
+
+
+def read_pragmas(conn: sqlite3.Connection) -> Dict:
+    """Прочитать фактические значения прагм соединения"""
+    actual = {pragma: conn.execute(f"PRAGMA {pragma}").fetchone()[0] for pragma in PROFILE_PRAGMAS}
+    actual['journal_mode'] = str(actual['journal_mode']).upper()
+    actual['synchronous'] = _SYNCHRONOUS.get(actual['synchronous'], actual['synchronous'])
+    actual['temp_store'] = _TEMP_STORE.get(actual['temp_store'], actual['temp_store'])
+    return actual
+
+
+def check_profile(conn: sqlite3.Connection, profile: str = None) -> Dict:
+    """Самопроверка: залогировать фактические прагмы и расхождения с профилем"""
+    name = profile or DB_PROFILE
+    settings = get_profile(name)
+    actual = read_pragmas(conn)
+
+    logger.info(
+        f"🔧 Профиль БД {name}: " + ", ".join(f"{key}={value}" for key, value in actual.items())
+    )
+    for pragma in PROFILE_PRAGMAS:
+        expected = settings[pragma]
+        if str(actual[pragma]).upper() != str(expected).upper():
+            # Например, WAL недоступен на сетевой ФС или mmap отключен при сборке SQLite
+            logger.warning(f"⚠️ PRAGMA {pragma}: ожидалось {expected}, фактически {actual[pragma]}")
+    return actual
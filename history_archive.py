@@ -0,0 +1,254 @@
+"""
+Tiered game history for Space Shooter Bot
+Многоуровневое хранение истории игр: свежие игры в основной БД, старые месяцы — в архивных файлах
+
+Игры старше HISTORY_HOT_DAYS переносятся помесячно (по UTC) в файлы
+HISTORY_ARCHIVE_DIR/games_YYYY_MM.db, которые подключаются к соединению
+основной БД через ATTACH. В архиве лежат исходные строки games и свертка
+daily_rollup по игроку и дню. Итоги месяца (игры, очки, максимум) хранятся
+в таблице history_archives основной БД — по ним global_counters сверяется без
+чтения архивов.
+
+Перенос идет пачками: копия пачки в архив, удаление из games и обновление
+итогов месяца — одна транзакция. Вставка в архив идемпотентна (по id), так
+что прерванный перенос безопасно повторяется. Архивные файлы после переноса
+не меняются; их нужно сохранять вместе с резервными копиями основной БД.
+"""
+
+import calendar
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from config import HISTORY_ARCHIVE_CHUNK, HISTORY_ARCHIVE_DIR, HISTORY_HOT_DAYS
+
+logger = logging.getLogger(__name__)
+
+# Схема архивного файла (games в компактной схеме, без внешних ключей)
+ARCHIVE_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS archive.games (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        score INTEGER,
+        level INTEGER,
+        difficulty INTEGER NOT NULL DEFAULT 0,
+        duration_seconds INTEGER DEFAULT 0,
+        enemies_killed INTEGER DEFAULT 0,
+        accuracy_percent REAL DEFAULT 0,
+        played_at INTEGER NOT NULL,
+        level_deltas BLOB
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS archive.idx_games_user_played ON games(user_id, played_at DESC)',
+    '''
+    CREATE TABLE IF NOT EXISTS archive.daily_rollup (
+        user_id INTEGER NOT NULL,
+        day INTEGER NOT NULL,              -- дней с 1970-01-01 (UTC)
+        games INTEGER NOT NULL,
+        total_score INTEGER NOT NULL,
+        best_score INTEGER NOT NULL,
+        total_duration INTEGER NOT NULL,
+        total_enemies_killed INTEGER NOT NULL,
+        sum_accuracy REAL NOT NULL,
+        PRIMARY KEY (user_id, day)
+    ) WITHOUT ROWID
+    ''',
+)
+
+# Колонки games в порядке SELECT для get_recent_games (id — для отсева повторов)
+RECENT_COLUMNS = '''id, score, level, difficulty, duration_seconds,
+                    enemies_killed, accuracy_percent, datetime(played_at, 'unixepoch')'''
+
+
+def month_of(ts: float) -> str:
+    """Месяц (UTC) в формате YYYY-MM"""
+    return datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m')
+
+
+def month_bounds(month: str) -> Tuple[int, int]:
+    """Начало и конец месяца в секундах эпохи: [start, end)"""
+    year, number = map(int, month.split('-'))
+    start = calendar.timegm((year, number, 1, 0, 0, 0))
+    year, number = (year + 1, 1) if number == 12 else (year, number + 1)
+    return start, calendar.timegm((year, number, 1, 0, 0, 0))
+
+
+class GameArchive:
+    """Архивные месяцы истории игр"""
+
+    def __init__(self, archive_dir: str = HISTORY_ARCHIVE_DIR):
+        self.archive_dir = archive_dir
+        self._local = threading.local()
+        self._months: List[str] = []
+        self._scanned_mtime: Optional[float] = None
+
+    def path_for(self, month: str) -> str:
+        return os.path.join(self.archive_dir, f"games_{month.replace('-', '_')}.db")
+
+    def months(self) -> List[str]:
+        """Архивные месяцы, новые первыми (список перечитывается при изменении каталога)"""
+        try:
+            mtime = os.stat(self.archive_dir).st_mtime
+        except FileNotFoundError:
+            return []
+        if mtime != self._scanned_mtime:
+            self._months = sorted(
+                (name[6:-3].replace('_', '-') for name in os.listdir(self.archive_dir)
+                 if name.startswith('games_') and name.endswith('.db')),
+                reverse=True
+            )
+            self._scanned_mtime = mtime
+        return self._months
+
+    # ===== ЧТЕНИЕ =====
+
+    def _reader(self, month: str) -> sqlite3.Connection:
+        """Соединение только для чтения с архивом месяца (свое у каждого потока)"""
+        readers = getattr(self._local, 'readers', None)
+        if readers is None:
+            readers = self._local.readers = {}
+        conn = readers.get(month)
+        if conn is None:
+            conn = readers[month] = sqlite3.connect(f"file:{self.path_for(month)}?mode=ro", uri=True)
+        return conn
+
+    def recent_games(self, user_id: int, limit: int, exclude_ids=()) -> List[tuple]:
+        """Последние игры игрока из архивов (строки в порядке RECENT_COLUMNS)"""
+        rows = []
+        seen = set(exclude_ids)
+        for month in self.months():
+            if len(rows) >= limit:
+                break
+            try:
+                found = self._reader(month).execute(f'''
+                    SELECT {RECENT_COLUMNS} FROM games
+                    WHERE user_id = ?
+                    ORDER BY played_at DESC
+                    LIMIT ?
+                ''', (user_id, limit - len(rows) + len(exclude_ids))).fetchall()
+            except sqlite3.Error as e:
+                logger.error(f"❌ Ошибка чтения архива {month}: {e}")
+                continue
+            for row in found:
+                # Строка может быть и в основной БД, если перенос прервался
+                if row[0] not in seen and len(rows) < limit:
+                    seen.add(row[0])
+                    rows.append(row)
+        return rows
+
+    def monthly_totals(self, user_id: int) -> List[Dict]:
+        """Итоги игрока по архивным месяцам (из свертки по дням)"""
+        totals = []
+        for month in self.months():
+            try:
+                row = self._reader(month).execute('''
+                    SELECT SUM(games), SUM(total_score), MAX(best_score)
+                    FROM daily_rollup WHERE user_id = ?
+                ''', (user_id,)).fetchone()
+            except sqlite3.Error as e:
+                logger.error(f"❌ Ошибка чтения архива {month}: {e}")
+                continue
+            if row[0]:
+                totals.append({'month': month, 'games': row[0], 'total_score': row[1], 'best_score': row[2]})
+        return totals
+
+    # ===== ПЕРЕНОС =====
+
+    def archive_old(self, conn: sqlite3.Connection, hot_days: int = HISTORY_HOT_DAYS,
+                    chunk_rows: int = HISTORY_ARCHIVE_CHUNK) -> Dict[str, int]:
+        """Перенести в архив все месяцы, целиком старше hot_days. {месяц: игр}"""
+        cutoff = time.time() - hot_days * 86400
+        oldest = conn.execute('SELECT MIN(played_at) FROM games').fetchone()[0]
+        moved = {}
+        month = month_of(oldest) if oldest is not None else None
+        while month is not None:
+            start, end = month_bounds(month)
+            if end > cutoff:
+                break
+            count = self.archive_month(conn, month, chunk_rows)
+            if count:
+                moved[month] = count
+            month = month_of(end)
+        return moved
+
+    def archive_month(self, conn: sqlite3.Connection, month: str,
+                      chunk_rows: int = HISTORY_ARCHIVE_CHUNK) -> int:
+        """Перенести игры месяца в его архивный файл. Возвращает число игр"""
+        start, end = month_bounds(month)
+        if not conn.execute(
+            'SELECT 1 FROM games WHERE played_at >= ? AND played_at < ? LIMIT 1', (start, end)
+        ).fetchone():
+            return 0
+
+        os.makedirs(self.archive_dir, exist_ok=True)
+        moved = 0
+        started = time.perf_counter()
+        conn.execute('ATTACH DATABASE ? AS archive', (self.path_for(month),))
+        try:
+            for sql in ARCHIVE_SCHEMA:
+                conn.execute(sql)
+            # Архивы, созданные до появления games.level_deltas
+            if 'level_deltas' not in {row[1] for row in conn.execute('PRAGMA archive.table_info(games)')}:
+                conn.execute('ALTER TABLE archive.games ADD COLUMN level_deltas BLOB')
+            conn.commit()
+
+            while True:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    ids = [row[0] for row in conn.execute('''
+                        SELECT id FROM main.games WHERE played_at >= ? AND played_at < ? LIMIT ?
+                    ''', (start, end, chunk_rows))]
+                    if not ids:
+                        conn.commit()
+                        break
+                    placeholders = ','.join('?' * len(ids))
+                    conn.execute(f'''
+                        INSERT OR REPLACE INTO archive.games
+                            (id, user_id, score, level, difficulty, duration_seconds,
+                             enemies_killed, accuracy_percent, played_at, level_deltas)
+                        SELECT id, user_id, score, level, difficulty, duration_seconds,
+                               enemies_killed, accuracy_percent, played_at, level_deltas
+                        FROM main.games WHERE id IN ({placeholders})
+                    ''', ids)
+                    conn.execute(f'''
+                        INSERT INTO main.history_archives (month, games, total_score, max_score)
+                        SELECT ?, COUNT(*), COALESCE(SUM(score), 0), COALESCE(MAX(score), 0)
+                        FROM main.games WHERE id IN ({placeholders})
+                        ON CONFLICT(month) DO UPDATE SET
+                            games = games + excluded.games,
+                            total_score = total_score + excluded.total_score,
+                            max_score = MAX(max_score, excluded.max_score),
+                            archived_at = CURRENT_TIMESTAMP
+                    ''', [month, *ids])
+                    conn.execute(f'DELETE FROM main.games WHERE id IN ({placeholders})', ids)
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                moved += len(ids)
+
+            # Свертка пересчитывается по архиву целиком: повторный запуск ее не удвоит
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute('DELETE FROM archive.daily_rollup')
+                conn.execute('''
+                    INSERT INTO archive.daily_rollup
+                    SELECT user_id, played_at / 86400, COUNT(*), SUM(score), MAX(score),
+                           SUM(duration_seconds), SUM(enemies_killed), SUM(accuracy_percent)
+                    FROM archive.games
+                    GROUP BY user_id, played_at / 86400
+                ''')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        finally:
+            conn.execute('DETACH DATABASE archive')
+
+        logger.info(f"📦 Месяц {month} перенесен в архив: {moved} игр за {time.perf_counter() - started:.1f} с")
+        return moved
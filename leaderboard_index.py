@@ -0,0 +1,212 @@
+"""
+Leaderboard rank index for Space Shooter Bot
+Индекс рейтинга в памяти: ранг, соседи и топ-N без запросов к SQLite
+"""
+
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class LeaderboardIndex:
+    """Упорядоченный индекс игроков по ключу (best_score DESC, games_played ASC)
+
+    Ключи хранятся в отсортированных блоках ограниченного размера, а размеры
+    блоков — в дереве Фенвика, поэтому ранг и позиция считаются за O(log n).
+    """
+
+    LOAD = 512
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._buckets: List[List[Tuple[int, int, int]]] = []
+        self._maxes: List[Tuple[int, int, int]] = []
+        self._tree: List[int] = []
+        self._keys: Dict[int, Tuple[int, int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._keys
+
+    # ===== ДЕРЕВО ФЕНВИКА =====
+
+    def _rebuild_tree(self):
+        """Пересобрать дерево Фенвика по размерам блоков за O(n)"""
+        tree = [len(bucket) for bucket in self._buckets]
+        for i in range(len(tree)):
+            parent = i | (i + 1)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, pos: int, delta: int):
+        while pos < len(self._tree):
+            self._tree[pos] += delta
+            pos |= pos + 1
+
+    def _tree_prefix(self, pos: int) -> int:
+        """Сумма размеров блоков [0, pos)"""
+        total = 0
+        while pos > 0:
+            total += self._tree[pos - 1]
+            pos &= pos - 1
+        return total
+
+    def _tree_find(self, idx: int) -> Tuple[int, int]:
+        """Найти блок и смещение в нём для позиции idx"""
+        pos = 0
+        step = 1 << len(self._tree).bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= len(self._tree) and self._tree[nxt - 1] <= idx:
+                idx -= self._tree[nxt - 1]
+                pos = nxt
+            step >>= 1
+        return pos, idx
+
+    # ===== ИЗМЕНЕНИЕ =====
+
+    @staticmethod
+    def _make_key(user_id: int, best_score: int, games_played: int) -> Tuple[int, int, int]:
+        return (-(best_score or 0), games_played or 0, user_id)
+
+    def rebuild(self, rows: Iterable[Tuple[int, int, int]]):
+        """Полностью пересобрать индекс из строк (user_id, best_score, games_played)"""
+        with self._lock:
+            keys = {row[0]: self._make_key(*row) for row in rows}
+            ordered = sorted(keys.values())
+            self._keys = keys
+            self._buckets = [ordered[i:i + self.LOAD] for i in range(0, len(ordered), self.LOAD)]
+            self._maxes = [bucket[-1] for bucket in self._buckets]
+            self._rebuild_tree()
+
+    def _insert(self, key: Tuple[int, int, int]):
+        if not self._buckets:
+            self._buckets.append([key])
+            self._maxes.append(key)
+            self._rebuild_tree()
+            return
+
+        pos = bisect_left(self._maxes, key)
+        if pos == len(self._maxes):
+            pos -= 1
+        bucket = self._buckets[pos]
+        insort(bucket, key)
+        self._maxes[pos] = bucket[-1]
+
+        if len(bucket) > 2 * self.LOAD:
+            # Делим переполненный блок пополам
+            self._buckets[pos:pos + 1] = [bucket[:self.LOAD], bucket[self.LOAD:]]
+            self._maxes[pos:pos + 1] = [bucket[self.LOAD - 1], bucket[-1]]
+            self._rebuild_tree()
+        else:
+            self._tree_add(pos, 1)
+
+    def _remove(self, key: Tuple[int, int, int]):
+        pos = bisect_left(self._maxes, key)
+        bucket = self._buckets[pos]
+        del bucket[bisect_left(bucket, key)]
+
+        if not bucket:
+            del self._buckets[pos]
+            del self._maxes[pos]
+            self._rebuild_tree()
+        else:
+            self._maxes[pos] = bucket[-1]
+            self._tree_add(pos, -1)
+
+    def update(self, user_id: int, best_score: int, games_played: int):
+        """Добавить игрока или обновить его позицию"""
+        key = self._make_key(user_id, best_score, games_played)
+        with self._lock:
+            old_key = self._keys.get(user_id)
+            if old_key == key:
+                return
+            if old_key is not None:
+                self._remove(old_key)
+            self._insert(key)
+            self._keys[user_id] = key
+
+    def discard(self, user_id: int):
+        """Удалить игрока из индекса"""
+        with self._lock:
+            key = self._keys.pop(user_id, None)
+            if key is not None:
+                self._remove(key)
+
+    # ===== ЗАПРОСЫ =====
+
+    def _count_less(self, key: tuple) -> int:
+        """Количество ключей строго меньше key"""
+        pos = bisect_left(self._maxes, key)
+        if pos == len(self._maxes):
+            return len(self._keys)
+        return self._tree_prefix(pos) + bisect_left(self._buckets[pos], key)
+
+    def _at(self, idx: int) -> Tuple[int, int, int]:
+        pos, offset = self._tree_find(idx)
+        return self._buckets[pos][offset]
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """Место игрока в рейтинге (игроки с одинаковым ключом делят место)"""
+        with self._lock:
+            key = self._keys.get(user_id)
+            if key is None:
+                return None
+            return self._count_less(key[:2]) + 1
+
+    def rank_for(self, user_id: int, best_score: int, games_played: int,
+                 pending: Optional[Dict[int, Tuple[int, int]]] = None) -> int:
+        """Место, которое займёт игрок с указанными показателями
+
+        pending — {user_id: (best_score, games_played)} игроков, чьи новые
+        показатели еще не записаны в индекс (предыдущие игроки той же пачки
+        save_games): они учитываются с новыми показателями вместо старых.
+        """
+        key = self._make_key(user_id, best_score, games_played)
+        with self._lock:
+            rank = self._count_less(key[:2]) + 1
+            old_key = self._keys.get(user_id)
+            # Текущая запись самого игрока не должна учитываться
+            if old_key is not None and old_key[:2] < key[:2]:
+                rank -= 1
+            for other_id, (other_best, other_games) in (pending or {}).items():
+                if other_id == user_id:
+                    continue
+                other_old = self._keys.get(other_id)
+                was_above = other_old is not None and other_old[:2] < key[:2]
+                is_above = self._make_key(other_id, other_best, other_games)[:2] < key[:2]
+                rank += is_above - was_above
+            return rank
+
+    def _entry(self, key: Tuple[int, int, int]) -> Dict:
+        return {
+            'user_id': key[2],
+            'best_score': -key[0],
+            'games_played': key[1],
+            'rank': self._count_less(key[:2]) + 1
+        }
+
+    def top(self, limit: int = 10, min_score: int = 1) -> List[Dict]:
+        """Первые limit игроков с best_score >= min_score"""
+        result = []
+        with self._lock:
+            for bucket in self._buckets:
+                for key in bucket:
+                    if len(result) >= limit or -key[0] < min_score:
+                        return result
+                    result.append(self._entry(key))
+        return result
+
+    def around(self, user_id: int, radius: int = 2) -> List[Dict]:
+        """Игрок и его соседи по рейтингу (radius сверху и снизу)"""
+        with self._lock:
+            key = self._keys.get(user_id)
+            if key is None:
+                return []
+            position = self._count_less(key)
+            start = max(0, position - radius)
+            end = min(len(self._keys), position + radius + 1)
+            return [self._entry(self._at(i)) for i in range(start, end)]
@@ -0,0 +1,89 @@
+"""
+Level timing for Space Shooter Bot
+Время прохождения уровней: упаковка level_deltas и агрегаты level_timing для балансировки
+
+Секунды на каждый пройденный уровень хранятся в games.level_deltas как
+array('H') с порядком байтов little-endian — по 2 байта на уровень.
+Агрегаты level_timing (по сложности и уровню: игр, сумма секунд, сумма
+квадратов) обновляются в save_games в той же транзакции, что и игра, поэтому
+среднее и разброс времени уровня читаются готовыми строками, без разбора
+логов и чтения games.
+"""
+
+import math
+import sys
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from config import DIFFICULTY_CODES, DIFFICULTY_NAMES
+
+# Предел array('H')
+MAX_LEVEL_SECONDS = 65535
+
+UPSERT_LEVEL_TIMING = '''
+    INSERT INTO level_timing (difficulty, level, games, total_seconds, sum_squares)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(difficulty, level) DO UPDATE SET
+        games = games + excluded.games,
+        total_seconds = total_seconds + excluded.total_seconds,
+        sum_squares = sum_squares + excluded.sum_squares
+'''
+
+
+def pack_level_deltas(deltas: Sequence[int]) -> Optional[bytes]:
+    """level_deltas -> BLOB (None, если дельт нет)"""
+    if not deltas:
+        return None
+    packed = array('H', [min(max(seconds, 0), MAX_LEVEL_SECONDS) for seconds in deltas])
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def unpack_level_deltas(blob: Optional[bytes]) -> List[int]:
+    """BLOB -> список секунд по уровням"""
+    if not blob:
+        return []
+    packed = array('H')
+    packed.frombytes(blob)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed.tolist()
+
+
+def timing_rows(games: Iterable[Tuple[int, Sequence[int]]]) -> List[Tuple[int, int, int, int, int]]:
+    """Приращения level_timing по играм (код сложности, дельты)
+
+    Дельта i — время на уровне i + 1 (от его начала до перехода на следующий).
+    """
+    totals: Dict[Tuple[int, int], List[int]] = {}
+    for difficulty, deltas in games:
+        for level, seconds in enumerate(deltas, 1):
+            seconds = min(max(seconds, 0), MAX_LEVEL_SECONDS)
+            total = totals.get((difficulty, level))
+            if total is None:
+                total = totals[(difficulty, level)] = [0, 0, 0]
+            total[0] += 1
+            total[1] += seconds
+            total[2] += seconds * seconds
+    return [(difficulty, level, *total) for (difficulty, level), total in totals.items()]
+
+
+def level_report(conn, difficulty: str = None) -> List[Dict]:
+    """Среднее и стандартное отклонение времени по уровням (из level_timing)"""
+    sql = 'SELECT difficulty, level, games, total_seconds, sum_squares FROM level_timing'
+    params: tuple = ()
+    if difficulty is not None:
+        sql += ' WHERE difficulty = ?'
+        params = (DIFFICULTY_CODES.get(difficulty, 0),)
+    report = []
+    for code, level, games, total, squares in conn.execute(sql + ' ORDER BY difficulty, level', params):
+        mean = total / games
+        report.append({
+            'difficulty': DIFFICULTY_NAMES.get(code),
+            'level': level,
+            'games': games,
+            'avg_seconds': round(mean, 1),
+            'stddev_seconds': round(math.sqrt(max(squares / games - mean * mean, 0)), 1),
+        })
+    return report
@@ -0,0 +1,123 @@
+"""
+Logging pipeline for Space Shooter Bot
+Неблокирующее логирование: очередь в памяти, запись на диск в отдельном потоке
+
+Обработчики только кладут записи в очередь (без форматирования), а
+QueueListener форматирует их и пишет в файлы с ротацией по размеру.
+Частые INFO-события, помеченные extra=SAMPLED, прореживаются до
+LOG_SAMPLE_RATE; события сессий (extra={'session': {...}}) при заданном
+LOG_SESSIONS_FILE дополнительно пишутся в JSON Lines.
+"""
+
+import atexit
+import itertools
+import json
+import logging
+import queue
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+
+from config import LOG_BACKUP_COUNT, LOG_FILE, LOG_LEVEL, LOG_MAX_BYTES, LOG_SAMPLE_RATE, LOG_SESSIONS_FILE
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# extra для частых INFO-событий, которые можно прореживать
+SAMPLED = {'sampled': True}
+
+# Библиотеки, которые пишут INFO на каждый запрос к Bot API
+NOISY_LOGGERS = ('httpx', 'httpcore')
+
+_listener: Optional[QueueListener] = None
+
+
+class LazyQueueHandler(QueueHandler):
+    """Кладет запись в очередь как есть: msg % args собирается в потоке слушателя
+
+    Аргументы логирования должны быть неизменяемыми (числа, строки, кортежи)
+    или больше не меняться после вызова.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает каждую N-ю запись INFO и ниже с атрибутом sampled"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        self.every = max(1, round(1 / rate)) if rate > 0 else 0
+        self._counter = itertools.count()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or not getattr(record, 'sampled', False) or self.rate >= 1:
+            return True
+        if not self.every:
+            return False
+        return next(self._counter) % self.every == 0
+
+
+class SessionFilter(logging.Filter):
+    """Только записи с данными сессии (extra={'session': {...}})"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return hasattr(record, 'session')
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        event = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'severity': record.levelname,
+            'logger': record.name,
+        }
+        event.update(getattr(record, 'session', {}))
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+def _rotating(path: str) -> RotatingFileHandler:
+    return RotatingFileHandler(
+        path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8', delay=True
+    )
+
+
+def setup_logging(level: str = LOG_LEVEL, log_file: str = LOG_FILE,
+                  sessions_file: str = LOG_SESSIONS_FILE,
+                  sample_rate: float = LOG_SAMPLE_RATE) -> QueueListener:
+    """Настроить корневой логгер на очередь и запустить поток записи"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = []
+    for handler in (_rotating(log_file), logging.StreamHandler()):
+        handler.setFormatter(formatter)
+        handlers.append(handler)
+    if sessions_file:
+        sessions = _rotating(sessions_file)
+        sessions.setFormatter(JsonLinesFormatter())
+        sessions.addFilter(SessionFilter())
+        handlers.append(sessions)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    for name in NOISY_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # Дописать очередь на диск при выходе из процесса
+    atexit.register(_listener.stop)
+    return _listener
@@ -0,0 +1,287 @@
+"""
+Metrics for Space Shooter Bot
+Задержки обработчиков и запросов к БД, ошибки и кэш в формате Prometheus
+
+Выключенный реестр (METRICS_ENABLED=0) ничего не оборачивает:
+instrument_handler и instrument_methods возвращают исходные функции.
+"""
+
+import asyncio
+import functools
+import inspect
+import logging
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import METRICS_ENABLED, METRICS_HOST, METRICS_PORT
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Описания метрик: имя -> (тип, описание, имена меток)
+METRICS = {
+    'bot_handler_duration_seconds': ('histogram', 'Время обработки обновления', ('handler',)),
+    'bot_handler_errors_total': ('counter', 'Исключения в обработчиках', ('handler',)),
+    'bot_db_query_duration_seconds': ('histogram', 'Время вызова метода БД', ('component', 'method')),
+    'bot_db_query_errors_total': ('counter', 'Исключения в методах БД', ('component', 'method')),
+    'bot_db_lock_wait_seconds': ('histogram', 'Ожидание блокировки записи BEGIN IMMEDIATE', ('operation',)),
+    'bot_log_errors_total': ('counter', 'Записи лога уровня ERROR и выше', ('logger',)),
+    'bot_games_quarantined_total': ('counter', 'Результаты игр, отправленные в карантин', ('reason',)),
+}
+
+# Сэмплы коллектора: (имя, тип, описание, [(метки, значение)])
+Samples = Iterable[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами LATENCY_BUCKETS"""
+
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля сверху: граница корзины, где накопилась доля q"""
+        rank, cumulative = q * self.count, 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return float('inf')
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class MetricsRegistry:
+    """Реестр гистограмм и счетчиков (потокобезопасный: методы БД идут из пула потоков)"""
+
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[Tuple, Histogram]] = {}
+        self._counters: Dict[str, Dict[Tuple, float]] = {}
+        self._collectors: List[Callable[[], Samples]] = []
+
+    # ===== ЗАПИСЬ =====
+
+    def observe(self, name: str, labels: Tuple, seconds: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name: str, labels: Tuple, value: float = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0) + value
+
+    def add_collector(self, collector: Callable[[], Samples]):
+        """Функция, возвращающая готовые значения в момент выгрузки (кэш, очереди)"""
+        if self.enabled:
+            self._collectors.append(collector)
+
+    # ===== ИНСТРУМЕНТИРОВАНИЕ =====
+
+    def instrument_handler(self, func: Callable, name: str = None) -> Callable:
+        """Обернуть обработчик Telegram: время выполнения и исключения"""
+        if not self.enabled:
+            return func
+        name = name or func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(update, context):
+            started = time.perf_counter()
+            try:
+                return await func(update, context)
+            except Exception:
+                self.inc('bot_handler_errors_total', (name,))
+                raise
+            finally:
+                self.observe('bot_handler_duration_seconds', (name,), time.perf_counter() - started)
+        return wrapper
+
+    def _timed_method(self, method: Callable, labels: Tuple) -> Callable:
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            except Exception:
+                self.inc('bot_db_query_errors_total', labels)
+                raise
+            finally:
+                self.observe('bot_db_query_duration_seconds', labels, time.perf_counter() - started)
+        return wrapper
+
+    def instrument_methods(self, obj, component: str, exclude: Iterable[str] = ()):
+        """Обернуть публичные методы экземпляра (Database, AdminUtils)"""
+        if not self.enabled:
+            return
+        exclude = set(exclude)
+        for name, attr in inspect.getmembers(type(obj)):
+            if name.startswith('_') or name in exclude or not inspect.isfunction(attr):
+                continue
+            method = getattr(obj, name)
+            if inspect.ismethod(method):
+                setattr(obj, name, self._timed_method(method, (component, name)))
+
+    def install_log_counter(self):
+        """Считать записи лога уровня ERROR по логгерам"""
+        if self.enabled:
+            logging.getLogger().addHandler(_ErrorCounter(self))
+
+    # ===== ВЫГРУЗКА =====
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        with self._lock:
+            histograms = {name: {k: (list(h.counts), h.sum, h.count) for k, h in series.items()}
+                          for name, series in self._histograms.items()}
+            counters = {name: dict(series) for name, series in self._counters.items()}
+
+        for name, series in histograms.items():
+            _, description, label_names = METRICS[name]
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} histogram"]
+            for labels, (counts, total, count) in sorted(series.items()):
+                cumulative = 0
+                for bound, bucket in zip(LATENCY_BUCKETS, counts):
+                    cumulative += bucket
+                    le = f'le="{bound}"'
+                    lines.append(f'{name}_bucket{_labels(label_names, labels, le)} {cumulative}')
+                le = 'le="+Inf"'
+                lines.append(f'{name}_bucket{_labels(label_names, labels, le)} {count}')
+                lines.append(f'{name}_sum{_labels(label_names, labels)} {total:.6f}')
+                lines.append(f'{name}_count{_labels(label_names, labels)} {count}')
+
+        for name, series in counters.items():
+            _, description, label_names = METRICS[name]
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} counter"]
+            for labels, value in sorted(series.items()):
+                lines.append(f'{name}{_labels(label_names, labels)} {value}')
+
+        for collector in self._collectors:
+            try:
+                for name, kind, description, samples in collector():
+                    lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+                    for labels, value in samples:
+                        lines.append(f'{name}{_labels(tuple(labels), tuple(labels.values()))} {value}')
+            except Exception as e:
+                logger.error(f"❌ Ошибка сбора метрик: {e}")
+        return '\n'.join(lines) + '\n'
+
+    def summary(self, limit: int = 8) -> str:
+        """Короткая сводка для админ-команды"""
+        if not self.enabled:
+            return "Метрики выключены (METRICS_ENABLED=0)"
+
+        with self._lock:
+            handlers = dict(self._histograms.get('bot_handler_duration_seconds', {}))
+            queries = dict(self._histograms.get('bot_db_query_duration_seconds', {}))
+            lock_waits = dict(self._histograms.get('bot_db_lock_wait_seconds', {}))
+            errors = dict(self._counters.get('bot_handler_errors_total', {}))
+
+        def row(label: str, h: Histogram, extra: str = '') -> str:
+            return (f"{label[:22]:<22} {h.count:>7} {h.quantile(0.5) * 1000:>7.1f} "
+                    f"{h.quantile(0.95) * 1000:>7.1f}{extra}")
+
+        lines = [f"{'обработчик':<22} {'n':>7} {'p50 мс':>7} {'p95 мс':>7} ош."]
+        for labels, h in sorted(handlers.items(), key=lambda item: -item[1].count)[:limit]:
+            lines.append(row(labels[0], h, f" {int(errors.get(labels, 0))}"))
+
+        lines += ['', f"{'запрос БД':<22} {'n':>7} {'p50 мс':>7} {'p95 мс':>7}"]
+        for labels, h in sorted(queries.items(), key=lambda item: -item[1].sum)[:limit]:
+            lines.append(row(labels[1], h))
+
+        if lock_waits:
+            lines += ['', 'ожидание BEGIN IMMEDIATE']
+            for labels, h in lock_waits.items():
+                lines.append(row(labels[0], h))
+
+        for collector in self._collectors:
+            for name, _, _, samples in collector():
+                if name == 'bot_cache_hit_ratio':
+                    lines += ['', 'попадания в кэш']
+                    lines += [f"{labels['namespace']:<22} {value:.1%}" for labels, value in samples]
+        return '\n'.join(lines)
+
+
+class _ErrorCounter(logging.Handler):
+    def __init__(self, registry: MetricsRegistry):
+        super().__init__(level=logging.ERROR)
+        self.registry = registry
+
+    def emit(self, record: logging.LogRecord):
+        self.registry.inc('bot_log_errors_total', (record.name,))
+
+
+class MetricsServer:
+    """HTTP-сервер для Prometheus: GET /metrics"""
+
+    def __init__(self, registry: MetricsRegistry, host: str = METRICS_HOST, port: int = METRICS_PORT):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.base_events.Server] = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"✅ Метрики доступны на http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?', 1)[0] == '/metrics':
+                # Сборка идет под блокировкой реестра, но без ввода-вывода — достаточно быстро
+                status, body = '200 OK', self.registry.render().encode()
+            else:
+                status, body = '404 Not Found', b''
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('latin-1') + body
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+metrics = MetricsRegistry()
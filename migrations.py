@@ -0,0 +1,374 @@
+"""
+Schema migrations for Space Shooter Bot
+Версионирование схемы БД: упорядоченные идемпотентные миграции и таблица schema_version
+
+Каждая миграция выполняется в своей транзакции BEGIN IMMEDIATE вместе с
+записью в schema_version, поэтому прерванная миграция откатывается целиком,
+а несколько процессов (бот, admin_utils) не применят одну миграцию дважды.
+Миграции пишутся идемпотентными (IF NOT EXISTS, проверка колонок), чтобы
+базы, созданные до появления schema_version, проходили их без ошибок.
+
+Миграции с transactional=False (перенос больших таблиц по частям) сами
+управляют транзакциями и должны быть возобновляемыми: версия записывается
+после их завершения, а прерванная миграция при следующем запуске продолжается.
+
+Новая миграция — функция с декоратором @migration(<следующая версия>, "описание").
+"""
+
+import logging
+import sqlite3
+from dataclasses import dataclass
+from typing import Callable, Dict, List
+
+from achievements import achievement_engine
+from compact_schema import CompactMigration
+
+logger = logging.getLogger(__name__)
+
+
+class MigrationError(Exception):
+    """Ошибка применения миграции"""
+    pass
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    apply: Callable[[sqlite3.Cursor], None]
+    transactional: bool = True
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, name: str, transactional: bool = True):
+    """Зарегистрировать функцию миграции схемы до версии version"""
+    def register(func: Callable[[sqlite3.Cursor], None]):
+        if any(existing.version == version for existing in MIGRATIONS):
+            raise ValueError(f"Миграция {version} уже зарегистрирована")
+        MIGRATIONS.append(Migration(version, name, func, transactional))
+        MIGRATIONS.sort(key=lambda item: item.version)
+        return func
+    return register
+
+
+def ensure_column(cursor, table: str, column: str, definition: str) -> bool:
+    """Добавить колонку в существующую таблицу, если её нет"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    if column in {row[1] for row in cursor.fetchall()}:
+        return False
+    cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    logger.info(f"✅ Добавлена колонка {table}.{column}")
+    return True
+
+
+# ===== МИГРАЦИИ =====
+
+@migration(1, "базовая схема")
+def _baseline(cursor):
+    # Таблица пользователей
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            language_code TEXT DEFAULT 'ru',
+            is_premium INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Таблица игр
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS games (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            score INTEGER,
+            level INTEGER,
+            difficulty TEXT,
+            duration_seconds INTEGER DEFAULT 0,
+            enemies_killed INTEGER DEFAULT 0,
+            accuracy_percent REAL DEFAULT 0,
+            played_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_games_user_id ON games(user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_games_score ON games(score DESC)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_games_played_at ON games(played_at DESC)')
+
+    # Таблица статистики (денормализованная для производительности)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            best_score INTEGER DEFAULT 0,
+            max_level INTEGER DEFAULT 0,
+            games_played INTEGER DEFAULT 0,
+            total_score INTEGER DEFAULT 0,
+            total_playtime_seconds INTEGER DEFAULT 0,
+            total_enemies_killed INTEGER DEFAULT 0,
+            avg_accuracy REAL DEFAULT 0,
+            easy_games INTEGER DEFAULT 0,
+            normal_games INTEGER DEFAULT 0,
+            hard_games INTEGER DEFAULT 0,
+            nightmare_games INTEGER DEFAULT 0,
+            win_streak INTEGER DEFAULT 0,
+            best_win_streak INTEGER DEFAULT 0,
+            achievement_mask INTEGER DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+
+    # Таблица достижений
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS achievements (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            achievement_key TEXT,
+            unlocked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(user_id, achievement_key),
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_achievements_user_id ON achievements(user_id)')
+
+    # Таблица ежедневных заданий
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_challenges (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            challenge_type TEXT,
+            target_value INTEGER,
+            current_value INTEGER DEFAULT 0,
+            completed INTEGER DEFAULT 0,
+            reward_claimed INTEGER DEFAULT 0,
+            date DATE DEFAULT (date('now')),
+            UNIQUE(user_id, challenge_type, date),
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+
+    # Битовая маска достижений для БД, созданных до её появления
+    if ensure_column(cursor, 'user_stats', 'achievement_mask', 'INTEGER DEFAULT 0'):
+        _backfill_achievement_masks(cursor)
+
+    # Глобальные счетчики (поддерживаются save_games, одна строка)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS global_counters (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total_users INTEGER DEFAULT 0,
+            total_games INTEGER DEFAULT 0,
+            total_score INTEGER DEFAULT 0,
+            max_score INTEGER DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Таблица сессий (для аналитики)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            ended_at TIMESTAMP,
+            games_count INTEGER DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+
+
+def _backfill_achievement_masks(cursor):
+    """Заполнить achievement_mask по таблице achievements"""
+    cursor.execute('SELECT user_id, achievement_key FROM achievements')
+    keys_by_user: Dict[int, List[str]] = {}
+    for user_id, key in cursor.fetchall():
+        keys_by_user.setdefault(user_id, []).append(key)
+    cursor.executemany('''
+        UPDATE user_stats SET achievement_mask = ? WHERE user_id = ?
+    ''', [
+        (achievement_engine.mask_of(keys), user_id)
+        for user_id, keys in keys_by_user.items()
+    ])
+
+
+@migration(2, "индексы для горячих запросов")
+def _hot_query_indexes(cursor):
+    # Порядок рейтинга (как в LeaderboardIndex): export_leaderboard и выборки топа
+    # читают индекс по порядку, user_id берется из rowid без обращения к таблице
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_user_stats_rank
+        ON user_stats(best_score DESC, games_played ASC)
+    ''')
+
+    # Последние игры игрока без сортировки; заменяет idx_games_user_id
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_games_user_played
+        ON games(user_id, played_at DESC)
+    ''')
+    cursor.execute('DROP INDEX IF EXISTS idx_games_user_id')
+
+    # Достижения игрока по дате: покрывающий, таблица не читается
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_achievements_user_unlocked
+        ON achievements(user_id, unlocked_at DESC, achievement_key)
+    ''')
+    cursor.execute('DROP INDEX IF EXISTS idx_achievements_user_id')
+
+    # Задания на сегодня, не перебирая все дни игрока
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_daily_challenges_user_date
+        ON daily_challenges(user_id, date)
+    ''')
+
+
+@migration(3, "компактная схема games и achievements", transactional=False)
+def _compact_schema(cursor):
+    # Если перенос уже шел онлайн (python compact_schema.py), остается только хвост
+    CompactMigration(cursor.connection).run()
+
+
+@migration(4, "итоги архивных месяцев истории игр")
+def _history_archives(cursor):
+    # Заполняется history_archive.GameArchive при переносе месяца в архив
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS history_archives (
+            month TEXT PRIMARY KEY,
+            games INTEGER NOT NULL DEFAULT 0,
+            total_score INTEGER NOT NULL DEFAULT 0,
+            max_score INTEGER NOT NULL DEFAULT 0,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+@migration(5, "карантин неправдоподобных результатов")
+def _quarantined_games(cursor):
+    # Результаты, не прошедшие plausibility.check: в games и user_stats не попадают
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS quarantined_games (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            score INTEGER,
+            level INTEGER,
+            difficulty INTEGER NOT NULL DEFAULT 0,
+            duration_seconds INTEGER DEFAULT 0,
+            enemies_killed INTEGER DEFAULT 0,
+            accuracy_percent REAL DEFAULT 0,
+            bosses_killed INTEGER DEFAULT 0,
+            level_deltas TEXT,
+            reason TEXT NOT NULL,
+            received_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_quarantined_games_user
+        ON quarantined_games(user_id, received_at DESC)
+    ''')
+
+
+@migration(6, "время уровней и боссы")
+def _level_timing(cursor):
+    # Секунды на каждый уровень, упакованные level_stats.pack_level_deltas
+    ensure_column(cursor, 'games', 'level_deltas', 'BLOB')
+    ensure_column(cursor, 'user_stats', 'total_bosses_killed', 'INTEGER DEFAULT 0')
+    # Агрегаты по сложности и уровню (обновляются в save_games)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS level_timing (
+            difficulty INTEGER NOT NULL,
+            level INTEGER NOT NULL,
+            games INTEGER NOT NULL DEFAULT 0,
+            total_seconds INTEGER NOT NULL DEFAULT 0,
+            sum_squares INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (difficulty, level)
+        ) WITHOUT ROWID
+    ''')
+
+
+@migration(7, "гистограмма лучшего счета для перцентилей")
+def _score_histogram(cursor):
+    # Лучший счет игрока на каждой сложности (обновляется в save_games)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS difficulty_best (
+            user_id INTEGER NOT NULL,
+            difficulty INTEGER NOT NULL,
+            best_score INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, difficulty)
+        ) WITHOUT ROWID
+    ''')
+    # Игры из архивных месяцев сюда не попадают: их рекорды уже учтены в user_stats
+    cursor.execute('''
+        INSERT OR IGNORE INTO difficulty_best (user_id, difficulty, best_score)
+        SELECT user_id, difficulty, MAX(score)
+        FROM games
+        WHERE difficulty > 0
+        GROUP BY user_id, difficulty
+    ''')
+    # Игроков по корзинам лучшего счета; заполняется Database при первом запуске
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS score_histogram (
+            difficulty INTEGER NOT NULL,
+            floor INTEGER NOT NULL,
+            players INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (difficulty, floor)
+        ) WITHOUT ROWID
+    ''')
+
+
+# ===== ПРИМЕНЕНИЕ =====
+
+def current_version(conn: sqlite3.Connection) -> int:
+    """Версия схемы БД (0 — миграции еще не применялись)"""
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def migrate(conn: sqlite3.Connection, target: int = None) -> List[int]:
+    """Применить миграции до версии target (по умолчанию до последней)
+
+    Возвращает номера примененных миграций.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+    target = target if target is not None else (MIGRATIONS[-1].version if MIGRATIONS else 0)
+    applied = []
+    for item in MIGRATIONS:
+        if item.version > target or item.version <= current_version(conn):
+            continue
+
+        cursor = conn.cursor()
+        try:
+            if not item.transactional:
+                item.apply(cursor)
+            cursor.execute('BEGIN IMMEDIATE')
+            # Другой процесс мог применить миграцию, пока мы ждали блокировку
+            if item.version <= current_version(conn):
+                conn.rollback()
+                continue
+            if item.transactional:
+                item.apply(cursor)
+            cursor.execute(
+                'INSERT INTO schema_version (version, name) VALUES (?, ?)', (item.version, item.name)
+            )
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise MigrationError(f"Миграция {item.version} ({item.name}) не применена: {e}") from e
+
+        applied.append(item.version)
+        logger.info(f"✅ Миграция {item.version} применена: {item.name}")
+
+    if applied:
+        # Планировщику нужна статистика по новым индексам
+        conn.execute('PRAGMA optimize')
+    return applied
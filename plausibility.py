@@ -0,0 +1,127 @@
+"""
+Plausibility checks for Space Shooter Bot
+Проверка правдоподобия результатов игры до записи в БД
+
+Результат сверяется по двум видам признаков:
+  - структурные: сколько секунд нужно на пройденные уровни и согласуются
+    ли level_deltas с level и duration_seconds;
+  - отношения: очки в секунду и очки на убитого врага и уровень,
+    нормированные на score_multiplier сложности. Порог — квантиль
+    PLAUSIBILITY_QUANTILE распределения по последним играм этой сложности
+    (пересчитывается раз в PLAUSIBILITY_REFRESH_MINUTES), умноженный на
+    PLAUSIBILITY_MARGIN.
+
+Счет не выше медианы сложности принимается без проверки отношений: рейтинг
+он почти не меняет, а честных игр такого счета большинство. Вся проверка —
+несколько сравнений над уже готовыми порогами, без обращений к БД.
+"""
+
+import logging
+from typing import Dict, Iterable, Optional, Tuple
+
+from config import (
+    DIFFICULTIES, DIFFICULTY_NAMES, PLAUSIBILITY_DEFAULT_LIMITS, PLAUSIBILITY_DURATION_SLACK,
+    PLAUSIBILITY_MARGIN, PLAUSIBILITY_MIN_LEVEL_SECONDS, PLAUSIBILITY_MIN_SAMPLES,
+    PLAUSIBILITY_QUANTILE, PLAUSIBILITY_SAFE_QUANTILE
+)
+from webapp_payload import GameResult
+
+logger = logging.getLogger(__name__)
+
+
+def points_per_second(score: int, duration_seconds: int, multiplier: float) -> float:
+    return score / (max(duration_seconds, 1) * multiplier)
+
+
+def points_per_kill(score: int, enemies_killed: int, level: int, multiplier: float) -> float:
+    # За врага начисляется база * уровень * множитель сложности * комбо
+    return score / ((enemies_killed + 1) * max(level, 1) * multiplier)
+
+
+def quantile(ordered: list, q: float) -> float:
+    """Квантиль по отсортированному списку"""
+    return ordered[min(len(ordered) - 1, int(q * (len(ordered) - 1)))]
+
+
+class PlausibilityModel:
+    """Пороги правдоподобия по сложностям"""
+
+    def __init__(self):
+        # сложность -> (очков в секунду, очков на врага, счет без проверки, игр в выборке)
+        self.limits: Dict[str, Tuple[float, float, int, int]] = self._default_limits()
+
+    @staticmethod
+    def _default_limits() -> Dict[str, Tuple[float, float, int, int]]:
+        return {
+            name: (
+                PLAUSIBILITY_DEFAULT_LIMITS['points_per_second'],
+                PLAUSIBILITY_DEFAULT_LIMITS['points_per_kill'],
+                int(PLAUSIBILITY_DEFAULT_LIMITS['safe_score'] * settings.score_multiplier),
+                0
+            )
+            for name, settings in DIFFICULTIES.items()
+        }
+
+    def refresh(self, rows: Iterable[tuple]) -> Dict[str, int]:
+        """Пересчитать пороги по играм (difficulty, score, level, duration_seconds, enemies_killed)
+
+        Возвращает число игр в выборке по сложностям.
+        """
+        samples: Dict[str, tuple] = {name: ([], [], []) for name in DIFFICULTIES}
+        for code, score, level, duration, kills in rows:
+            name = DIFFICULTY_NAMES.get(code)
+            if name not in samples:
+                continue
+            multiplier = DIFFICULTIES[name].score_multiplier
+            rates, per_kill, scores = samples[name]
+            rates.append(points_per_second(score, duration, multiplier))
+            per_kill.append(points_per_kill(score, kills, level, multiplier))
+            scores.append(score)
+
+        limits = self._default_limits()
+        for name, (rates, per_kill, scores) in samples.items():
+            if len(scores) < PLAUSIBILITY_MIN_SAMPLES:
+                continue
+            rates.sort()
+            per_kill.sort()
+            scores.sort()
+            limits[name] = (
+                quantile(rates, PLAUSIBILITY_QUANTILE) * PLAUSIBILITY_MARGIN,
+                quantile(per_kill, PLAUSIBILITY_QUANTILE) * PLAUSIBILITY_MARGIN,
+                quantile(scores, PLAUSIBILITY_SAFE_QUANTILE),
+                len(scores)
+            )
+        # Словарь заменяется целиком: check в других потоках видит старые или новые пороги
+        self.limits = limits
+        counts = {name: limit[3] for name, limit in limits.items()}
+        logger.info(f"✅ Пороги правдоподобия пересчитаны: {counts}")
+        return counts
+
+    def check(self, result: GameResult) -> Optional[str]:
+        """Причина считать результат неправдоподобным или None"""
+        score = result.score
+        level = result.level
+        duration = result.duration_seconds
+
+        if duration < (level - 1) * PLAUSIBILITY_MIN_LEVEL_SECONDS:
+            return 'level_speed'
+
+        max_rate, max_per_kill, safe_score, _ = self.limits[result.difficulty]
+        if score <= safe_score:
+            return None
+
+        deltas = result.level_deltas
+        # Дельт нет, если игра закончилась на первом уровне
+        if deltas and (len(deltas) >= level + 1 or sum(deltas) > duration + PLAUSIBILITY_DURATION_SLACK):
+            return 'level_deltas'
+
+        multiplier = DIFFICULTIES[result.difficulty].score_multiplier
+        if points_per_second(score, duration, multiplier) > max_rate:
+            return 'points_per_second'
+        if points_per_kill(score, result.enemies_killed, level, multiplier) > max_per_kill:
+            return 'points_per_kill'
+        return None
+
+
+# Глобальный экземпляр
+plausibility = PlausibilityModel()
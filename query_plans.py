@@ -0,0 +1,167 @@
+"""
+Query plan checks for Space Shooter Bot
+Проверка планов запросов Database: без полных сканирований таблиц и сортировок во временном B-дереве
+
+Каждый публичный метод Database вызывается на временной БД с синтетическими
+данными (dataset_populator), SQL, который он выполняет, перехватывается
+через set_trace_callback, и для каждого запроса проверяется EXPLAIN QUERY
+PLAN. Методы, которым полный проход по таблице нужен по смыслу, перечислены
+в ALLOWED_SCANS. Новый публичный метод без записи в CALLS тоже считается
+ошибкой — так проверка не отстает от Database.
+
+Запуск: python query_plans.py  (код возврата 1, если найдены проблемы)
+В составе тестов: python -m pytest tests/test_query_plans.py
+"""
+
+import argparse
+import logging
+import os
+import re
+import sys
+import tempfile
+from typing import Dict, List
+
+# Игрок, от имени которого вызываются методы (есть в синтетических данных)
+PROBE_USER = 1
+
+# Метод Database -> (args, kwargs)
+CALLS = {
+    'add_user': ((PROBE_USER,), {'username': 'probe', 'first_name': 'Probe'}),
+    'touch_user': ((PROBE_USER,), {'username': 'probe2', 'first_name': 'Probe'}),
+    'flush_last_seen': ((), {}),
+    'save_game': ((PROBE_USER, 1500, 5, 'normal', 120, 40, 75.0), {}),
+    'save_games': (([
+        {'user_id': PROBE_USER, 'score': 900, 'level': 3, 'difficulty': 'hard'},
+        {'user_id': PROBE_USER + 1, 'score': 50, 'level': 1, 'difficulty': 'easy'},
+    ],), {}),
+    'quarantine_game': ((PROBE_USER, {'score': 10 ** 6, 'level': 2, 'difficulty': 'easy'}, 'probe'), {}),
+    'get_game_samples': ((), {'limit': 1000}),
+    'get_user_stats': ((PROBE_USER,), {'use_cache': False}),
+    'get_top_players': ((), {'limit': 10}),
+    'get_players_around': ((PROBE_USER,), {}),
+    'get_user_rank': ((PROBE_USER,), {}),
+    'get_score_percentile': ((1500,), {'difficulty': 'normal'}),
+    'get_recent_games': ((PROBE_USER,), {}),
+    'get_user_achievements': ((PROBE_USER,), {}),
+    'get_daily_challenges': ((PROBE_USER,), {}),
+    'get_profile_bundle': ((PROBE_USER,), {}),
+    'get_global_stats': ((), {}),
+    'rebuild_global_counters': ((), {}),
+    'rebuild_score_histogram': ((), {}),
+    'archive_old_games': ((), {'hot_days': 90}),
+    'reload': ((), {}),
+}
+
+# Методы, которые читают таблицу целиком намеренно
+ALLOWED_SCANS = {
+    'rebuild_global_counters': 'сверка пересчитывает счетчики по всем играм',
+    'rebuild_score_histogram': 'гистограмма строится по всем рекордам игроков',
+    'archive_old_games': 'переносит месяц целиком; архив отключается (DETACH) до проверки планов',
+    'reload': 'индекс рейтинга и счетчики строятся по всей таблице',
+}
+
+# Запросы, план которых имеет смысл проверять
+EXPLAINABLE = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE|REPLACE|WITH)\b', re.IGNORECASE)
+
+# Полный проход по таблице: "SCAN games" без индекса
+FULL_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+
+def plan_problems(conn, sql: str) -> List[str]:
+    """Проблемные шаги EXPLAIN QUERY PLAN одного запроса"""
+    problems = []
+    for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}').fetchall():
+        detail = row[-1]
+        if FULL_SCAN.match(detail) or 'USE TEMP B-TREE' in detail:
+            problems.append(detail)
+    return problems
+
+
+def collect_queries(database) -> Dict[str, List[str]]:
+    """SQL, выполняемый каждым методом из CALLS (без повторов)"""
+    queries: Dict[str, List[str]] = {}
+    current: List[str] = []
+
+    def trace(sql: str):
+        if EXPLAINABLE.match(sql) and sql not in current:
+            current.append(sql)
+
+    with database.get_connection() as conn:
+        conn.set_trace_callback(trace)
+        try:
+            for name, (args, kwargs) in CALLS.items():
+                # Без кэша: иначе метод может не дойти до БД
+                database.cache.clear()
+                current = queries[name] = []
+                getattr(database, name)(*args, **kwargs)
+        finally:
+            conn.set_trace_callback(None)
+    return queries
+
+
+def check_query_plans(database) -> Dict[str, List[str]]:
+    """Проблемы по методам: {метод: ["<план> <- <запрос>", ...]}"""
+    from database import Database
+
+    report: Dict[str, List[str]] = {}
+    public = {
+        name for name in vars(Database)
+        if not name.startswith('_') and callable(getattr(Database, name))
+    }
+    for name in sorted(public - set(CALLS) - {'get_connection', 'init_db'}):
+        report[name] = ["метод не вызывается проверкой: добавьте его в CALLS"]
+
+    queries = collect_queries(database)
+    with database.get_connection() as conn:
+        for name, statements in queries.items():
+            if name in ALLOWED_SCANS:
+                continue
+            for sql in statements:
+                for detail in plan_problems(conn, sql):
+                    report.setdefault(name, []).append(f"{detail} <- {' '.join(sql.split())[:160]}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=5000, help='синтетических игроков во временной БД')
+    parser.add_argument('--verbose', action='store_true', help='печатать все запросы и их планы')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # database.db создается при импорте, поэтому путь задается до импорта
+        os.environ['DATABASE_NAME'] = os.path.join(tmp, 'plans.db')
+        os.environ['HISTORY_ARCHIVE_DIR'] = os.path.join(tmp, 'archive')
+        from database import db
+        from dataset_populator import populate
+
+        populate(db, args.users, workers=1)
+        with db.get_connection() as conn:
+            # Статистика для планировщика, как после PRAGMA optimize в продакшене
+            conn.execute('ANALYZE')
+            conn.commit()
+
+        if args.verbose:
+            with db.get_connection() as conn:
+                for name, statements in collect_queries(db).items():
+                    for sql in statements:
+                        print(f"{name}: {' '.join(sql.split())[:160]}")
+                        for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}').fetchall():
+                            print(f"    {row[-1]}")
+
+        report = check_query_plans(db)
+
+    if not report:
+        print(f"✅ Планы запросов в порядке: проверено методов {len(CALLS)}")
+        return 0
+    for name, problems in report.items():
+        print(f"❌ {name}")
+        for problem in problems:
+            print(f"    {problem}")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,194 @@
+"""
+Score percentiles for Space Shooter Bot
+Перцентили лучшего счета: "лучше, чем у X% игроков" и очки до следующей ступени
+
+Лучшие счета игроков раскладываются по корзинам с геометрически растущими
+границами (PERCENTILE_BUCKET_START, PERCENTILE_BUCKET_GROWTH): общая
+гистограмма по user_stats.best_score и по гистограмме на сложность по
+difficulty_best. Внутри корзины счет интерполируется линейно, поэтому
+погрешность перцентиля не больше доли игроков одной корзины.
+
+Гистограмма хранится в таблице score_histogram (сложность, нижняя граница
+корзины, игроков) и меняется в save_games в той же транзакции, что и рекорд:
+игрок переходит из корзины старого рекорда в корзину нового. В памяти к
+счетчикам держатся префиксные суммы и счета ступеней PERCENTILE_BRACKETS,
+они пересчитываются после коммита только для затронутых сложностей. Запрос
+перцентиля — поиск корзины и одна интерполяция, без обращений к БД.
+"""
+
+import logging
+import math
+import threading
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import (
+    DIFFICULTY_CODES, PAYLOAD_LIMITS, PERCENTILE_BRACKETS, PERCENTILE_BUCKET_GROWTH,
+    PERCENTILE_BUCKET_START
+)
+
+logger = logging.getLogger(__name__)
+
+# Код "все сложности" в score_histogram (в DIFFICULTY_CODES 0 — неизвестная сложность)
+OVERALL = 0
+
+UPSERT_HISTOGRAM = '''
+    INSERT INTO score_histogram (difficulty, floor, players)
+    VALUES (?, ?, ?)
+    ON CONFLICT(difficulty, floor) DO UPDATE SET players = players + excluded.players
+'''
+
+UPSERT_DIFFICULTY_BEST = '''
+    INSERT INTO difficulty_best (user_id, difficulty, best_score)
+    VALUES (?, ?, ?)
+    ON CONFLICT(user_id, difficulty) DO UPDATE SET best_score = excluded.best_score
+'''
+
+
+def bucket_edges(start: int = PERCENTILE_BUCKET_START, growth: float = PERCENTILE_BUCKET_GROWTH,
+                 max_score: int = PAYLOAD_LIMITS['score'][1]) -> List[int]:
+    """Границы корзин: [0, start), затем каждая шире на growth; последняя граница — max_score + 1"""
+    edges = [0]
+    edge = start
+    while edge <= max_score:
+        edges.append(edge)
+        edge = max(int(edge * growth), edge + 1)
+    edges.append(max_score + 1)
+    return edges
+
+
+class ScoreHistogram:
+    """Гистограммы лучшего счета: общая (OVERALL) и по кодам сложностей"""
+
+    def __init__(self, edges: List[int] = None):
+        self.edges = edges or bucket_edges()
+        self.floors = set(self.edges[:-1])
+        self._lock = threading.Lock()
+        # код -> игроков по корзинам
+        self._counts: Dict[int, List[int]] = {}
+        # код -> (префиксные суммы, всего игроков, [(ступень, счет)])
+        self._derived: Dict[int, Tuple[List[int], int, List[Tuple[int, int]]]] = {}
+
+    def bucket(self, score: int) -> int:
+        """Номер корзины счета"""
+        return min(max(bisect_right(self.edges, score) - 1, 0), len(self.edges) - 2)
+
+    def floor(self, score: int) -> int:
+        """Нижняя граница корзины счета (ключ в score_histogram)"""
+        return self.edges[self.bucket(score)]
+
+    # ===== ЗАГРУЗКА И ИЗМЕНЕНИЕ =====
+
+    def load(self, rows: Iterable[Tuple[int, int, int]]) -> bool:
+        """Загрузить строки score_histogram (сложность, граница, игроков)
+
+        Возвращает False, если границы корзин в таблице не совпадают с текущими
+        (изменены настройки) — тогда гистограмму нужно построить заново.
+        """
+        counts: Dict[int, List[int]] = {}
+        for code, floor, players in rows:
+            if floor not in self.floors:
+                return False
+            counts.setdefault(code, [0] * (len(self.edges) - 1))[self.bucket(floor)] = players
+        with self._lock:
+            self._counts = counts
+            self._derived = {code: self._derive(values) for code, values in counts.items()}
+        return True
+
+    def build(self, rows: Iterable[Tuple[int, int]]) -> List[Tuple[int, int, int]]:
+        """Построить гистограммы по (сложность, лучший счет); возвращает строки score_histogram"""
+        counts: Dict[int, List[int]] = {}
+        size = len(self.edges) - 1
+        for code, score in rows:
+            counts.setdefault(code, [0] * size)[self.bucket(score)] += 1
+        with self._lock:
+            self._counts = counts
+            self._derived = {code: self._derive(values) for code, values in counts.items()}
+        return [
+            (code, self.edges[i], players)
+            for code, values in counts.items()
+            for i, players in enumerate(values) if players
+        ]
+
+    def changes(self, moves: Iterable[Tuple[int, Optional[int], int]]) -> Dict[Tuple[int, int], int]:
+        """Изменения корзин по переходам (сложность, старый рекорд или None, новый рекорд)
+
+        Ключ — (сложность, нижняя граница корзины), значение — изменение числа игроков.
+        """
+        changes: Dict[Tuple[int, int], int] = {}
+        for code, old_best, new_best in moves:
+            new_floor = self.floor(new_best)
+            if old_best is not None:
+                old_floor = self.floor(old_best)
+                if old_floor == new_floor:
+                    continue
+                changes[(code, old_floor)] = changes.get((code, old_floor), 0) - 1
+            changes[(code, new_floor)] = changes.get((code, new_floor), 0) + 1
+        return {key: delta for key, delta in changes.items() if delta}
+
+    def apply(self, changes: Dict[Tuple[int, int], int]):
+        """Применить изменения корзин (после коммита транзакции save_games)"""
+        if not changes:
+            return
+        with self._lock:
+            touched = set()
+            for (code, floor), delta in changes.items():
+                values = self._counts.setdefault(code, [0] * (len(self.edges) - 1))
+                values[self.bucket(floor)] += delta
+                touched.add(code)
+            for code in touched:
+                self._derived[code] = self._derive(self._counts[code])
+
+    # ===== ЗАПРОСЫ =====
+
+    def _derive(self, counts: List[int]) -> Tuple[List[int], int, List[Tuple[int, int]]]:
+        """Префиксные суммы и счета ступеней по счетчикам корзин"""
+        below = [0]
+        for players in counts:
+            below.append(below[-1] + players)
+        total = below[-1]
+        thresholds = [
+            (bracket, self._score_at(below, counts, total * bracket / 100))
+            for bracket in PERCENTILE_BRACKETS
+        ] if total else []
+        return below, total, thresholds
+
+    def _score_at(self, below: List[int], counts: List[int], target: float) -> int:
+        """Наименьший счет, лучше которого target игроков (обратная интерполяция)"""
+        i = bisect_right(below, target) - 1
+        if i >= len(counts):
+            return self.edges[-1]
+        lo, hi = self.edges[i], self.edges[i + 1]
+        return math.ceil(lo + (target - below[i]) / counts[i] * (hi - lo))
+
+    def total(self, code: int = OVERALL) -> int:
+        """Игроков в гистограмме"""
+        derived = self._derived.get(code)
+        return derived[1] if derived else 0
+
+    def percentile(self, score: int, code: int = OVERALL) -> Optional[float]:
+        """Доля игроков (в %), чей лучший счет ниже score; None — гистограмма пуста"""
+        derived = self._derived.get(code)
+        if not derived or not derived[1]:
+            return None
+        below, total, _ = derived
+        i = self.bucket(score)
+        lo, hi = self.edges[i], self.edges[i + 1]
+        beaten = below[i] + (below[i + 1] - below[i]) * (min(max(score, lo), hi) - lo) / (hi - lo)
+        return round(min(beaten / total * 100, 100.0), 1)
+
+    def next_bracket(self, score: int, code: int = OVERALL) -> Optional[Tuple[int, int]]:
+        """Ближайшая ступень выше счета: (ступень, недостающие очки) или None"""
+        derived = self._derived.get(code)
+        if not derived or not derived[1]:
+            return None
+        percentile = self.percentile(score, code)
+        for bracket, threshold in derived[2]:
+            if percentile < bracket:
+                return bracket, max(threshold - score, 1)
+        return None
+
+
+def difficulty_code(difficulty: Optional[str]) -> int:
+    """Код гистограммы для сложности (OVERALL для None и неизвестной)"""
+    return DIFFICULTY_CODES.get(difficulty, OVERALL) if difficulty else OVERALL
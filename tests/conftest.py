@@ -0,0 +1,22 @@
+"""
+Общие настройки тестов
+database.db создается при импорте модуля, поэтому БД, архив истории и кэш
+аналитики направляются во временный каталог до любых импортов модулей бота.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TMP_DIR = tempfile.mkdtemp(prefix='space_shooter_tests_')
+os.environ['DATABASE_NAME'] = os.path.join(TMP_DIR, 'bot.db')
+os.environ['HISTORY_ARCHIVE_DIR'] = os.path.join(TMP_DIR, 'archive')
+os.environ['ANALYTICS_CACHE_DIR'] = os.path.join(TMP_DIR, 'analytics')
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(TMP_DIR, ignore_errors=True)
@@ -0,0 +1,107 @@
+"""Миграции схемы: обновление baseline-базы и базы старой версии бота до последней версии"""
+
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+from config import DIFFICULTY_CODES
+from migrations import MIGRATIONS, current_version, migrate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LATEST = MIGRATIONS[-1].version
+
+
+def tables(conn: sqlite3.Connection) -> set:
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def games_sql(conn: sqlite3.Connection) -> str:
+    return conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'games'").fetchone()[0]
+
+
+@pytest.fixture
+def baseline(tmp_path):
+    """База схемы версии 1 с данными в прежнем формате (строковые сложность и время)"""
+    conn = sqlite3.connect(tmp_path / 'baseline.db')
+    assert migrate(conn, target=1) == [1]
+    conn.executemany('INSERT INTO users (user_id, first_name) VALUES (?, ?)', [(1, 'A'), (2, 'B')])
+    conn.executemany('''
+        INSERT INTO games (user_id, score, level, difficulty, duration_seconds, enemies_killed,
+                           accuracy_percent, played_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        (1, 1500, 5, 'normal', 300, 40, 75.0, '2026-01-15 10:00:00'),
+        (1, 2500, 7, 'hard', 420, 60, 80.0, '2026-01-16 11:30:00'),
+        (2, 900, 3, 'easy', 200, 20, 60.0, '2026-02-01 09:15:00'),
+    ])
+    conn.executemany(
+        'INSERT INTO user_stats (user_id, best_score, games_played) VALUES (?, ?, ?)', [(1, 2500, 2), (2, 900, 1)]
+    )
+    conn.execute("INSERT INTO achievements (user_id, achievement_key) VALUES (1, 'first_blood')")
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_baseline_upgrades_to_latest(baseline):
+    applied = migrate(baseline)
+
+    assert applied == list(range(2, LATEST + 1))
+    assert current_version(baseline) == LATEST
+    assert baseline.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+    assert {'history_archives', 'quarantined_games', 'level_timing', 'difficulty_best',
+            'score_histogram'} <= tables(baseline)
+    assert 'schema_v2_progress' not in tables(baseline)
+
+
+def test_games_are_compacted_without_losing_rows(baseline):
+    migrate(baseline)
+
+    rows = baseline.execute('SELECT id, difficulty, played_at FROM games ORDER BY id').fetchall()
+    assert [row[0] for row in rows] == [1, 2, 3]
+    assert [row[1] for row in rows] == [DIFFICULTY_CODES[name] for name in ('normal', 'hard', 'easy')]
+    assert rows[0][2] == 1768471200  # 2026-01-15 10:00:00 UTC
+    assert 'AUTOINCREMENT' in games_sql(baseline).upper()
+    assert baseline.execute(
+        "SELECT seq FROM sqlite_sequence WHERE name = 'games'"
+    ).fetchone()[0] == 3
+    assert baseline.execute('SELECT achievement_key FROM achievements').fetchall() == [('first_blood',)]
+
+
+def test_difficulty_best_is_backfilled(baseline):
+    migrate(baseline)
+
+    best = dict(((user_id, code), score) for user_id, code, score in baseline.execute(
+        'SELECT user_id, difficulty, best_score FROM difficulty_best'
+    ))
+    assert best == {
+        (1, DIFFICULTY_CODES['normal']): 1500,
+        (1, DIFFICULTY_CODES['hard']): 2500,
+        (2, DIFFICULTY_CODES['easy']): 900,
+    }
+
+
+def test_migrate_is_idempotent(baseline):
+    migrate(baseline)
+
+    assert migrate(baseline) == []
+    assert current_version(baseline) == LATEST
+
+
+def test_shipped_legacy_database_upgrades(tmp_path):
+    """space_shooter.db из репозитория создан до schema_version"""
+    path = tmp_path / 'legacy.db'
+    shutil.copy(os.path.join(ROOT, 'space_shooter.db'), path)
+    conn = sqlite3.connect(path)
+    try:
+        users = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+        migrate(conn)
+
+        assert current_version(conn) == LATEST
+        assert conn.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+        assert conn.execute('SELECT COUNT(*) FROM users').fetchone()[0] == users
+        assert 'level_deltas' in {row[1] for row in conn.execute('PRAGMA table_info(games)')}
+    finally:
+        conn.close()
@@ -0,0 +1,47 @@
+"""Планы запросов Database: без полных сканирований и временных B-деревьев (см. query_plans.py)"""
+
+import pytest
+
+from query_plans import CALLS, check_query_plans
+
+
+@pytest.fixture(scope='module')
+def database():
+    from database import db
+    from dataset_populator import populate
+
+    populate(db, 2000, workers=1)
+    with db.get_connection() as conn:
+        # Статистика для планировщика, как после PRAGMA optimize в продакшене
+        conn.execute('ANALYZE')
+        conn.commit()
+    return db
+
+
+def test_every_public_method_is_checked(database):
+    report = check_query_plans(database)
+    missing = [name for name, problems in report.items() if name not in CALLS]
+    assert not missing, f"Методы без записи в CALLS: {', '.join(missing)}"
+
+
+def test_no_full_scans_or_temp_sorts(database):
+    report = check_query_plans(database)
+    assert not report, "\n".join(
+        f"{name}: {problem}" for name, problems in report.items() for problem in problems
+    )
+
+
+def test_missing_index_is_reported(tmp_path):
+    """Проверка ловит регрессию: без индексов games последние игры читаются полным проходом"""
+    from database import Database
+    from dataset_populator import populate
+
+    database = Database(str(tmp_path / 'no_index.db'))
+    populate(database, 200, workers=1)
+    with database.get_connection() as conn:
+        conn.execute('DROP INDEX idx_games_user_played')
+        conn.execute('DROP INDEX idx_games_played_at')
+        conn.commit()
+
+    report = check_query_plans(database)
+    assert any('SCAN games' in problem for problem in report.get('get_recent_games', []))
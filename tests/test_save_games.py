@@ -0,0 +1,35 @@
+"""Пакетное сохранение игр (save_games): ранговые достижения внутри одной пачки"""
+
+import pytest
+
+
+@pytest.fixture
+def database(tmp_path):
+    from database import Database
+
+    database = Database(str(tmp_path / 'games.db'))
+    for user_id in (1, 2, 3):
+        database.add_user(user_id, first_name=f'Player{user_id}')
+    return database
+
+
+def achievements_of(result) -> set:
+    return {achievement['name'] for achievement in result[1]['new_achievements']}
+
+
+def test_batch_ranks_players_against_earlier_results_in_batch(database):
+    from config import ACHIEVEMENTS
+
+    database.save_game(1, 5000, 5, 'normal')
+    second, third = database.save_games([
+        {'user_id': 2, 'score': 7000, 'level': 6, 'difficulty': 'normal'},
+        {'user_id': 3, 'score': 6000, 'level': 6, 'difficulty': 'normal'},
+    ])
+
+    assert database.get_user_rank(2) == 1
+    assert database.get_user_rank(3) == 2
+    assert ACHIEVEMENTS['champion']['name'] in achievements_of(second)
+    assert ACHIEVEMENTS['champion']['name'] not in achievements_of(third)
+    assert ACHIEVEMENTS['top_3']['name'] in achievements_of(third)
+    assert 'champion' not in database.get_user_achievements(3)
+
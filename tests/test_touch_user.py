@@ -0,0 +1,25 @@
+"""Отложенный last_seen (touch_user/flush_last_seen): строка, удаленная другим процессом, создается заново"""
+
+import sqlite3
+
+
+def test_touch_user_recreates_row_deleted_elsewhere(tmp_path):
+    from database import Database
+
+    path = str(tmp_path / 'games.db')
+    database = Database(path)
+    assert database.touch_user(1, first_name='Player1')
+    assert database.touch_user(1, first_name='Player1')
+
+    # Как cleanup_inactive_users: отдельное соединение, кэш процесса бота не знает об удалении
+    conn = sqlite3.connect(path)
+    conn.execute('DELETE FROM users WHERE user_id = 1')
+    conn.commit()
+    conn.close()
+
+    assert database.flush_last_seen() == 1
+    assert database.touch_user(1, first_name='Player1')
+
+    conn = sqlite3.connect(path)
+    assert conn.execute('SELECT first_name FROM users WHERE user_id = 1').fetchall() == [('Player1',)]
+    conn.close()
@@ -0,0 +1,128 @@
+"""
+Per-user update processor for Space Shooter Bot
+Параллельная обработка обновлений разных игроков с сохранением порядка для одного игрока
+"""
+
+import logging
+from asyncio import Lock
+from typing import Any, Awaitable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from config import MAX_CONCURRENT_UPDATES
+
+logger = logging.getLogger(__name__)
+
+
+class _UserLane:
+    """Очередь обновлений одного пользователя"""
+
+    __slots__ = ('lock', 'depth')
+
+    def __init__(self):
+        self.lock = Lock()
+        self.depth = 0
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Обновления разных пользователей обрабатываются параллельно (не более
+    max_concurrent_updates одновременно), а обновления одного
+    effective_user.id — строго по очереди в порядке поступления.
+
+    Очередь пользователя ждет своей очереди до захвата общего семафора,
+    поэтому ожидающие обновления не занимают слоты параллельности.
+    """
+
+    def __init__(self, max_concurrent_updates: int = MAX_CONCURRENT_UPDATES):
+        super().__init__(max_concurrent_updates)
+        self._lanes: Dict[int, _UserLane] = {}
+        self.processed = 0
+        self.serialized = 0
+        self.peak_user_depth = 0
+
+    @staticmethod
+    def _user_id(update: object) -> Optional[int]:
+        if isinstance(update, Update) and update.effective_user:
+            return update.effective_user.id
+        return None
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        user_id = self._user_id(update)
+        if user_id is None:
+            await super().process_update(update, coroutine)
+            self.processed += 1
+            return
+
+        lane = self._lanes.get(user_id)
+        if lane is None:
+            lane = self._lanes[user_id] = _UserLane()
+        lane.depth += 1
+        if lane.depth > 1:
+            self.serialized += 1
+        self.peak_user_depth = max(self.peak_user_depth, lane.depth)
+
+        try:
+            # asyncio.Lock будит ожидающих в порядке FIFO, а задачи обновлений
+            # создаются в порядке получения — так сохраняется порядок игрока
+            async with lane.lock:
+                await super().process_update(update, coroutine)
+        finally:
+            lane.depth -= 1
+            if lane.depth == 0:
+                del self._lanes[user_id]
+            self.processed += 1
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        logger.info(
+            f"✅ Обработка обновлений: до {self.max_concurrent_updates} параллельно, "
+            f"последовательно для одного игрока"
+        )
+
+    async def shutdown(self) -> None:
+        logger.info(
+            f"✅ Обработчик обновлений остановлен: обработано {self.processed}, "
+            f"ждали своей очереди {self.serialized}, пиковая очередь игрока {self.peak_user_depth}"
+        )
+
+    # ===== МЕТРИКИ =====
+
+    def user_queue_depth(self, user_id: int) -> int:
+        """Обновления пользователя в работе и в ожидании"""
+        lane = self._lanes.get(user_id)
+        return lane.depth if lane else 0
+
+    def queue_depths(self, limit: int = 10) -> Dict[int, int]:
+        """Пользователи с самыми длинными очередями"""
+        lanes = sorted(self._lanes.items(), key=lambda item: item[1].depth, reverse=True)
+        return {user_id: lane.depth for user_id, lane in lanes[:limit]}
+
+    def metrics(self) -> Dict:
+        """Сводка по очередям и параллельности"""
+        waiting = sum(lane.depth - 1 for lane in self._lanes.values())
+        return {
+            'active': self.current_concurrent_updates,
+            'max_concurrent': self.max_concurrent_updates,
+            'active_users': len(self._lanes),
+            'waiting': waiting,
+            'max_user_depth': max((lane.depth for lane in self._lanes.values()), default=0),
+            'peak_user_depth': self.peak_user_depth,
+            'processed': self.processed,
+            'serialized': self.serialized,
+        }
+
+    def collect_metrics(self):
+        """Сэмплы для metrics.add_collector"""
+        current = self.metrics()
+        return [
+            ('bot_updates_active', 'gauge', 'Обновления в обработке', [({}, current['active'])]),
+            ('bot_updates_waiting', 'gauge', 'Обновления в очередях игроков', [({}, current['waiting'])]),
+            ('bot_user_queue_depth_max', 'gauge', 'Самая длинная очередь игрока',
+             [({}, current['max_user_depth'])]),
+            ('bot_updates_processed_total', 'counter', 'Обработано обновлений', [({}, current['processed'])]),
+            ('bot_updates_serialized_total', 'counter', 'Обновления, ждавшие предыдущее обновление игрока',
+             [({}, current['serialized'])]),
+        ]
@@ -0,0 +1,134 @@
+"""
+Web App payloads for Space Shooter Bot
+Разбор данных из Web App: один json.loads, типизированные GameResult и Suggestion
+
+Данные web_app_data приходят от клиента и ничем не гарантированы, поэтому
+каждое поле приводится к своему типу и обрезается до диапазона из
+PAYLOAD_LIMITS, а сложность и категория проверяются по белым спискам
+(DIFFICULTIES, SUGGESTION_CATEGORIES). Значения, которые нельзя привести,
+заменяются значениями по умолчанию. Для честного клиента (числа уже int)
+проверка сводится к сравнению с границами.
+"""
+
+import json
+import math
+from dataclasses import dataclass
+from typing import Tuple, Union
+
+from config import (
+    DIFFICULTIES, PAYLOAD_LIMITS, PAYLOAD_MAX_BYTES, PAYLOAD_MAX_LEVEL_DELTAS,
+    SUGGESTION_CATEGORIES
+)
+
+DEFAULT_DIFFICULTY = 'normal'
+DEFAULT_CATEGORY = 'general'
+
+
+class PayloadError(ValueError):
+    """Данные из Web App нельзя разобрать"""
+    pass
+
+
+def _int(value, default: int, low: int, high: int) -> int:
+    """Целое в [low, high]; нечисловое значение — default"""
+    if type(value) is not int:
+        try:
+            # "12", 12.7, True; NaN и бесконечность — ValueError/OverflowError
+            value = int(float(value))
+        except (TypeError, ValueError, OverflowError):
+            return default
+    return low if value < low else high if value > high else value
+
+
+def _float(value, default: float, low: float, high: float) -> float:
+    """Число в [low, high]; нечисловое значение, NaN и бесконечность — default"""
+    if type(value) is not float:
+        try:
+            value = float(value)
+        except (TypeError, ValueError, OverflowError):
+            return default
+    if not math.isfinite(value):
+        return default
+    return low if value < low else high if value > high else value
+
+
+def _deltas(value) -> Tuple[int, ...]:
+    """Секунды между уровнями (не больше PAYLOAD_MAX_LEVEL_DELTAS значений)"""
+    if not isinstance(value, list):
+        return ()
+    value = value[:PAYLOAD_MAX_LEVEL_DELTAS]
+    low, high = PAYLOAD_LIMITS['level_delta']
+    # Честный клиент присылает целые в диапазоне: без поэлементного приведения
+    for item in value:
+        if type(item) is not int or not low <= item <= high:
+            return tuple(_int(item, 0, low, high) for item in value)
+    return tuple(value)
+
+
+@dataclass(slots=True)
+class GameResult:
+    """Результат игры из game-code.js (tg.sendData)"""
+    score: int = 0
+    level: int = 1
+    difficulty: str = DEFAULT_DIFFICULTY
+    duration_seconds: int = 0
+    enemies_killed: int = 0
+    accuracy_percent: float = 0.0
+    bosses_killed: int = 0
+    level_deltas: Tuple[int, ...] = ()
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'GameResult':
+        difficulty = data.get('difficulty')
+        # Проверка типа до поиска в словаре: список или объект не хешируются
+        if type(difficulty) is not str or difficulty not in DIFFICULTIES:
+            difficulty = DEFAULT_DIFFICULTY
+        get = data.get
+        return cls(
+            _int(get('score'), 0, *PAYLOAD_LIMITS['score']),
+            _int(get('level'), 1, *PAYLOAD_LIMITS['level']),
+            difficulty,
+            _int(get('duration_seconds'), 0, *PAYLOAD_LIMITS['duration_seconds']),
+            _int(get('enemies_killed'), 0, *PAYLOAD_LIMITS['enemies_killed']),
+            _float(get('accuracy_percent'), 0.0, *PAYLOAD_LIMITS['accuracy_percent']),
+            _int(get('bosses_killed'), 0, *PAYLOAD_LIMITS['bosses_killed']),
+            _deltas(get('level_deltas')),
+        )
+
+    @property
+    def avg_level_time(self) -> float:
+        """Среднее время на уровень, секунд (0 — нет данных)"""
+        if not self.level_deltas:
+            return 0
+        return round(sum(self.level_deltas) / len(self.level_deltas), 1)
+
+
+@dataclass(slots=True)
+class Suggestion:
+    """Предложение по игре из формы в Web App"""
+    text: str = ''
+    category: str = DEFAULT_CATEGORY
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Suggestion':
+        text = data.get('text')
+        category = data.get('category')
+        return cls(
+            text.strip() if isinstance(text, str) else '',
+            category if type(category) is str and category in SUGGESTION_CATEGORIES else DEFAULT_CATEGORY,
+        )
+
+
+def parse_payload(raw: str) -> Union[GameResult, Suggestion]:
+    """Разобрать web_app_data.data (единственный json.loads на обновление)"""
+    if len(raw) > PAYLOAD_MAX_BYTES:
+        raise PayloadError(f"слишком длинные данные: {len(raw)} символов")
+    try:
+        data = json.loads(raw)
+    except (json.JSONDecodeError, RecursionError) as e:
+        raise PayloadError(f"не JSON: {e}") from e
+    if not isinstance(data, dict):
+        raise PayloadError(f"ожидался объект JSON, получен {type(data).__name__}")
+    if data.get('type') == 'suggestion':
+        return Suggestion.from_dict(data)
+    return GameResult.from_dict(data)
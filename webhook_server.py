@@ -0,0 +1,190 @@
+"""
+Embedded webhook server for Space Shooter Bot
+Минимальный HTTP-сервер на asyncio: принимает обновления Telegram и передает их Application
+"""
+
+import asyncio
+import hmac
+import json
+import logging
+from typing import Optional, Tuple
+
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+MAX_HEADER_LINES = 100
+
+_REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    403: 'Forbidden',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+}
+
+
+class WebhookServer:
+    """HTTP/1.1 сервер для вебхука Telegram
+
+    Проверяет путь и заголовок X-Telegram-Bot-Api-Secret-Token (обязателен:
+    без него любой, кто достучится до порта, подделает Update), разбирает
+    тело в Update и кладет его в application.update_queue, откуда его
+    забирают обычные обработчики.
+    """
+
+    def __init__(self, application: Application, path: str, secret_token: str,
+                 host: str = '0.0.0.0', port: int = 8443, max_body_bytes: int = 1024 * 1024):
+        self.application = application
+        self.path = path
+        self.secret_token = secret_token
+        self.host = host
+        self.port = port
+        self.max_body_bytes = max_body_bytes
+        self.updates_received = 0
+        self._server: Optional[asyncio.base_events.Server] = None
+
+    async def start(self):
+        """Начать прием соединений"""
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        # При port=0 ОС выбирает свободный порт
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"✅ Вебхук-сервер слушает {self.host}:{self.port}{self.path}")
+
+    async def stop(self):
+        """Перестать принимать соединения"""
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            logger.info("✅ Вебхук-сервер остановлен")
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            # Соединения keep-alive: обрабатываем запросы, пока клиент не закроет сокет
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                status, keep_alive = await self._process(*request)
+                self._write_response(writer, status, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.error(f"❌ Ошибка вебхук-соединения: {e}", exc_info=True)
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple]:
+        """Прочитать запрос: (метод, путь, заголовки, тело)"""
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, path, _ = request_line.decode('latin-1').split(' ', 2)
+        except ValueError:
+            return 'BAD', '', {}, b''
+
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            return 'BAD', path, headers, b''
+        if length < 0:
+            return 'BAD', path, headers, b''
+        if length > self.max_body_bytes:
+            return 'TOO_LARGE', path, headers, b''
+        body = await reader.readexactly(length) if length else b''
+        return method, path, headers, body
+
+    async def _process(self, method: str, path: str, headers: dict, body: bytes) -> Tuple[int, bool]:
+        """Обработать запрос и вернуть (HTTP-статус, keep-alive)"""
+        keep_alive = headers.get('connection', '').lower() != 'close'
+        if method == 'BAD':
+            return 400, False
+        if method == 'TOO_LARGE':
+            return 413, False
+        if path.split('?', 1)[0] != self.path:
+            return 404, keep_alive
+        if method != 'POST':
+            return 405, keep_alive
+        # Пустой секрет на сервере не пропускает ничего (validate_config требует его в режиме webhook)
+        token = headers.get(SECRET_HEADER, '')
+        if not token or not self.secret_token or not hmac.compare_digest(
+            token.encode('latin-1'), self.secret_token.encode('utf-8')
+        ):
+            logger.warning("⚠️ Вебхук: отсутствует или неверный секретный токен")
+            return 403, keep_alive
+
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except Exception as e:
+            logger.warning(f"⚠️ Вебхук: некорректное обновление: {e}")
+            return 400, keep_alive
+
+        await self.application.update_queue.put(update)
+        self.updates_received += 1
+        return 200, keep_alive
+
+    @staticmethod
+    def _write_response(writer: asyncio.StreamWriter, status: int, keep_alive: bool):
+        writer.write(
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            f"Content-Length: 0\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1')
+        )
+
+
+async def run_webhook(application: Application, webhook_url: str, path: str,
+                      secret_token: str, host: str, port: int,
+                      allowed_updates: list) -> None:
+    """Запустить бота в режиме вебхука до получения сигнала остановки"""
+    import signal
+
+    if not secret_token:
+        raise ValueError("Режим webhook требует WEBHOOK_SECRET_TOKEN")
+
+    server = WebhookServer(application, path, secret_token, host, port)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+
+    async with application:
+        # Application.run_* вызывают эти хуки сами; при ручном запуске — мы
+        if application.post_init:
+            await application.post_init(application)
+
+        await application.bot.set_webhook(
+            url=webhook_url,
+            allowed_updates=allowed_updates,
+            secret_token=secret_token,
+            drop_pending_updates=True
+        )
+        await application.start()
+        await server.start()
+        logger.info(f"🌐 Вебхук установлен: {webhook_url}")
+
+        try:
+            await stop_event.wait()
+        finally:
+            await server.stop()
+            await application.stop()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
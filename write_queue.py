@@ -0,0 +1,103 @@
+"""
+Write-behind game queue for Space Shooter Bot
+Пакетная запись результатов игр: одна транзакция на N игр или M миллисекунд
+"""
+
+import asyncio
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from async_database import AsyncDatabase
+from config import DB_WRITE_QUEUE_SIZE, DB_BATCH_MAX_ROWS, DB_BATCH_FLUSH_MS
+
+logger = logging.getLogger(__name__)
+
+
+class GameWriteQueue:
+    """Очередь результатов игр с единственным писателем
+
+    Обработчик кладет игру в ограниченную очередь и ждет future, а фоновая
+    задача собирает пачку и сохраняет её через AsyncDatabase.save_games.
+    """
+
+    def __init__(self, database: AsyncDatabase, max_size: int = DB_WRITE_QUEUE_SIZE,
+                 max_rows: int = DB_BATCH_MAX_ROWS, flush_ms: int = DB_BATCH_FLUSH_MS):
+        self.database = database
+        self.max_rows = max_rows
+        self.flush_delay = flush_ms / 1000
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """Запустить фоновую задачу записи"""
+        if not self.running:
+            self._task = asyncio.create_task(self._run(), name="game-write-queue")
+            logger.info(
+                f"✅ Очередь записи игр запущена: до {self.max_rows} игр / {self.flush_delay * 1000:.0f} мс"
+            )
+
+    async def stop(self):
+        """Дописать оставшиеся игры и остановить задачу"""
+        if not self.running:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        logger.info("✅ Очередь записи игр остановлена")
+
+    async def submit(self, user_id: int, score: int, level: int, difficulty: str,
+                     duration_seconds: int = 0, enemies_killed: int = 0,
+                     accuracy_percent: float = 0.0, bosses_killed: int = 0,
+                     level_deltas: Sequence[int] = ()) -> Tuple[bool, Dict]:
+        """Поставить игру в очередь и дождаться результата сохранения"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(({
+            'user_id': user_id,
+            'score': score,
+            'level': level,
+            'difficulty': difficulty,
+            'duration_seconds': duration_seconds,
+            'enemies_killed': enemies_killed,
+            'accuracy_percent': accuracy_percent,
+            'bosses_killed': bosses_killed,
+            'level_deltas': level_deltas
+        }, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[Dict, asyncio.Future]]:
+        """Собрать пачку: ждем первую игру, затем добираем до лимита или таймаута"""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.flush_delay
+
+        while len(batch) < self.max_rows:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            try:
+                results = await self.database.save_games([game for game, _ in batch])
+            except Exception as e:
+                logger.error(f"❌ Ошибка записи пачки игр: {e}", exc_info=True)
+                results = [(False, {})] * len(batch)
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+                self._queue.task_done()